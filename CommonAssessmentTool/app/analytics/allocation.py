@@ -0,0 +1,547 @@
+"""
+Caseload-wide intervention allocation under per-service capacity limits.
+
+Every client has a predicted success rate for each of the 128 intervention
+plans; the gain of a plan is its prediction minus the no-intervention
+baseline. Each intervention has a limited number of program slots, and a
+plan uses one slot of every intervention it includes. The allocator assigns
+at most one plan per client so that the total gain is as large as possible
+without exceeding any capacity.
+
+Plans are handled as bit masks (bit i for intervention i, as in
+intervention_search), so the set of plans a client can still take is one
+vectorized AND against the mask of exhausted services.
+
+The solve runs in three phases:
+
+1. Greedy: a max-heap holds each client's best feasible plan. The largest
+   gain is popped and assigned when its services still have room; otherwise
+   the client's best plan under the current capacities is recomputed and
+   pushed back. Capacities only shrink, so a stale entry is an upper bound
+   and lazy re-evaluation gives the exact greedy order.
+2. Lagrangian relaxation: plain greedy overspends scarce services on plans
+   that use several of them. Subgradient steps on the LP relaxation's dual
+   put a price on every limited service; greedy is rerun on gains net of
+   those prices and the better of the two assignments is kept. The dual
+   also gives an upper bound on the best achievable total gain.
+3. Local search: clients switch to a better plan that fits in the spare
+   capacity plus their own slots, and clients holding a slot of a saturated
+   service hand it to a client that gains more from it. Every applied move
+   strictly increases the total gain.
+"""
+
+import heapq
+import time
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+from numpy.typing import ArrayLike
+
+from app.clients.service.client_repository import IClientRepository
+from app.clients.service.columnar_preprocessing import encode_frame
+from app.clients.service.logic import (
+    COLUMN_INTERVENTIONS,
+    intervention_permutations,
+    intervention_row_to_names,
+    resolve_serving_model,
+    score_batch,
+)
+
+# Rows per vectorized pass, bounding the (rows, plans) temporaries.
+BLOCK_ROWS = 65_536
+# Smallest improvement a local search move must bring, to avoid cycling on
+# floating point noise.
+MIN_IMPROVEMENT = 1e-6
+
+
+def plan_masks(plans: np.ndarray) -> np.ndarray:
+    """
+    Bit mask of every plan's interventions.
+
+    Args:
+        plans (np.array): 0/1 matrix of shape (plans, interventions)
+
+    Returns:
+        np.array: int64 masks with bit i set when intervention i is used
+    """
+    weights = np.left_shift(1, np.arange(plans.shape[1], dtype=np.int64))
+    return np.asarray(plans, dtype=np.int64) @ weights
+
+
+def best_plans(
+    gains: np.ndarray,
+    masks: np.ndarray,
+    blocked: Optional[np.ndarray],
+    required: int = 0,
+    penalty: Optional[np.ndarray] = None,
+):
+    """
+    Best plan per client among the plans avoiding its blocked services.
+
+    Args:
+        gains (np.array): Gains of shape (n, plans)
+        masks (np.array): Plan masks of shape (plans,)
+        blocked (np.array): Per client, mask of services it cannot use,
+            None when every plan is open to every client
+        required (int): Mask of services every candidate plan must include
+        penalty (np.array): Per plan, amount subtracted from its gain
+
+    Returns:
+        tuple: Best plan index and its (penalized) gain per client; the gain
+            is -inf when no plan is feasible
+    """
+    allowed = (masks & required) == required
+    plans = np.empty(len(gains), dtype=np.intp)
+    dtype = gains.dtype if penalty is None else np.result_type(gains, penalty)
+    values = np.empty(len(gains), dtype=dtype)
+    for start in range(0, len(gains), BLOCK_ROWS):
+        rows = slice(start, start + BLOCK_ROWS)
+        scores = gains[rows] if penalty is None else gains[rows] - penalty
+        if blocked is not None or required:
+            feasible = allowed
+            if blocked is not None:
+                feasible = ((masks & blocked[rows, np.newaxis]) == 0) & allowed
+            scores = np.where(feasible, scores, -np.inf)
+        plans[rows] = scores.argmax(axis=1)
+        values[rows] = np.take_along_axis(scores, plans[rows, np.newaxis], 1)[:, 0]
+    return plans, values
+
+
+def dual_prices(
+    gains: np.ndarray,
+    plans: np.ndarray,
+    capacities: ArrayLike,
+    lower_bound: float,
+    iterations: int = 30,
+):
+    """
+    Prices of the capacity constraints from the Lagrangian dual.
+
+    For prices p >= 0 every client independently takes the plan maximizing
+    its gain minus the price of the services used; that total plus p times
+    the capacities bounds the optimum from above. Prices move along the
+    subgradient (slots demanded minus capacity) with Polyak step sizes
+    towards lower_bound, a known feasible total gain.
+
+    Args:
+        gains (np.array): Predicted gain of every plan per client
+        plans (np.array): 0/1 matrix of shape (plans, interventions)
+        capacities (list): Slots per intervention, np.inf for unlimited
+        lower_bound (float): Total gain of a feasible assignment
+        iterations (int): Most subgradient steps
+
+    Returns:
+        tuple: Prices per service and the upper bound they give
+    """
+    flags = np.asarray(plans, dtype=np.float64)
+    masks = plan_masks(plans)
+    capacities = np.asarray(capacities, dtype=np.float64)
+    limited = np.isfinite(capacities)
+    limits = np.where(limited, capacities, 0)
+    prices = np.zeros(len(capacities))
+    best_prices, best_bound = prices, np.inf
+    step, stalled = 1.0, 0
+    for _ in range(iterations):
+        penalty = (flags @ prices).astype(gains.dtype)
+        chosen, values = best_plans(gains, masks, None, penalty=penalty)
+        bound = float(values.sum() + prices @ limits)
+        if bound < best_bound:
+            best_prices, best_bound, stalled = prices, bound, 0
+        else:
+            stalled += 1
+            if stalled == 3:
+                step, stalled = step / 2, 0
+        demand = np.bincount(chosen, minlength=len(flags)) @ flags
+        direction = np.where(limited, demand - limits, 0)
+        direction[(prices <= 0) & (direction < 0)] = 0
+        norm = float(direction @ direction)
+        if norm == 0:
+            # The relaxed choice fits every capacity, so the bound is tight.
+            break
+        scale = step * max(bound - lower_bound, 0) / norm
+        prices = np.maximum(prices + scale * direction, 0)
+    return best_prices, best_bound
+
+
+class CapacityAllocator:
+    """
+    Assignment of plans to clients under per-service capacities.
+    """
+
+    def __init__(
+        self, gains: np.ndarray, plans: np.ndarray, capacities: Sequence[float]
+    ):
+        """
+        Args:
+            gains (np.array): Predicted gain of every plan per client, shape
+                (n, plans); the plan without interventions must gain 0
+            plans (np.array): 0/1 matrix of shape (plans, interventions)
+            capacities (list): Slots per intervention, np.inf for unlimited
+        """
+        self.gains = gains
+        self.flags = np.asarray(plans, dtype=np.float64)
+        self.masks = plan_masks(plans)
+        self.capacities = np.asarray(capacities, dtype=np.float64)
+        self.remaining = self.capacities.copy()
+        self.empty_plan = int(np.flatnonzero(self.masks == 0)[0])
+        self.assignment = np.full(len(gains), self.empty_plan, dtype=np.intp)
+        self.current = np.zeros(len(gains), dtype=np.float64)
+        self.moves = {"greedy": 0, "reassign": 0, "exchange": 0}
+        self._candidate_cache: Dict[tuple, np.ndarray] = {}
+
+    def exhausted(self) -> int:
+        """Mask of services without a free slot"""
+        bits = np.flatnonzero(self.remaining < 1)
+        return int(np.bitwise_or.reduce(np.left_shift(1, bits))) if len(bits) else 0
+
+    @property
+    def total_gain(self) -> float:
+        return float(self.current.sum())
+
+    def _assign(self, client: int, plan: int) -> None:
+        self.remaining += self.flags[self.assignment[client]] - self.flags[plan]
+        self.assignment[client] = plan
+        self.current[client] = self.gains[client, plan]
+
+    def _fits(self, client: int, plan: int) -> bool:
+        """Whether the plan fits in the spare slots plus the client's own"""
+        spare = self.remaining + self.flags[self.assignment[client]]
+        return bool((spare[self.flags[plan] > 0] >= 1).all())
+
+    def _candidates(self, blocked: int, required: int) -> np.ndarray:
+        """Indices of plans avoiding blocked and including required"""
+        key = (blocked, required)
+        if key not in self._candidate_cache:
+            self._candidate_cache[key] = np.flatnonzero(
+                ((self.masks & blocked) == 0) & ((self.masks & required) == required)
+            )
+        return self._candidate_cache[key]
+
+    def _best_plan(self, client: int, blocked: int, required: int = 0, penalty=None):
+        """Single-client best_plans, on the cached candidate plans"""
+        candidates = self._candidates(blocked, required)
+        if not len(candidates):
+            return self.empty_plan, -np.inf
+        scores = self.gains[client, candidates]
+        if penalty is not None:
+            scores = scores - penalty[candidates]
+        best = int(scores.argmax())
+        return int(candidates[best]), float(scores[best])
+
+    def reset(self) -> None:
+        """Unassign every client"""
+        self.remaining = self.capacities.copy()
+        self.assignment[:] = self.empty_plan
+        self.current[:] = 0
+
+    def greedy(self, prices: Optional[np.ndarray] = None) -> None:
+        """
+        Assign plans to unassigned clients, largest gain first.
+
+        Args:
+            prices (np.array): Price per service slot subtracted from the
+                gains when choosing and ranking plans, None for none
+        """
+        penalty = None if prices is None else self.flags @ prices
+        blocked = self.exhausted()
+        clients = np.flatnonzero(self.assignment == self.empty_plan)
+        plans, values = best_plans(
+            self.gains[clients],
+            self.masks,
+            np.full(len(clients), blocked),
+            penalty=penalty,
+        )
+        positive = values > 0
+        heap = list(
+            zip(
+                (-values[positive]).tolist(),
+                clients[positive].tolist(),
+                plans[positive].tolist(),
+            )
+        )
+        heapq.heapify(heap)
+        while heap:
+            _, client, plan = heapq.heappop(heap)
+            if self.masks[plan] & blocked:
+                plan, value = self._best_plan(client, blocked, penalty=penalty)
+                if value > 0:
+                    heapq.heappush(heap, (-value, client, plan))
+                continue
+            self._assign(client, plan)
+            self.moves["greedy"] += 1
+            blocked = self.exhausted()
+
+    def reassign(self) -> int:
+        """
+        Move clients to better plans that fit in the spare capacity plus
+        their own slots.
+
+        Returns:
+            int: Number of clients moved
+        """
+        own = self.masks[self.assignment]
+        plans, values = best_plans(self.gains, self.masks, self.exhausted() & ~own)
+        improvement = values - self.current
+        candidates = np.flatnonzero(improvement > MIN_IMPROVEMENT)
+        moved = 0
+        for client in candidates[np.argsort(-improvement[candidates])].tolist():
+            if self._fits(client, plans[client]):
+                self._assign(client, plans[client])
+                moved += 1
+        self.moves["reassign"] += moved
+        return moved
+
+    def exchange(self, service: int) -> int:
+        """
+        Hand slots of a saturated service from the clients who lose least by
+        giving them up to the clients who gain most by taking them.
+
+        Args:
+            service (int): Index of a service without free slots
+
+        Returns:
+            int: Number of slots handed over
+        """
+        bit = 1 << service
+        exhausted = self.exhausted()
+        own = self.masks[self.assignment]
+        holders = np.flatnonzero(own & bit)
+        others = np.flatnonzero((own & bit) == 0)
+        _, fallback = best_plans(
+            self.gains[holders], self.masks, (exhausted & ~own[holders]) | bit
+        )
+        _, taken = best_plans(
+            self.gains[others], self.masks, exhausted & ~own[others] & ~bit, bit
+        )
+        losses = self.current[holders] - fallback
+        wins = taken - self.current[others]
+        by_loss, by_win = np.argsort(losses), np.argsort(-wins)
+        holders, losses = holders[by_loss], losses[by_loss]
+        others, wins = others[by_win], wins[by_win]
+
+        handed = 0
+        for giver, taker, win, loss in zip(
+            holders.tolist(), others.tolist(), wins.tolist(), losses.tolist()
+        ):
+            if win - loss <= MIN_IMPROVEMENT:
+                break
+            before = (self.assignment[giver], self.assignment[taker])
+            total = self.current[giver] + self.current[taker]
+            exhausted = self.exhausted()
+            giver_plan, _ = self._best_plan(
+                giver, (exhausted & ~self.masks[before[0]]) | bit
+            )
+            if not self._fits(giver, giver_plan):
+                continue
+            self._assign(giver, giver_plan)
+            exhausted = self.exhausted()
+            taker_plan, _ = self._best_plan(
+                taker, exhausted & ~self.masks[before[1]], bit
+            )
+            if (
+                self._fits(taker, taker_plan)
+                and self.gains[taker, taker_plan] + self.current[giver]
+                > total + MIN_IMPROVEMENT
+            ):
+                self._assign(taker, taker_plan)
+                handed += 1
+            else:
+                self._assign(giver, before[0])
+        self.moves["exchange"] += handed
+        return handed
+
+    def solve(self, max_passes: int = 3, price_iterations: int = 30) -> Dict[str, Any]:
+        """
+        Run greedy with and without dual prices, then local search passes
+        on the better assignment until none improves.
+
+        Args:
+            max_passes (int): Most local search passes
+            price_iterations (int): Most subgradient steps for the prices,
+                0 to skip the priced greedy
+
+        Returns:
+            dict: Total gain after each phase, the dual upper bound, passes
+                run, moves per kind and timings in seconds
+        """
+        started = time.perf_counter()
+        self.greedy()
+        greedy_gain = priced_gain = self.total_gain
+        greedy_seconds = time.perf_counter() - started
+        bound = float(np.maximum(self.gains.max(axis=1), 0).sum())
+        if price_iterations and np.isfinite(self.capacities).any():
+            prices, dual_bound = dual_prices(
+                self.gains, self.flags, self.capacities, greedy_gain, price_iterations
+            )
+            bound = min(bound, dual_bound)
+            plain = self.assignment.copy()
+            self.reset()
+            self.greedy(prices)
+            # Slots the prices left unused go to the best remaining gains.
+            self.greedy()
+            priced_gain = self.total_gain
+            if priced_gain < greedy_gain:
+                self.reset()
+                for client in np.flatnonzero(plain != self.empty_plan).tolist():
+                    self._assign(client, plain[client])
+        pricing_seconds = time.perf_counter() - started - greedy_seconds
+        passes = 0
+        while passes < max_passes:
+            passes += 1
+            changed = self.reassign()
+            saturated = np.flatnonzero(self.remaining < 1)
+            for service in saturated.tolist():
+                changed += self.exchange(service)
+            if changed:
+                # Exchanges can free slots elsewhere for unassigned clients.
+                self.greedy()
+            else:
+                break
+        return {
+            "greedy_gain": greedy_gain,
+            "priced_gain": priced_gain,
+            "total_gain": self.total_gain,
+            "upper_bound": bound,
+            "passes": passes,
+            "moves": dict(self.moves),
+            "greedy_seconds": greedy_seconds,
+            "pricing_seconds": pricing_seconds,
+            "solve_seconds": time.perf_counter() - started,
+        }
+
+
+def allocate(
+    gains: np.ndarray,
+    plans: np.ndarray,
+    capacities: Sequence[float],
+    max_passes: int = 3,
+    price_iterations: int = 30,
+) -> Dict[str, Any]:
+    """
+    Allocate plans to clients to maximize total gain within capacities.
+
+    Args:
+        gains (np.array): Predicted gain of every plan per client, shape
+            (n, plans)
+        plans (np.array): 0/1 matrix of shape (plans, interventions)
+        capacities (list): Slots per intervention, np.inf for unlimited
+        max_passes (int): Most local search passes
+        price_iterations (int): Most subgradient steps for the dual prices
+
+    Returns:
+        dict: "assignment" (plan index per client), "used" slots per
+            service and the solve statistics of CapacityAllocator.solve
+    """
+    allocator = CapacityAllocator(gains, plans, capacities)
+    stats = allocator.solve(max_passes, price_iterations)
+    return {
+        "assignment": allocator.assignment,
+        "used": allocator.flags[allocator.assignment].sum(axis=0),
+        **stats,
+    }
+
+
+def capacity_vector(
+    names: Sequence[str], capacities: Optional[Mapping[str, float]]
+) -> List[float]:
+    """
+    Order capacities like names, unlimited for names without a limit.
+
+    Raises:
+        ValueError: On capacities for unknown interventions
+    """
+    capacities = capacities or {}
+    unknown = sorted(set(capacities) - set(names))
+    if unknown:
+        raise ValueError(f"Unknown intervention(s): {', '.join(unknown)}")
+    return [float(capacities.get(name, np.inf)) for name in names]
+
+
+def caseload_gains(
+    repo: IClientRepository, chunk_size: int, engine: Optional[str] = None
+):
+    """
+    Score every client with complete features and keep its plan gains.
+
+    Args:
+        repo: Client repository to read features from
+        chunk_size (int): Clients scored per model call
+        engine (str): Prediction engine, see score_batch
+
+    Returns:
+        tuple: Client ids (n,), float32 gains of shape (n, 128) ordered like
+            intervention_permutations, and the number of skipped clients
+    """
+    ids, gains, skipped = [], [], 0
+    for frame in repo.iter_feature_chunks(chunk_size):
+        complete = frame.dropna()
+        skipped += len(frame) - len(complete)
+        if complete.empty:
+            continue
+        baseline, predictions = score_batch(encode_frame(complete), engine)
+        ids.append(complete["id"].to_numpy())
+        gains.append((predictions - baseline[:, np.newaxis]).astype(np.float32))
+    if not ids:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), np.float32), skipped
+    return np.concatenate(ids), np.concatenate(gains), skipped
+
+
+def allocate_caseload(
+    repo: IClientRepository,
+    capacities: Optional[Mapping[str, float]],
+    chunk_size: int,
+    max_passes: int = 3,
+    engine: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Allocate intervention plans across all clients within service capacities.
+
+    Args:
+        repo: Client repository to read features from
+        capacities (dict): Slots per intervention name, unlimited if missing
+        chunk_size (int): Clients scored per model call
+        max_passes (int): Most local search passes
+        engine (str): Prediction engine, see score_batch; model_version
+            in the result names the model it served
+
+    Returns:
+        dict: Totals, slots used per intervention, solve statistics and the
+            plan of every client that receives interventions
+
+    Raises:
+        ValueError: On capacities for unknown interventions
+    """
+    limits = capacity_vector(COLUMN_INTERVENTIONS, capacities)
+    started = time.perf_counter()
+    ids, gains, skipped = caseload_gains(repo, chunk_size, engine)
+    scoring_seconds = time.perf_counter() - started
+    plans = intervention_permutations(len(COLUMN_INTERVENTIONS))
+    if len(ids):
+        result = allocate(gains, plans, limits, max_passes)
+    else:
+        result = {"assignment": ids, "used": np.zeros(len(limits))}
+
+    assignment = result.pop("assignment")
+    used = result.pop("used")
+    treated = np.flatnonzero(plans[assignment].any(axis=1))
+    return {
+        "model_version": resolve_serving_model(engine),
+        "clients": len(ids),
+        "skipped": skipped,
+        "treated": len(treated),
+        "capacities": {
+            name: None if np.isinf(limit) else int(limit)
+            for name, limit in zip(COLUMN_INTERVENTIONS, limits)
+        },
+        "used": {name: int(count) for name, count in zip(COLUMN_INTERVENTIONS, used)},
+        **result,
+        "scoring_seconds": scoring_seconds,
+        "assignments": [
+            {
+                "client_id": int(ids[client]),
+                "interventions": intervention_row_to_names(plans[assignment[client]]),
+                "uplift": float(gains[client, assignment[client]]),
+            }
+            for client in treated.tolist()
+        ],
+    }
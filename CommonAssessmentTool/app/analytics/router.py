@@ -0,0 +1,57 @@
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.analytics.allocation import allocate_caseload
+from app.analytics.schema import AllocationRequest, SimulationRequest
+from app.analytics.simulation import compile_policy, run_simulation
+from app.auth.router import get_admin_user
+from app.clients.service.client_repository import SQLAlchemyClientRepository
+from app.database import get_db
+from app.models import User
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+
+@router.post("/simulate")
+def simulate_policy(
+    request: SimulationRequest,
+    current_user: User = Depends(get_admin_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Simulate an intervention policy over all clients.
+    Streams newline-delimited JSON: one progress event per chunk of clients,
+    then a result event with aggregate uplift statistics.
+    """
+    try:
+        rules = compile_policy(request)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    repo = SQLAlchemyClientRepository(db)
+    events = run_simulation(repo, rules, request.chunk_size)
+    return StreamingResponse(
+        (json.dumps(event) + "\n" for event in events),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.post("/allocate")
+def allocate_interventions(
+    request: AllocationRequest,
+    current_user: User = Depends(get_admin_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Assign intervention plans across all clients within program capacities,
+    maximizing the total predicted uplift.
+    """
+    repo = SQLAlchemyClientRepository(db)
+    try:
+        return allocate_caseload(
+            repo, request.capacities, request.chunk_size, request.max_passes
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
@@ -0,0 +1,75 @@
+"""
+Pydantic models for population-level analytics requests.
+"""
+
+from typing import Dict, List, Literal, Union
+
+from pydantic import BaseModel, Field, NonNegativeInt
+
+
+class FilterRule(BaseModel):
+    """
+    Condition on one client field, e.g. housing >= 9.
+    Booleans are compared as 1 (true) and 0 (false).
+    """
+
+    field: str = Field(description="Client field, e.g. 'housing'")
+    op: Literal["==", "!=", "<", "<=", ">", ">=", "in"] = "=="
+    value: Union[float, List[float]] = Field(
+        description="Value to compare with, a list for 'in'"
+    )
+
+
+class PolicyRule(BaseModel):
+    """
+    Clients matching every filter receive the listed interventions.
+    """
+
+    filters: List[FilterRule] = Field(
+        default_factory=list, description="All must hold, empty matches everyone"
+    )
+    interventions: List[str] = Field(
+        min_length=1, description="Interventions assigned to matching clients"
+    )
+
+
+class SimulationRequest(BaseModel):
+    """
+    Intervention policy to simulate over the whole client population.
+    Each client is treated by the first rule it matches.
+    """
+
+    rules: List[PolicyRule] = Field(min_length=1)
+    chunk_size: int = Field(50_000, ge=100, le=200_000)
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "rules": [
+                    {
+                        "filters": [{"field": "housing", "op": ">=", "value": 9}],
+                        "interventions": ["Life Stabilization"],
+                    }
+                ]
+            }
+        }
+
+
+class AllocationRequest(BaseModel):
+    """
+    Program slots per intervention; interventions left out are unlimited.
+    """
+
+    capacities: Dict[str, NonNegativeInt] = Field(default_factory=dict)
+    max_passes: int = Field(3, ge=0, le=20, description="Local search passes")
+    chunk_size: int = Field(2_000, ge=100, le=20_000)
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "capacities": {
+                    "Life Stabilization": 500,
+                    "Specialized Services": 200,
+                }
+            }
+        }
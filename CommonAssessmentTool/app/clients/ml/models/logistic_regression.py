@@ -1,12 +1,11 @@
-import pickle
-
 from app.clients.ml.models.base_model import BaseModel
+from app.ml.artifacts import load_model
 
 
 class LogisticRegressionModel(BaseModel):
     def __init__(self, model_path: str):
-        with open(model_path, "rb") as f:
-            self.model = pickle.load(f)
+        # Memory-mapped artifact directory written by train_logistic.py
+        self.model = load_model(model_path)
 
     def predict(self, X):
         return self.model.predict(X)
@@ -1,6 +1,7 @@
 from typing import Any, Dict, List, Optional
 
 from app.clients.ml.models.logistic_regression import LogisticRegressionModel
+from app.ml.model_version import bump_model_version
 
 
 class ModelManager:
@@ -10,15 +11,17 @@ class ModelManager:
     @classmethod
     def load_models(cls) -> None:
         cls._models["logistic_regression"] = LogisticRegressionModel(
-            "models/model_logreg.pkl"
+            "models/model_logreg"
         )
         cls._current_model = cls._models["logistic_regression"]
+        bump_model_version()
 
     @classmethod
     def set_model(cls, name: str) -> None:
         if name not in cls._models:
             raise ValueError(f"Model '{name}' not registered.")
         cls._current_model = cls._models[name]
+        bump_model_version()
 
     @classmethod
     def get_current_model_name(cls) -> Optional[str]:
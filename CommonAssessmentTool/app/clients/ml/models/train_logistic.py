@@ -1,12 +1,12 @@
-import pickle
-
 import pandas as pd
 from sklearn.linear_model import LogisticRegression
 from sklearn.model_selection import train_test_split
 
+from app.ml.artifacts import export_sklearn_model
+
 
 def train_logistic_model(
-    data_path="data_commontool.csv", save_path="models/model_logreg.pkl"
+    data_path="data_commontool.csv", save_path="models/model_logreg"
 ):
     df = pd.read_csv(data_path)
 
@@ -52,10 +52,12 @@ def train_logistic_model(
     model = LogisticRegression(max_iter=500)
     model.fit(X_train, y_train)
 
-    with open(save_path, "wb") as f:
-        pickle.dump(model, f)
+    # Saved as a memory-mapped artifact directory shared by all workers,
+    # replacing the last one; restart workers that load it afterwards.
+    runtime_model = export_sklearn_model(model, save_path, overwrite=True)
 
     print(f"Logistic Regression model saved to {save_path}")
+    return runtime_model
 
 
 if __name__ == "__main__":
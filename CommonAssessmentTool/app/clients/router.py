@@ -1,8 +1,8 @@
 # app/clients/router.py
 
-from typing import List
+from typing import List, Literal
 
-from fastapi import APIRouter, Depends, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
 
 from app.auth.router import get_admin_user, get_current_user
@@ -10,6 +10,7 @@ from app.clients.schema import (
     ClientListResponse,
     ClientResponse,
     ClientUpdate,
+    InterventionSearchInput,
     PredictionInput,
     ServiceResponse,
     ServiceUpdate,
@@ -17,13 +18,20 @@ from app.clients.schema import (
 from app.clients.service.case_assignment_service import CaseAssignmentService
 from app.clients.service.client_case_service import ClientCaseService
 from app.clients.service.client_service import ClientService
-from app.clients.service.logic import interpret_and_calculate
+from app.clients.service.columnar_preprocessing import InvalidInputError
+from app.clients.service.logic import ModelUnavailableError, serving_model
+from app.clients.service.prediction_executor import PredictionQueueFull
+from app.clients.service.prediction_service import SEARCH_ENGINE, prediction_service
+from app.clients.service.recommendation_service import RecommendationService
 from app.database import get_db
 from app.models import User
 from app.clients.service.client_repository import SQLAlchemyClientRepository
+from app.ml.router import MODEL_VERSION_HEADER
 
 router = APIRouter(prefix="/clients", tags=["clients"])
 
+MAX_PREDICTION_BATCH_SIZE = 1000
+
 # --------- Basic CRUD ---------
 
 
@@ -74,6 +82,23 @@ async def delete_client(
     return None
 
 
+@router.get("/{client_id}/recommendations")
+async def get_client_recommendations(
+    client_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Precomputed intervention recommendations, re-scored live when stale.
+    """
+    try:
+        return await RecommendationService.get_recommendations(db, client_id)
+    except PredictionQueueFull as e:
+        raise prediction_unavailable(e)
+    except InvalidInputError as e:
+        raise invalid_prediction_input(e)
+
+
 # --------- Services ---------
 
 
@@ -121,9 +146,113 @@ async def get_clients_by_case_worker(
     return CaseAssignmentService.get_clients_by_case_worker(db, case_worker_id)
 
 
+def prediction_unavailable(error: PredictionQueueFull) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Prediction service is at capacity, please retry",
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
+def invalid_prediction_input(error: InvalidInputError) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(error)
+    )
+
+
+def tier_unavailable(error: ModelUnavailableError) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(error)
+    )
+
+
 @router.post("/predictions")
-async def predict(data: PredictionInput):
+async def predict(
+    data: PredictionInput,
+    response: Response,
+    surface: bool = False,
+    tier: Literal["standard", "fast"] = "standard",
+):
     """
     Predict client outcome score using the current ML model.
+    Concurrent requests are micro-batched into a single model call.
+    With surface=true the response also carries all 128 combination scores
+    (indexed by bit mask) and the marginal and interaction effects.
+    With tier=fast the scores come from the distilled fast tier model.
+    The X-Model-Version header names the model that served the prediction.
+    """
+    try:
+        result = await prediction_service.predict(data.model_dump(), surface, tier)
+    except PredictionQueueFull as e:
+        raise prediction_unavailable(e)
+    except InvalidInputError as e:
+        raise invalid_prediction_input(e)
+    except ModelUnavailableError as e:
+        raise tier_unavailable(e)
+    response.headers[MODEL_VERSION_HEADER] = prediction_service.serving_model(tier)
+    return result
+
+
+@router.post("/predictions/batch")
+async def predict_batch(
+    data: List[PredictionInput],
+    response: Response,
+    surface: bool = False,
+    tier: Literal["standard", "fast"] = "standard",
+):
+    """
+    Predict outcomes for many clients with a single model call.
+    Results are returned in the same order as the input records.
+    """
+    if len(data) > MAX_PREDICTION_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch size must not exceed {MAX_PREDICTION_BATCH_SIZE}",
+        )
+    try:
+        results = await prediction_service.predict_batch(
+            [item.model_dump() for item in data], surface, tier
+        )
+    except PredictionQueueFull as e:
+        raise prediction_unavailable(e)
+    except InvalidInputError as e:
+        raise invalid_prediction_input(e)
+    except ModelUnavailableError as e:
+        raise tier_unavailable(e)
+    response.headers[MODEL_VERSION_HEADER] = prediction_service.serving_model(tier)
+    return results
+
+
+@router.post("/predictions/search")
+async def search_interventions(data: InterventionSearchInput, response: Response):
+    """
+    Best intervention plans for one client under constraints: at most
+    max_services interventions, total cost within budget, and the required
+    and excluded interventions respected. Plans are returned best first.
+    """
+    try:
+        result = await prediction_service.search(
+            data.client.model_dump(),
+            k=data.k,
+            max_services=data.max_services,
+            costs=data.costs,
+            budget=data.budget,
+            required=data.required,
+            excluded=data.excluded,
+        )
+    except PredictionQueueFull as e:
+        raise prediction_unavailable(e)
+    except InvalidInputError as e:
+        raise invalid_prediction_input(e)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    response.headers[MODEL_VERSION_HEADER] = serving_model(SEARCH_ENGINE)
+    return result
+
+
+@router.get("/predictions/metrics")
+async def prediction_metrics():
+    """
+    Micro-batching and executor metrics of the prediction pipeline.
     """
-    return interpret_and_calculate(data.model_dump())
+    return prediction_service.metrics()
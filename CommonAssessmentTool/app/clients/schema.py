@@ -4,10 +4,10 @@ Defines schemas for client data, predictions, and API responses.
 """
 
 from enum import IntEnum
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 # Standard library imports
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 
 
 # Enums for validation
@@ -48,6 +48,40 @@ class PredictionInput(BaseModel):
     need_mental_health_support_bool: str
 
 
+class InterventionSearchInput(BaseModel):
+    """
+    Schema for searching the best intervention plans for one client under
+    constraints. Interventions are referred to by their display names.
+    """
+
+    client: PredictionInput
+    k: int = Field(3, ge=1, le=100, description="Number of plans to return")
+    max_services: Optional[int] = Field(
+        None, ge=0, description="Most interventions in one plan"
+    )
+    costs: Dict[str, float] = Field(
+        default_factory=dict,
+        description="Non-negative cost per intervention, 0 if omitted",
+    )
+    budget: Optional[float] = Field(
+        None, ge=0, description="Largest total cost of a plan"
+    )
+    required: List[str] = Field(
+        default_factory=list, description="Interventions every plan must include"
+    )
+    excluded: List[str] = Field(
+        default_factory=list, description="Interventions no plan may include"
+    )
+
+    @field_validator("costs")
+    def validate_costs(cls, v):
+        # The search prunes on the budget, which assumes costs only add up.
+        negative = sorted(name for name, cost in v.items() if cost < 0)
+        if negative:
+            raise ValueError(f"Costs must be >= 0: {', '.join(negative)}")
+        return v
+
+
 class ClientBase(BaseModel):
     age: int = Field(ge=18, description="Age of client, must be 18 or older")
     gender: Gender = Field(description="Gender: 1 for male, 2 for female")
@@ -4,6 +4,8 @@ from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
 
 from app.clients.schema import ServiceUpdate
+from app.ml.online import online_updater
+from app.ml.retrain import retrain_scheduler
 from app.models import Client, ClientCase
 
 
@@ -48,13 +50,17 @@ class ClientCaseService:
         try:
             db.commit()
             db.refresh(client_case)
-            return client_case
         except Exception as e:
             db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Failed to update client services: {str(e)}",
             )
+        if update_data.get("success_rate") is not None:
+            # Applied to the online model in the background
+            online_updater.record(client_id, user_id)
+            retrain_scheduler.note_outcome()
+        return client_case
 
     @staticmethod
     def get_clients_by_services(db: Session, **service_filters: Optional[bool]):
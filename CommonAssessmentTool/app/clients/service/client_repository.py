@@ -1,9 +1,15 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
+import pandas as pd
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
 
-from ...models import Client, ClientCase
+from ...models import Client, ClientCase, ClientRecommendation
+from .columnar_preprocessing import CLIENT_COLUMNS, INTERVENTION_COLUMNS
+
+TRAINING_COLUMNS = CLIENT_COLUMNS + INTERVENTION_COLUMNS + ["success_rate"]
 
 
 class IClientRepository(ABC):
@@ -59,6 +65,32 @@ class IClientRepository(ABC):
     def delete_client(self, client_id: int) -> None:
         pass
 
+    @abstractmethod
+    def mark_recommendation_stale(self, client_id: int) -> None:
+        pass
+
+    @abstractmethod
+    def get_stale_recommendation_ids(self) -> List[int]:
+        pass
+
+    @abstractmethod
+    def iter_feature_chunks(
+        self, chunk_size: int, client_ids: Optional[Iterable[int]] = None
+    ) -> Iterator[pd.DataFrame]:
+        pass
+
+    @abstractmethod
+    def count_training_rows(self) -> int:
+        pass
+
+    @abstractmethod
+    def iter_training_chunks(
+        self,
+        chunk_size: int,
+        case_keys: Optional[Iterable[Tuple[int, int]]] = None,
+    ) -> Iterator[pd.DataFrame]:
+        pass
+
 
 class SQLAlchemyClientRepository(IClientRepository):
     def __init__(self, db: Session) -> None:
@@ -158,5 +190,101 @@ class SQLAlchemyClientRepository(IClientRepository):
         client = self.get_client(client_id)
         if client:
             self.db.query(ClientCase).filter(ClientCase.client_id == client_id).delete()
+            self.db.query(ClientRecommendation).filter(
+                ClientRecommendation.client_id == client_id
+            ).delete()
             self.db.delete(client)
             self.db.commit()
+
+    def mark_recommendation_stale(self, client_id: int) -> None:
+        """Record that a client's predictive fields changed, for every worker"""
+        # Naive UTC, like scored_at.
+        changed_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        self.db.query(ClientRecommendation).filter(
+            ClientRecommendation.client_id == client_id
+        ).update({ClientRecommendation.features_changed_at: changed_at})
+        self.db.commit()
+
+    def get_stale_recommendation_ids(self) -> List[int]:
+        """Ids of clients changed since their recommendations were scored"""
+        rows = (
+            self.db.query(ClientRecommendation.client_id)
+            .filter(
+                ClientRecommendation.features_changed_at
+                >= ClientRecommendation.scored_at
+            )
+            .all()
+        )
+        return [client_id for (client_id,) in rows]
+
+    def iter_feature_chunks(
+        self, chunk_size: int, client_ids: Optional[Iterable[int]] = None
+    ) -> Iterator[pd.DataFrame]:
+        """Yield id plus predictive columns of clients, chunk_size at a time"""
+        columns = [Client.id] + [getattr(Client, name) for name in CLIENT_COLUMNS]
+        if client_ids is not None:
+            ids = sorted(set(client_ids))
+            for start in range(0, len(ids), chunk_size):
+                end = start + chunk_size
+                rows = (
+                    self.db.query(*columns).filter(Client.id.in_(ids[start:end])).all()
+                )
+                yield pd.DataFrame(rows, columns=["id"] + CLIENT_COLUMNS)
+            return
+        last_id = 0
+        while True:
+            # Keyset pagination: every chunk is one indexed range scan.
+            rows = (
+                self.db.query(*columns)
+                .filter(Client.id > last_id)
+                .order_by(Client.id)
+                .limit(chunk_size)
+                .all()
+            )
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield pd.DataFrame(rows, columns=["id"] + CLIENT_COLUMNS)
+
+    def _training_query(self):
+        return (
+            self.db.query(ClientCase)
+            .join(Client, ClientCase.client_id == Client.id)
+            .filter(ClientCase.success_rate.isnot(None))
+        )
+
+    def count_training_rows(self) -> int:
+        """Number of client cases with a recorded outcome"""
+        return self._training_query().count()
+
+    def iter_training_chunks(
+        self,
+        chunk_size: int,
+        case_keys: Optional[Iterable[Tuple[int, int]]] = None,
+    ) -> Iterator[pd.DataFrame]:
+        """Yield features, interventions and success_rate of cases with an outcome"""
+        key = (ClientCase.client_id, ClientCase.user_id)
+        columns = [getattr(Client, name) for name in CLIENT_COLUMNS] + [
+            getattr(ClientCase, name)
+            for name in INTERVENTION_COLUMNS + ["success_rate"]
+        ]
+        query = self._training_query().with_entities(*key, *columns)
+        if case_keys is not None:
+            keys = sorted(set(case_keys))
+            for start in range(0, len(keys), chunk_size):
+                end = start + chunk_size
+                chunk_keys = tuple_(*key).in_(keys[start:end])
+                rows = query.filter(chunk_keys).order_by(*key).all()
+                yield pd.DataFrame([row[2:] for row in rows], columns=TRAINING_COLUMNS)
+            return
+        last_key = None
+        while True:
+            # Keyset pagination on the case's primary key, in a stable order.
+            chunk = query
+            if last_key is not None:
+                chunk = chunk.filter(tuple_(*key) > tuple_(*last_key))
+            rows = chunk.order_by(*key).limit(chunk_size).all()
+            if not rows:
+                return
+            last_key = rows[-1][:2]
+            yield pd.DataFrame([row[2:] for row in rows], columns=TRAINING_COLUMNS)
@@ -6,6 +6,7 @@ from sqlalchemy.exc import SQLAlchemyError
 from ...models import Client
 from ..schema import ClientUpdate
 from .client_repository import IClientRepository
+from .rescore_queue import changed_predictive_fields, dirty_clients
 
 
 class ClientService:
@@ -30,20 +31,28 @@ class ClientService:
         return self.repo.get_clients(skip, limit)
 
     def update_client(self, client_id: int, update_data: ClientUpdate):
-        if not self.repo.get_client(client_id):
+        client = self.repo.get_client(client_id)
+        if not client:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Client with id {client_id} not found",
             )
+        changes = update_data.dict(exclude_unset=True)
+        # Compared before the update, which mutates the same client object
+        features_changed = bool(changed_predictive_fields(client, changes))
         try:
-            return self.repo.update_client(
-                client_id, update_data.dict(exclude_unset=True)
-            )
+            updated_client = self.repo.update_client(client_id, changes)
+            if features_changed:
+                # Persisted so no worker serves the stored row any more.
+                self.repo.mark_recommendation_stale(client_id)
         except SQLAlchemyError as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Failed to update client: {str(e)}",
             )
+        if features_changed:
+            dirty_clients.mark_dirty(client_id)
+        return updated_client
 
     def delete_client(self, client_id: int):
         if not self.repo.get_client(client_id):
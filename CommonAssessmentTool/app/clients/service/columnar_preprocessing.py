@@ -0,0 +1,209 @@
+"""
+Columnar preprocessing of client records into model input matrices.
+
+Each of the 24 client columns has its own lookup table: the yes/no labels
+that every column accepts plus, for the categorical columns, that column's
+labels. A column is encoded by factorizing it once and encoding each distinct
+value, then gathering codes into a contiguous float32 (n, 24) matrix, so the
+Python-level work grows with the number of distinct values rather than rows.
+Values that are neither a known label nor a finite number are rejected with
+InvalidInputError instead of leaking strings into the model input.
+"""
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+CLIENT_COLUMNS = [
+    "age",
+    "gender",
+    "work_experience",
+    "canada_workex",
+    "dep_num",
+    "canada_born",
+    "citizen_status",
+    "level_of_schooling",
+    "fluent_english",
+    "reading_english_scale",
+    "speaking_english_scale",
+    "writing_english_scale",
+    "numeracy_scale",
+    "computer_scale",
+    "transportation_bool",
+    "caregiver_bool",
+    "housing",
+    "income_source",
+    "felony_bool",
+    "attending_school",
+    "currently_employed",
+    "substance_use",
+    "time_unemployed",
+    "need_mental_health_support_bool",
+]
+
+# Intervention flags of a client case, in the model's input order after
+# CLIENT_COLUMNS.
+INTERVENTION_COLUMNS = [
+    "employment_assistance",
+    "life_stabilization",
+    "retention_services",
+    "specialized_services",
+    "employment_related_financial_supports",
+    "employer_financial_supports",
+    "enhanced_referrals",
+]
+
+BOOLEAN_LABELS = {"": 0, "true": 1, "false": 0, "no": 0, "yes": 1, "No": 0, "Yes": 1}
+SCHOOLING_LABELS = {
+    "Grade 0-8": 1,
+    "Grade 9": 2,
+    "Grade 10": 3,
+    "Grade 11": 4,
+    "Grade 12 or equivalent": 5,
+    "OAC or Grade 13": 6,
+    "Some college": 7,
+    "Some university": 8,
+    "Some apprenticeship": 9,
+    "Certificate of Apprenticeship": 10,
+    "Journeyperson": 11,
+    "Certificate/Diploma": 12,
+    "Bachelor's degree": 13,
+    "Post graduate": 14,
+}
+HOUSING_LABELS = {
+    "Renting-private": 1,
+    "Renting-subsidized": 2,
+    "Boarding or lodging": 3,
+    "Homeowner": 4,
+    "Living with family/friend": 5,
+    "Institution": 6,
+    "Temporary second residence": 7,
+    "Band-owned home": 8,
+    "Homeless or transient": 9,
+    "Emergency hostel": 10,
+}
+INCOME_LABELS = {
+    "No Source of Income": 1,
+    "Employment Insurance": 2,
+    "Workplace Safety and Insurance Board": 3,
+    "Ontario Works applied or receiving": 4,
+    "Ontario Disability Support Program applied or receiving": 5,
+    "Dependent of someone receiving OW or ODSP": 6,
+    "Crown Ward": 7,
+    "Employment": 8,
+    "Self-Employment": 9,
+    "Other (specify)": 10,
+}
+
+COLUMN_LABELS = {column: BOOLEAN_LABELS for column in CLIENT_COLUMNS}
+COLUMN_LABELS["level_of_schooling"] = {**BOOLEAN_LABELS, **SCHOOLING_LABELS}
+COLUMN_LABELS["housing"] = {**BOOLEAN_LABELS, **HOUSING_LABELS}
+COLUMN_LABELS["income_source"] = {**BOOLEAN_LABELS, **INCOME_LABELS}
+
+
+class InvalidInputError(ValueError):
+    """Raised when a client field cannot be encoded as a number."""
+
+    def __init__(self, column, values):
+        self.column = column
+        self.values = list(values)
+        if not self.values:
+            super().__init__(f"Missing field '{column}'")
+            return
+        shown = ", ".join(repr(value) for value in self.values[:5])
+        super().__init__(f"Invalid value(s) for '{column}': {shown}")
+
+
+def encode_value(value, labels):
+    """
+    Encode one distinct value of a column.
+
+    Args:
+        value: Raw value, a label, a numeric string or a number
+        labels (dict): The column's label lookup table
+
+    Returns:
+        float: Encoded value, NaN if it cannot be encoded
+    """
+    if isinstance(value, str):
+        if value in labels:
+            return labels[value]
+        try:
+            value = float(value)
+        except ValueError:
+            return np.nan
+    elif not isinstance(value, (int, float, np.number)):
+        return np.nan
+    return value if np.isfinite(value) else np.nan
+
+
+def encode_column(values, column):
+    """
+    Encode one column of raw values.
+
+    Args:
+        values (pd.Series): Raw values of the column
+        column (str): Column name, a key of COLUMN_LABELS
+
+    Returns:
+        np.array: float32 values of shape (n,)
+    """
+    if is_numeric_dtype(values) or is_bool_dtype(values):
+        encoded = values.to_numpy(dtype=np.float32, na_value=np.nan)
+        invalid = ~np.isfinite(encoded)
+        if invalid.any():
+            raise InvalidInputError(column, values[invalid].unique())
+        return encoded
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    labels = COLUMN_LABELS[column]
+    table = np.array(
+        [encode_value(value, labels) for value in uniques], dtype=np.float32
+    )
+    invalid = np.isnan(table)
+    if invalid.any() or (codes < 0).any():
+        bad_values = list(uniques[invalid]) + ([None] if (codes < 0).any() else [])
+        raise InvalidInputError(column, bad_values)
+    return table[codes]
+
+
+def encode_frame(frame):
+    """
+    Encode a DataFrame of client records.
+
+    Args:
+        frame (pd.DataFrame): One row per client with the CLIENT_COLUMNS
+            columns, extra columns are ignored
+
+    Returns:
+        np.array: Contiguous float32 matrix of shape (n, 24)
+
+    Raises:
+        InvalidInputError: If a value is neither a known label nor a number
+    """
+    missing = [column for column in CLIENT_COLUMNS if column not in frame.columns]
+    if missing:
+        raise InvalidInputError(missing[0], [])
+    # Columns are filled contiguously, then transposed once into row-major.
+    matrix = np.empty((len(frame), len(CLIENT_COLUMNS)), dtype=np.float32, order="F")
+    for index, column in enumerate(CLIENT_COLUMNS):
+        matrix[:, index] = encode_column(frame[column], column)
+    return np.ascontiguousarray(matrix)
+
+
+def encode_records(records):
+    """
+    Encode client records given as dicts, e.g. prediction payloads.
+
+    Args:
+        records (list): Dicts keyed by CLIENT_COLUMNS
+
+    Returns:
+        np.array: Contiguous float32 matrix of shape (n, 24)
+    """
+    if not records:
+        return np.empty((0, len(CLIENT_COLUMNS)), dtype=np.float32)
+    missing = [column for column in CLIENT_COLUMNS if column not in records[0]]
+    if missing:
+        raise InvalidInputError(missing[0], [])
+    frame = pd.DataFrame.from_records(records, columns=CLIENT_COLUMNS)
+    return encode_frame(frame)
@@ -5,6 +5,8 @@ Handles data cleaning, model predictions, and intervention combinations analysis
 
 # Standard library imports
 import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
 # Third-party imports
 import pickle
@@ -14,6 +16,21 @@ from itertools import product
 
 import numpy as np
 
+from app.clients.service.columnar_preprocessing import (
+    BOOLEAN_LABELS,
+    CLIENT_COLUMNS,
+    HOUSING_LABELS,
+    INCOME_LABELS,
+    INTERVENTION_COLUMNS,
+    SCHOOLING_LABELS,
+    encode_records,
+)
+from app.clients.service.prediction_cache import prediction_cache
+from app.ml.artifacts import artifact_digest, load_model
+from app.ml.intervention_search import ClientSurface, search_top_k
+from app.ml.partial_eval import InterventionPartialEvaluator
+from app.ml.response_surface import mask_order, surface_effects
+
 # Constants
 COLUMN_INTERVENTIONS = [
     "Life Stabilization",
@@ -25,11 +42,54 @@ COLUMN_INTERVENTIONS = [
     "Enhanced Referrals for Skills Development",
 ]
 
-# Load model
+# Load model. Serving uses the memory-mapped artifact exported from model.pkl
+# (see app.ml.artifacts), so scikit-learn is only imported by the "sklearn"
+# engine and all workers on a host share the model's pages.
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(CURRENT_DIR, "model.pkl")
-with open(MODEL_PATH, "rb") as model_file:
-    MODEL = pickle.load(model_file)
+COMPILED_MODEL_PATH = os.path.join(CURRENT_DIR, "model_forest")
+MODEL = load_model(COMPILED_MODEL_PATH)
+MODEL_VERSION = artifact_digest(COMPILED_MODEL_PATH)
+
+DATA_PATH = os.path.join(CURRENT_DIR, "data_commontool.csv")
+
+# Prediction engines: "compiled" evaluates the full matrix with the array-backed
+# forest, "partial" walks each tree once per client and only branches on
+# interventions, "sklearn" runs the original pickled model as a reference,
+# "ensemble" evaluates the registered ENSEMBLE_MODEL (see app.ml.ensemble),
+# "fast" reads whole surfaces from the distilled FAST_MODEL (see app.ml.distill),
+# "online" evaluates the model updated from recorded outcomes (see
+# app.ml.online) and "trained" the latest published TRAINED_MODEL (see
+# app.ml.training and app.ml.retrain).
+PREDICTION_ENGINES = (
+    "compiled",
+    "partial",
+    "sklearn",
+    "ensemble",
+    "fast",
+    "online",
+    "trained",
+)
+DEFAULT_PREDICTION_ENGINE = os.getenv("PREDICTION_ENGINE", "compiled")
+ENSEMBLE_MODEL = os.getenv("ENSEMBLE_MODEL", "intervention_ensemble")
+FAST_MODEL = os.getenv("FAST_MODEL", "intervention_fast")
+TRAINED_MODEL = os.getenv("TRAINED_MODEL", "intervention_forest")
+# How often the "trained" engine looks for a newly published version
+TRAINED_MODEL_SYNC_SECONDS = float(os.getenv("TRAINED_MODEL_SYNC_SECONDS", "5"))
+NUM_CLIENT_FEATURES = 24
+FEATURE_SCHEMA = CLIENT_COLUMNS + INTERVENTION_COLUMNS
+_sklearn_model = None
+_partial_evaluator = None
+_ensemble_model: Optional[Any] = None
+_ensemble_version: Optional[int] = None
+_fast_model: Optional[Any] = None
+_fast_version: Optional[int] = None
+_trained_model: Optional[Tuple[int, Any]] = None
+_trained_model_checked = 0.0
+
+
+class ModelUnavailableError(RuntimeError):
+    """Raised when an engine's model has not been registered."""
 
 
 def clean_input_data(input_data):
@@ -42,35 +102,9 @@ def clean_input_data(input_data):
     Returns:
         list: Cleaned and formatted data ready for model input
     """
-    columns = [
-        "age",
-        "gender",
-        "work_experience",
-        "canada_workex",
-        "dep_num",
-        "canada_born",
-        "citizen_status",
-        "level_of_schooling",
-        "fluent_english",
-        "reading_english_scale",
-        "speaking_english_scale",
-        "writing_english_scale",
-        "numeracy_scale",
-        "computer_scale",
-        "transportation_bool",
-        "caregiver_bool",
-        "housing",
-        "income_source",
-        "felony_bool",
-        "attending_school",
-        "currently_employed",
-        "substance_use",
-        "time_unemployed",
-        "need_mental_health_support_bool",
-    ]
-    demographics = {key: input_data[key] for key in columns}
+    demographics = {key: input_data[key] for key in CLIENT_COLUMNS}
     output = []
-    for column in columns:
+    for column in CLIENT_COLUMNS:
         value = demographics.get(column, None)
         if isinstance(value, str):
             value = convert_text(value)  # Removed 'column' from here as it wasn't used
@@ -89,47 +123,10 @@ def convert_text(text_data: str):
         int: Converted numerical value
     """
     categorical_mappings = [
-        {"": 0, "true": 1, "false": 0, "no": 0, "yes": 1, "No": 0, "Yes": 1},
-        {
-            "Grade 0-8": 1,
-            "Grade 9": 2,
-            "Grade 10": 3,
-            "Grade 11": 4,
-            "Grade 12 or equivalent": 5,
-            "OAC or Grade 13": 6,
-            "Some college": 7,
-            "Some university": 8,
-            "Some apprenticeship": 9,
-            "Certificate of Apprenticeship": 10,
-            "Journeyperson": 11,
-            "Certificate/Diploma": 12,
-            "Bachelor's degree": 13,
-            "Post graduate": 14,
-        },
-        {
-            "Renting-private": 1,
-            "Renting-subsidized": 2,
-            "Boarding or lodging": 3,
-            "Homeowner": 4,
-            "Living with family/friend": 5,
-            "Institution": 6,
-            "Temporary second residence": 7,
-            "Band-owned home": 8,
-            "Homeless or transient": 9,
-            "Emergency hostel": 10,
-        },
-        {
-            "No Source of Income": 1,
-            "Employment Insurance": 2,
-            "Workplace Safety and Insurance Board": 3,
-            "Ontario Works applied or receiving": 4,
-            "Ontario Disability Support Program applied or receiving": 5,
-            "Dependent of someone receiving OW or ODSP": 6,
-            "Crown Ward": 7,
-            "Employment": 8,
-            "Self-Employment": 9,
-            "Other (specify)": 10,
-        },
+        BOOLEAN_LABELS,
+        SCHOOLING_LABELS,
+        HOUSING_LABELS,
+        INCOME_LABELS,
     ]
     for category in categorical_mappings:
         if text_data in category:
@@ -142,6 +139,8 @@ def create_matrix(row_data):
     """
     Create matrix of all possible intervention combinations.
 
+    One client's rows of build_prediction_matrix, kept as its reference.
+
     Args:
         row_data (list): Base data row
 
@@ -170,6 +169,8 @@ def get_baseline_row(row_data):
     """
     Create baseline row with no interventions.
 
+    One client's first row of build_prediction_matrix, kept as its reference.
+
     Args:
         row_data (list): Input data row
 
@@ -210,28 +211,471 @@ def process_results(baseline_pred, results_matrix):
     return {"baseline": baseline_pred[-1], "interventions": result_list}
 
 
-def interpret_and_calculate(input_data):
+def build_prediction_matrix(raw_rows):
+    """
+    Stack the baseline and intervention rows of many clients into one matrix.
+
+    Args:
+        raw_rows (list): Cleaned data rows, one per client
+
+    Returns:
+        np.array: Contiguous matrix of shape (n * 129, 31). Each client
+            contributes its baseline row followed by its 128 intervention rows.
+    """
+    features = np.asarray(raw_rows, dtype=np.float64).reshape(len(raw_rows), -1)
+    perms = intervention_permutations(len(COLUMN_INTERVENTIONS))
+    num_features = features.shape[1]
+    matrix = np.zeros(
+        (len(features), len(perms) + 1, num_features + perms.shape[1]),
+        dtype=np.float64,
+    )
+    matrix[:, :, :num_features] = features[:, np.newaxis, :]
+    matrix[:, 1:, num_features:] = perms
+    return matrix.reshape(-1, matrix.shape[2])
+
+
+def get_partial_evaluator():
+    """
+    Get the intervention-aware evaluator for MODEL, building it on first use.
+
+    Returns:
+        InterventionPartialEvaluator: Evaluator over MODEL's trees
+    """
+    global _partial_evaluator
+    if _partial_evaluator is None:
+        _partial_evaluator = InterventionPartialEvaluator.from_forest(
+            MODEL, NUM_CLIENT_FEATURES
+        )
+    return _partial_evaluator
+
+
+def get_sklearn_model():
+    """
+    Unpickle the original scikit-learn model on first use.
+
+    Returns:
+        RandomForestRegressor: Model that the compiled artifact was exported from
+    """
+    global _sklearn_model
+    if _sklearn_model is None:
+        with open(MODEL_PATH, "rb") as model_file:
+            _sklearn_model = pickle.load(model_file)
+    return _sklearn_model
+
+
+def get_ensemble_model():
+    """
+    Load the latest registered version of ENSEMBLE_MODEL on first use.
+
+    Returns:
+        EnsembleModel: Weighted blend of models over the intervention matrix
+
+    Raises:
+        ValueError: If ENSEMBLE_MODEL is not registered
+    """
+    global _ensemble_model, _ensemble_version
+    if _ensemble_model is None:
+        from app.ml.model_list import registry
+
+        version = registry.resolve(ENSEMBLE_MODEL)
+        _ensemble_model = registry.load(ENSEMBLE_MODEL, version)
+        _ensemble_version = version
+    return _ensemble_model
+
+
+def get_fast_model():
+    """
+    Load the latest registered version of FAST_MODEL on first use.
+
+    Returns:
+        CompiledForest: Student mapping client features to 128-value surfaces
+
+    Raises:
+        ModelUnavailableError: If FAST_MODEL is not registered
+    """
+    global _fast_model, _fast_version
+    if _fast_model is None:
+        from app.ml.model_list import registry
+
+        if not registry.versions(FAST_MODEL):
+            raise ModelUnavailableError(
+                f"Fast tier model {FAST_MODEL} is not registered; "
+                "create it with python -m app.ml.distill"
+            )
+        _fast_version = registry.resolve(FAST_MODEL)
+        _fast_model = registry.load(FAST_MODEL, _fast_version)
+    return _fast_model
+
+
+def get_online_model():
+    """
+    The online model as of now; it changes as outcomes are recorded.
+
+    Returns:
+        OnlineRidge: Model over the intervention matrix
+
+    Raises:
+        ModelUnavailableError: If it is not registered and has seen no outcomes
+    """
+    from app.ml.online import online_updater
+
+    model = online_updater.model
+    if model is None:
+        raise ModelUnavailableError(
+            f"Online model {online_updater.name} is not registered; "
+            "create it with python -m app.ml.online"
+        )
+    return model
+
+
+def get_trained_model():
+    """
+    The latest published version of TRAINED_MODEL.
+
+    Newly published versions are adopted within TRAINED_MODEL_SYNC_SECONDS:
+    the version is loaded, then swapped in with one assignment.
+
+    Returns:
+        CompiledForest: Model over the intervention matrix
+
+    Raises:
+        ModelUnavailableError: If TRAINED_MODEL is not registered
+    """
+    global _trained_model, _trained_model_checked
+    now = time.monotonic()
+    if _trained_model is None or now - _trained_model_checked >= (
+        TRAINED_MODEL_SYNC_SECONDS
+    ):
+        from app.ml.model_list import registry
+
+        _trained_model_checked = now
+        versions = registry.versions(TRAINED_MODEL)
+        if not versions:
+            raise ModelUnavailableError(
+                f"Trained model {TRAINED_MODEL} is not registered; "
+                "create it with python -m app.ml.training"
+            )
+        latest = versions[-1]
+        if _trained_model is None or _trained_model[0] != latest:
+            _trained_model = (latest, registry.load(TRAINED_MODEL, latest))
+    return _trained_model[1]
+
+
+def serving_model(engine=None):
+    """
+    Name and version of the model an engine serves, without loading it.
+
+    Args:
+        engine (str): Prediction engine, see score_batch
+
+    Returns:
+        str: "shipped:<MODEL_VERSION>" for the shipped forest, otherwise
+            "<name>:<version>" of the loaded registered model, or just its
+            name if this process has not loaded it
+    """
+    engine = engine or DEFAULT_PREDICTION_ENGINE
+    if engine in ("compiled", "partial", "sklearn"):
+        return f"shipped:{MODEL_VERSION}"
+    if engine == "online":
+        from app.ml.online import online_updater
+
+        name, version = online_updater.name, online_updater.stats()["version"]
+    elif engine == "trained":
+        trained = _trained_model
+        name, version = TRAINED_MODEL, trained and trained[0]
+    elif engine == "fast":
+        name, version = FAST_MODEL, _fast_version
+    else:
+        name, version = ENSEMBLE_MODEL, _ensemble_version
+    return name if version is None else f"{name}:{version}"
+
+
+def resolve_serving_model(engine=None):
+    """
+    serving_model, after adopting a newly published "trained" version.
+
+    Args:
+        engine (str): Prediction engine, see score_batch
+
+    Returns:
+        str: The model label that engine's next predictions come from
+    """
+    engine = engine or DEFAULT_PREDICTION_ENGINE
+    if engine == "trained":
+        get_trained_model()
+    return serving_model(engine)
+
+
+def ensemble_timings():
+    """
+    Per-member latency of the ensemble engine, empty until it is used.
+
+    Returns:
+        dict: Member name to weight and latency summary
+    """
+    if _ensemble_model is None:
+        return {}
+    return _ensemble_model.member_timings()
+
+
+def score_batch(raw_rows, engine=None):
+    """
+    Score the baseline and every intervention combination for many clients.
+
+    The "compiled", "sklearn", "ensemble", "online" and "trained" engines
+    predict all rows in a single model call; the "partial" engine evaluates
+    each client's combinations in one tree walk and the "fast" engine
+    predicts each client's whole surface from its features alone.
+
+    Args:
+        raw_rows (list): Cleaned data rows, one per client
+        engine (str): One of PREDICTION_ENGINES, defaults to the
+            PREDICTION_ENGINE environment variable
+
+    Returns:
+        tuple: Baseline predictions of shape (n,) and intervention predictions
+            of shape (n, 128), ordered like intervention_permutations
+    """
+    engine = engine or DEFAULT_PREDICTION_ENGINE
+    if engine not in PREDICTION_ENGINES:
+        raise ValueError(f"Unknown prediction engine: {engine}")
+    if engine == "partial":
+        evaluator = get_partial_evaluator()
+        perms = intervention_permutations(len(COLUMN_INTERVENTIONS))
+        intervention_predictions = np.array(
+            [evaluator.predict_combinations(row, perms) for row in raw_rows]
+        ).reshape(len(raw_rows), len(perms))
+        # The first combination has no interventions, i.e. the baseline row.
+        return intervention_predictions[:, 0], intervention_predictions
+
+    if engine == "fast":
+        features = np.asarray(raw_rows, dtype=np.float64).reshape(len(raw_rows), -1)
+        surfaces = get_fast_model().predict(features).reshape(len(raw_rows), -1)
+        return surfaces[:, 0], surfaces
+
+    if engine == "sklearn":
+        model = get_sklearn_model()
+    elif engine == "ensemble":
+        model = get_ensemble_model()
+    elif engine == "online":
+        model = get_online_model()
+    elif engine == "trained":
+        model = get_trained_model()
+    else:
+        model = MODEL
+    # Built once; ensemble members all read this same matrix.
+    matrix = build_prediction_matrix(raw_rows)
+    predictions = model.predict(matrix).reshape(len(raw_rows), -1)
+    return predictions[:, 0], predictions[:, 1:]
+
+
+def summarize_predictions(baseline_prediction, intervention_predictions):
+    """
+    Select the top three intervention combinations for one client.
+
+    Args:
+        baseline_prediction (float): Prediction with no interventions
+        intervention_predictions (np.array): Predictions for all 128 combinations
+
+    Returns:
+        dict: Processed results with baseline and interventions
+    """
+    perms = intervention_permutations(len(COLUMN_INTERVENTIONS))
+    result_matrix = np.concatenate(
+        (perms, np.reshape(intervention_predictions, (-1, 1))), axis=1
+    )
+    result_order = result_matrix[:, -1].argsort()
+    top_results = result_matrix[result_order][-3:]
+    return process_results(np.array([baseline_prediction]), top_results)
+
+
+def describe_surfaces(intervention_predictions):
+    """
+    Bit-indexed response surfaces and intervention effects of many clients.
+
+    Args:
+        intervention_predictions (np.array): Predictions of shape (n, 128),
+            ordered like intervention_permutations
+
+    Returns:
+        list: Per client, "values" (prediction for every combination,
+            indexed by bit mask with bit i for COLUMN_INTERVENTIONS[i]),
+            "marginal_effects" (average uplift of each intervention) and
+            "interaction_effects" (average pairwise interaction, n x n)
+    """
+    order = mask_order(len(COLUMN_INTERVENTIONS))
+    surfaces = np.asarray(intervention_predictions, dtype=np.float64)[:, order]
+    main, interactions = surface_effects(surfaces)
+    return [
+        {
+            "values": values,
+            "marginal_effects": marginal,
+            "interaction_effects": interaction,
+        }
+        for values, marginal, interaction in zip(
+            surfaces.tolist(), main.tolist(), interactions.tolist()
+        )
+    ]
+
+
+def interpret_and_calculate_matrix(features, engine=None, surface=False):
+    """
+    Generate intervention recommendations for already encoded clients.
+
+    Clients whose feature vector was scored recently by the same engine and
+    serving model version are served from prediction_cache; only the
+    remaining distinct vectors are scored.
+
+    Args:
+        features (np.array): Encoded client features of shape (n, 24)
+        engine (str): Prediction engine, see score_batch
+        surface (bool): Add the full response surface and intervention
+            effects under "surface", see describe_surfaces
+
+    Returns:
+        list: Processed results, one per row of features
+    """
+    engine = engine or DEFAULT_PREDICTION_ENGINE
+    model = resolve_serving_model(engine)
+    keys = [prediction_cache.make_key(row, engine, model, surface) for row in features]
+    results = [prediction_cache.get(key) for key in keys]
+
+    # Score each distinct missing vector once, even if repeated in the batch.
+    missing: Dict[Any, List[int]] = {}
+    for index, result in enumerate(results):
+        if result is None:
+            missing.setdefault(keys[index] or index, []).append(index)
+    if missing:
+        rows = [features[indices[0]] for indices in missing.values()]
+        baselines, intervention_predictions = score_batch(rows, engine)
+        surfaces = (
+            describe_surfaces(intervention_predictions)
+            if surface
+            else [None] * len(rows)
+        )
+        for indices, baseline, predictions, client_surface in zip(
+            missing.values(), baselines, intervention_predictions, surfaces
+        ):
+            result = summarize_predictions(baseline, predictions)
+            if surface:
+                result["surface"] = client_surface
+            prediction_cache.put(keys[indices[0]], result)
+            for index in indices:
+                results[index] = result
+    return results
+
+
+def interpret_and_calculate_batch(inputs, engine=None, surface=False):
+    """
+    Generate intervention recommendations for many clients at once.
+
+    Args:
+        inputs (list): Raw input data dicts, one per client
+        engine (str): Prediction engine, see score_batch
+        surface (bool): Include the full response surface, see
+            interpret_and_calculate_matrix
+
+    Returns:
+        list: Processed results in the same order and shape as
+            interpret_and_calculate
+
+    Raises:
+        InvalidInputError: If a field is neither a known label nor a number
+    """
+    if not inputs:
+        return []
+    return interpret_and_calculate_matrix(encode_records(inputs), engine, surface)
+
+
+def interpret_and_calculate(input_data, engine=None):
     """
     Main function to process input data and generate intervention recommendations.
 
     Args:
         input_data (dict): Raw input data from client
+        engine (str): Prediction engine, see score_batch
 
     Returns:
         dict: Processed results with recommendations
     """
-    raw_data = clean_input_data(input_data)
-    baseline_row = get_baseline_row(raw_data).reshape(1, -1)
-    intervention_rows = create_matrix(raw_data)
-    baseline_prediction = MODEL.predict(baseline_row)
-    intervention_predictions = MODEL.predict(intervention_rows).reshape(-1, 1)
-    result_matrix = np.concatenate(
-        (intervention_rows, intervention_predictions), axis=1
+    return interpret_and_calculate_batch([input_data], engine)[0]
+
+
+def intervention_indices(names):
+    """
+    Map intervention names to their positions in COLUMN_INTERVENTIONS.
+
+    Args:
+        names (list): Intervention names
+
+    Returns:
+        list: Column indices
+    """
+    unknown = [name for name in names if name not in COLUMN_INTERVENTIONS]
+    if unknown:
+        raise ValueError(f"Unknown intervention(s): {', '.join(unknown)}")
+    return [COLUMN_INTERVENTIONS.index(name) for name in names]
+
+
+def search_interventions(
+    input_data,
+    k=3,
+    max_services=None,
+    costs=None,
+    budget=None,
+    required=(),
+    excluded=(),
+):
+    """
+    Find the best intervention plans for one client under constraints.
+
+    Plans are found by branch-and-bound over the client's reduced forest
+    (see app.ml.intervention_search) rather than by scoring and sorting
+    every combination.
+
+    Args:
+        input_data (dict): Raw input data from client
+        k (int): Number of plans to return
+        max_services (int): Most interventions per plan
+        costs (dict): Intervention name to cost, missing names cost 0
+        budget (float): Largest total cost of a plan
+        required (list): Intervention names every plan must include
+        excluded (list): Intervention names no plan may include
+
+    Returns:
+        dict: Baseline prediction, best-first plans with their score,
+            intervention names and cost, and search statistics
+    """
+    costs = costs or {}
+    cost_vector = np.zeros(len(COLUMN_INTERVENTIONS))
+    cost_vector[intervention_indices(list(costs))] = list(costs.values())
+    surface = ClientSurface.from_evaluator(
+        get_partial_evaluator(),
+        encode_records([input_data])[0],
+        len(COLUMN_INTERVENTIONS),
     )
-    result_order = result_matrix[:, -1].argsort()
-    result_matrix = result_matrix[result_order]
-    top_results = result_matrix[-3:, -8:]
-    return process_results(baseline_prediction, top_results)
+    search = search_top_k(
+        surface,
+        k=k,
+        max_services=max_services,
+        costs=cost_vector,
+        budget=budget,
+        required=intervention_indices(required),
+        excluded=intervention_indices(excluded),
+    )
+    return {
+        "baseline": surface.predict(0),
+        "plans": [
+            {
+                "score": score,
+                "interventions": [COLUMN_INTERVENTIONS[index] for index in indices],
+                "cost": cost,
+            }
+            for score, indices, cost in search["plans"]
+        ],
+        "expanded": search["expanded"],
+        "pruned": search["pruned"],
+    }
 
 
 if __name__ == "__main__":
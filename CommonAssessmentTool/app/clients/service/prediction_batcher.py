@@ -0,0 +1,144 @@
+"""
+Asyncio micro-batching for prediction requests.
+
+Requests that arrive within a short window are collected and scored with one
+stacked batch call in a worker thread; each caller's future is resolved with
+its own result.
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.clients.service.prediction_executor import (
+    PredictionExecutor,
+    PredictionQueueFull,
+)
+from app.clients.service.prediction_metrics import LatencySample
+
+
+class PredictionBatcher:
+    """
+    Collect concurrent submissions into batches of up to max_batch_size items,
+    waiting at most max_wait_ms after the first item of a batch arrives.
+    """
+
+    def __init__(
+        self,
+        predict_batch: Callable[[List[Any]], List[Any]],
+        max_wait_ms: float = 2.0,
+        max_batch_size: int = 32,
+        executor: Optional[PredictionExecutor] = None,
+    ):
+        """
+        Args:
+            predict_batch: Blocking function mapping a list of inputs to a list
+                of results in the same order
+            max_wait_ms: Longest time the first item of a batch waits for more
+            max_batch_size: Batch size that triggers an immediate flush
+            executor: Executor that runs batches, the event loop's default
+                thread pool when omitted
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.predict_batch = predict_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.executor = executor
+        self._pending: List[tuple] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        self._batches = 0
+        self._items = 0
+        self._batch_sizes: Dict[int, int] = {}
+        self._delays_ms = LatencySample()
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Queue one input and wait for its result.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        # Keep a reference so the task is not garbage collected mid-flight.
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[tuple]) -> None:
+        started = time.perf_counter()
+        self._record(batch, started)
+        items = [item for item, _, _ in batch]
+        try:
+            results = await self._execute(items)
+        except PredictionQueueFull as exc:
+            for _, future, _ in batch:
+                resolve(future, exception=exc)
+            return
+        except Exception as exc:
+            if len(batch) == 1:
+                resolve(batch[0][1], exception=exc)
+                return
+            # Score items one by one so a bad input only fails its own caller.
+            for entry in batch:
+                try:
+                    (result,) = await self._execute([entry[0]])
+                except Exception as item_exc:
+                    resolve(entry[1], exception=item_exc)
+                else:
+                    resolve(entry[1], result=result)
+            return
+        for (_, future, _), result in zip(batch, results):
+            resolve(future, result=result)
+
+    async def _execute(self, items: List[Any]) -> List[Any]:
+        if self.executor is not None:
+            return await self.executor.run(self.predict_batch, items)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.predict_batch, items)
+
+    def _record(self, batch: List[tuple], started: float) -> None:
+        self._batches += 1
+        self._items += len(batch)
+        self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+        self._delays_ms.extend((started - queued) * 1000 for _, _, queued in batch)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Batch size and queue delay metrics.
+        """
+        return {
+            "max_wait_ms": self.max_wait * 1000,
+            "max_batch_size": self.max_batch_size,
+            "batches": self._batches,
+            "requests": self._items,
+            "pending": len(self._pending),
+            "mean_batch_size": self._items / self._batches if self._batches else 0.0,
+            "batch_sizes": dict(sorted(self._batch_sizes.items())),
+            "queue_delay_ms": self._delays_ms.summary(),
+        }
+
+
+def resolve(future: asyncio.Future, result: Any = None, exception=None) -> None:
+    """
+    Complete a caller's future unless the caller already went away.
+    """
+    if future.done():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
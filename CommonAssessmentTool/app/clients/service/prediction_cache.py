@@ -0,0 +1,158 @@
+"""
+Bounded in-process cache of prediction results.
+
+Entries are keyed by a hash of the cleaned 24-value feature vector, the
+prediction engine, the model that engine serves (see
+app.clients.service.logic.serving_model) and the active model version,
+evicted least recently used first once max_size is reached, and expire after
+ttl_seconds. Any change of model version (see app.ml.model_version) clears
+the cache. Entries of a replaced serving model, or of an engine whose own
+version was bumped (the online model as outcomes are applied), are simply
+never hit again while the other engines' entries stay valid.
+
+Configuration (environment variables):
+    PREDICTION_CACHE_SIZE: Maximum number of entries, 0 disables (default 1024)
+    PREDICTION_CACHE_TTL_SECONDS: Entry lifetime (default 300)
+"""
+
+import copy
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Sequence
+
+import numpy as np
+
+from app.ml.model_version import get_model_version
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache with per-entry TTL.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl_seconds: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            max_size: Maximum number of entries, 0 disables the cache
+            ttl_seconds: Seconds an entry stays valid after it is stored
+            clock: Monotonic time source, injectable for tests
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_version = get_model_version()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    @classmethod
+    def from_env(cls) -> "PredictionCache":
+        return cls(
+            max_size=int(os.getenv("PREDICTION_CACHE_SIZE", "1024")),
+            ttl_seconds=float(os.getenv("PREDICTION_CACHE_TTL_SECONDS", "300")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @staticmethod
+    def make_key(
+        features: Sequence, engine: str, model: str = "", surface: bool = False
+    ) -> Optional[str]:
+        """
+        Hash a cleaned feature vector together with the engine, whether the
+        response surface is included, the model the engine serves, the model
+        version and the engine's own model version.
+
+        Returns None for vectors that are not fully numeric; those are never
+        cached and fail in the model call as before.
+        """
+        try:
+            vector = np.asarray(features, dtype=np.float64)
+        except (TypeError, ValueError):
+            return None
+        digest = hashlib.blake2b(vector.tobytes(), digest_size=16)
+        versions = f"{get_model_version()}:{get_model_version(engine)}"
+        digest.update(f"{engine}:{surface:d}:{model}:{versions}".encode())
+        return digest.hexdigest()
+
+    def get(self, key: Optional[str]) -> Optional[Any]:
+        """
+        Return a copy of the cached result, or None on a miss.
+        """
+        if key is None or not self.enabled:
+            return None
+        with self._lock:
+            self._check_model_version()
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        # Results are nested dicts and lists; callers must not mutate ours.
+        return copy.deepcopy(value)
+
+    def put(self, key: Optional[str], value: Any) -> None:
+        if key is None or not self.enabled:
+            return
+        with self._lock:
+            self._check_model_version()
+            self._entries[key] = (self.clock() + self.ttl_seconds, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _check_model_version(self) -> None:
+        version = get_model_version()
+        if version != self._model_version:
+            self._entries.clear()
+            self._model_version = version
+            self._invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Hit/miss counters and occupancy.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "size": len(self._entries),
+                "model_version": self._model_version,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+            }
+
+
+prediction_cache = PredictionCache.from_env()
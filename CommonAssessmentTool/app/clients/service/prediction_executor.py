@@ -0,0 +1,132 @@
+"""
+Dedicated executor for CPU-bound prediction work.
+
+Model calls run on a sized thread pool (or optionally a process pool) instead
+of the event loop, so auth and CRUD requests keep being served while a model
+runs. Admission is bounded: once every worker is busy and max_queue jobs are
+waiting, new work is rejected immediately with PredictionQueueFull so the
+endpoint can shed load instead of queueing without limit.
+"""
+
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from app.clients.service.prediction_metrics import LatencySample
+
+EXECUTOR_KINDS = ("thread", "process")
+
+
+class PredictionQueueFull(Exception):
+    """Raised when the prediction executor cannot accept more work."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Prediction queue is full")
+        self.retry_after = retry_after
+
+
+def _timed_call(fn: Callable, args: tuple):
+    # Module level so it can be pickled for process pools. time.monotonic is
+    # system-wide on Linux, so timestamps are comparable across processes.
+    started = time.monotonic()
+    result = fn(*args)
+    return started, time.monotonic(), result
+
+
+class PredictionExecutor:
+    """
+    Bounded executor with queue-wait and execution-time metrics.
+    """
+
+    def __init__(
+        self,
+        kind: str = "thread",
+        max_workers: int = 4,
+        max_queue: int = 64,
+        retry_after: int = 1,
+    ):
+        """
+        Args:
+            kind: "thread" or "process"
+            max_workers: Number of pool workers
+            max_queue: Jobs allowed to wait while all workers are busy
+            retry_after: Seconds suggested to rejected callers
+        """
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._pool: Executor = self._create_pool()
+        self._in_flight = 0
+        self._rejected = 0
+        self._queue_wait_ms = LatencySample()
+        self._execution_ms = LatencySample()
+
+    def _create_pool(self) -> Executor:
+        if self.kind == "process":
+            return ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="prediction"
+        )
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def is_saturated(self) -> bool:
+        return self._in_flight >= self.capacity
+
+    def check_capacity(self) -> None:
+        """
+        Raises:
+            PredictionQueueFull: If the queue is at capacity
+        """
+        if self.is_saturated():
+            self._rejected += 1
+            raise PredictionQueueFull(self.retry_after)
+
+    async def run(self, fn: Callable, *args: Any) -> Any:
+        """
+        Run fn(*args) on the pool.
+
+        Raises:
+            PredictionQueueFull: If the queue is at capacity
+        """
+        self.check_capacity()
+        self._in_flight += 1
+        submitted = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+            started, finished, result = await loop.run_in_executor(
+                self._pool, _timed_call, fn, args
+            )
+        finally:
+            self._in_flight -= 1
+        self._queue_wait_ms.add((started - submitted) * 1000)
+        self._execution_ms.add((finished - started) * 1000)
+        return result
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Queue depth, rejections and timing metrics.
+        """
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "queued": max(0, self._in_flight - self.max_workers),
+            "rejected": self._rejected,
+            "queue_wait_ms": self._queue_wait_ms.summary(),
+            "execution_ms": self._execution_ms.summary(),
+        }
@@ -0,0 +1,44 @@
+"""
+Lightweight in-process metrics for the prediction pipeline.
+"""
+
+from collections import deque
+from typing import Dict, Iterable
+
+# Number of recent observations kept for percentile metrics.
+SAMPLE_SIZE = 1024
+
+
+class LatencySample:
+    """
+    Fixed-size window of recent durations in milliseconds.
+    """
+
+    def __init__(self, size: int = SAMPLE_SIZE):
+        self._values: deque = deque(maxlen=size)
+        self.count = 0
+
+    def add(self, value_ms: float) -> None:
+        self._values.append(value_ms)
+        self.count += 1
+
+    def extend(self, values_ms: Iterable[float]) -> None:
+        for value_ms in values_ms:
+            self.add(value_ms)
+
+    def summary(self) -> Dict[str, float]:
+        """p50, p99 and max over the window, plus the lifetime count"""
+        values = sorted(self._values)
+        return {
+            "count": self.count,
+            "p50": percentile(values, 50),
+            "p99": percentile(values, 99),
+            "max": values[-1] if values else 0.0,
+        }
+
+
+def percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return sorted_values[index]
@@ -0,0 +1,149 @@
+"""
+Prediction service used by the prediction endpoints.
+
+Model calls run on a dedicated, bounded PredictionExecutor so they never
+block the event loop; when its queue is full, requests fail fast with
+PredictionQueueFull. Single-client requests additionally go through a
+micro-batcher, so requests arriving within a few milliseconds of each other
+share one stacked model call. Requests pick a tier: "standard" uses the
+configured prediction engine, "fast" the distilled student (see
+app.ml.distill); each tier has its own batchers.
+
+Configuration (environment variables):
+    PREDICTION_BATCH_MAX_WAIT_MS: Longest wait for a batch to fill (default 2)
+    PREDICTION_BATCH_MAX_SIZE: Batch size that flushes immediately (default 32)
+    PREDICTION_EXECUTOR: "thread" (default) or "process"
+    PREDICTION_WORKERS: Executor workers (default min(4, CPU count))
+    PREDICTION_MAX_QUEUE: Jobs allowed to wait for a worker (default 64)
+    PREDICTION_RETRY_AFTER_SECONDS: Retry-After sent when shedding (default 1)
+
+Results are cached by feature vector, see app.clients.service.prediction_cache.
+Served inputs are queued for the input drift monitor, see app.ml.drift, and
+served predictions for the prediction log, see app.ml.prediction_log.
+"""
+
+import os
+from functools import partial
+from typing import Any, Dict, List, Tuple
+
+from app.clients.service.logic import (
+    DEFAULT_PREDICTION_ENGINE,
+    ensemble_timings,
+    interpret_and_calculate_batch,
+    search_interventions,
+    serving_model,
+)
+from app.clients.service.prediction_batcher import PredictionBatcher
+from app.clients.service.prediction_cache import prediction_cache
+from app.clients.service.prediction_executor import PredictionExecutor
+from app.ml.drift import drift_monitor
+from app.ml.online import online_updater
+from app.ml.prediction_log import prediction_logger
+
+# Prediction engine of each tier; None is the PREDICTION_ENGINE default.
+TIER_ENGINES = {"standard": None, "fast": "fast"}
+# Engine whose model the intervention search walks
+SEARCH_ENGINE = "compiled"
+
+
+class PredictionService:
+    def __init__(
+        self,
+        batchers: Dict[Tuple[str, bool], PredictionBatcher],
+        executor: PredictionExecutor,
+    ):
+        """
+        Args:
+            batchers: Micro-batcher for every (tier, surface) pair
+            executor: Executor running model calls
+        """
+        self.batchers = batchers
+        self.executor = executor
+
+    @classmethod
+    def from_env(cls) -> "PredictionService":
+        executor = PredictionExecutor(
+            kind=os.getenv("PREDICTION_EXECUTOR", "thread"),
+            max_workers=int(
+                os.getenv("PREDICTION_WORKERS", str(min(4, os.cpu_count() or 1)))
+            ),
+            max_queue=int(os.getenv("PREDICTION_MAX_QUEUE", "64")),
+            retry_after=int(os.getenv("PREDICTION_RETRY_AFTER_SECONDS", "1")),
+        )
+        max_wait_ms = float(os.getenv("PREDICTION_BATCH_MAX_WAIT_MS", "2"))
+        max_batch_size = int(os.getenv("PREDICTION_BATCH_MAX_SIZE", "32"))
+        batchers = {
+            (tier, surface): PredictionBatcher(
+                partial(interpret_and_calculate_batch, engine=engine, surface=surface),
+                max_wait_ms=max_wait_ms,
+                max_batch_size=max_batch_size,
+                executor=executor,
+            )
+            for tier, engine in TIER_ENGINES.items()
+            for surface in (False, True)
+        }
+        return cls(batchers, executor)
+
+    async def predict(
+        self, input_data: Dict[str, Any], surface: bool = False, tier="standard"
+    ) -> Dict[str, Any]:
+        """Predict one client, batched with concurrent requests of its tier"""
+        self.executor.check_capacity()
+        result = await self.batchers[tier, surface].submit(input_data)
+        self._observe(tier, [input_data], [result])
+        return result
+
+    async def predict_batch(
+        self, inputs: List[Dict[str, Any]], surface: bool = False, tier="standard"
+    ) -> List[Dict]:
+        """Predict many clients in one executor job"""
+        results = await self.executor.run(
+            partial(
+                interpret_and_calculate_batch,
+                engine=TIER_ENGINES[tier],
+                surface=surface,
+            ),
+            inputs,
+        )
+        self._observe(tier, inputs, results)
+        return results
+
+    @staticmethod
+    def serving_model(tier: str = "standard") -> str:
+        """Label of the model a tier's predictions come from"""
+        return serving_model(TIER_ENGINES[tier])
+
+    @staticmethod
+    def _observe(tier: str, inputs: List[Dict], results: List[Dict]) -> None:
+        """Queue served predictions for the drift monitor and prediction log"""
+        engine = TIER_ENGINES[tier] or DEFAULT_PREDICTION_ENGINE
+        drift_monitor.observe(inputs)
+        prediction_logger.log(inputs, results, engine, serving_model(engine))
+
+    async def search(self, input_data: Dict[str, Any], **constraints) -> Dict:
+        """
+        Constrained top-k intervention search for one client; it walks the
+        shipped forest of SEARCH_ENGINE whatever the configured engine
+        """
+        return await self.executor.run(
+            partial(search_interventions, input_data, **constraints)
+        )
+
+    def metrics(self) -> Dict[str, Any]:
+        """Operational metrics of the prediction pipeline"""
+        batchers = {}
+        for (tier, surface), batcher in self.batchers.items():
+            prefix = "" if tier == "standard" else f"{tier}_"
+            name = f"{prefix}{'surface_' if surface else ''}batcher"
+            batchers[name] = batcher.stats()
+        return {
+            **batchers,
+            "executor": self.executor.stats(),
+            "cache": prediction_cache.stats(),
+            "ensemble": ensemble_timings(),
+            "online": online_updater.stats(),
+            "prediction_log": prediction_logger.stats(),
+        }
+
+
+prediction_service = PredictionService.from_env()
@@ -0,0 +1,324 @@
+"""
+Precomputed intervention recommendations.
+
+A background job reads clients in id-ordered chunks, scores each chunk with
+one batched model call and bulk-upserts the results into the
+client_recommendations table. Reads serve the stored row by primary key and
+fall back to live scoring when the row is missing or stale, i.e. scored by
+another model than the one the prediction engine serves now (see
+app.clients.service.logic.serving_model), older than the maximum age, or
+scored from features read before the client's last predictive change (see
+app.clients.service.rescore_queue).
+
+Only one worker process per host runs the background job: the first to take
+an exclusive lock on RECOMMENDATIONS_LOCK_PATH keeps it until it stops, and
+the others retry at every interval, taking over if that process exits.
+
+Configuration (environment variables):
+    RECOMMENDATIONS_MAX_AGE_SECONDS: Age after which a row is stale
+        (default 86400)
+    RECOMMENDATIONS_REFRESH_SECONDS: Interval of the background job, 0
+        disables it (default 3600)
+    RECOMMENDATIONS_CHUNK_SIZE: Clients read and scored per chunk (default 500)
+    RECOMMENDATIONS_LOCK_PATH: Lock file electing the refreshing process
+        (default app/ml/models/recommendations.lock)
+"""
+
+import fcntl
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import IO, Any, Callable, Dict, Iterable, List, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.clients.service.client_repository import SQLAlchemyClientRepository
+from app.clients.service.columnar_preprocessing import CLIENT_COLUMNS, encode_frame
+from app.clients.service.logic import (
+    resolve_serving_model,
+    score_batch,
+    serving_model,
+    summarize_predictions,
+)
+from app.clients.service.prediction_service import prediction_service
+from app.clients.service.rescore_queue import RescoreWorker, dirty_clients
+from app.database import SessionLocal
+from app.ml.model_list import MODELS_DIR
+from app.models import Client, ClientRecommendation
+
+logger = logging.getLogger(__name__)
+
+MAX_AGE = timedelta(
+    seconds=float(os.getenv("RECOMMENDATIONS_MAX_AGE_SECONDS", "86400"))
+)
+REFRESH_SECONDS = float(os.getenv("RECOMMENDATIONS_REFRESH_SECONDS", "3600"))
+CHUNK_SIZE = int(os.getenv("RECOMMENDATIONS_CHUNK_SIZE", "500"))
+LOCK_PATH = os.getenv(
+    "RECOMMENDATIONS_LOCK_PATH", os.path.join(MODELS_DIR, "recommendations.lock")
+)
+
+# Dialect-specific inserts; both support on_conflict_do_update.
+UPSERT_DIALECTS: Dict[str, Callable[..., Any]] = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+
+def utcnow() -> datetime:
+    # Stored as naive UTC, like the other timestamps of the app.
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class RecommendationService:
+    @staticmethod
+    def is_stale(row: ClientRecommendation, now: Optional[datetime] = None) -> bool:
+        """Whether a stored row must be re-scored before it is served"""
+        now = now or utcnow()
+        changed_at = row.features_changed_at
+        return bool(
+            row.model_version != resolve_serving_model()
+            or now - row.scored_at > MAX_AGE
+            or (changed_at is not None and changed_at >= row.scored_at)
+        )
+
+    @staticmethod
+    def to_response(row: ClientRecommendation, source: str) -> Dict[str, Any]:
+        return {
+            "client_id": row.client_id,
+            "baseline": row.baseline,
+            "interventions": row.interventions,
+            "model_version": row.model_version,
+            "scored_at": row.scored_at,
+            "source": source,
+        }
+
+    @staticmethod
+    async def get_recommendations(db: Session, client_id: int) -> Dict[str, Any]:
+        """Serve stored recommendations, re-scoring live when stale"""
+        row = db.get(ClientRecommendation, client_id)
+        if row is not None and not RecommendationService.is_stale(row):
+            return RecommendationService.to_response(row, "precomputed")
+
+        # Taken before the features are read, see score_clients.
+        scored_at = utcnow()
+        client = db.get(Client, client_id)
+        if client is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Client with id {client_id} not found",
+            )
+        features = {column: getattr(client, column) for column in CLIENT_COLUMNS}
+        result = await prediction_service.predict(features)
+        RecommendationService.upsert(
+            db,
+            [
+                RecommendationService.to_row(
+                    client_id, result, serving_model(), scored_at
+                )
+            ],
+        )
+        db.expire_all()
+        row = db.get(ClientRecommendation, client_id)
+        assert row is not None
+        return RecommendationService.to_response(row, "live")
+
+    @staticmethod
+    def to_row(
+        client_id: int,
+        result: Dict[str, Any],
+        model_version: str,
+        scored_at: Optional[datetime] = None,
+    ) -> Dict[str, Any]:
+        """Table row for one interpret_and_calculate result"""
+        return {
+            "client_id": client_id,
+            "baseline": float(result["baseline"]),
+            "interventions": [
+                [float(score), list(names)] for score, names in result["interventions"]
+            ],
+            "model_version": model_version,
+            "scored_at": scored_at or utcnow(),
+        }
+
+    @staticmethod
+    def upsert(db: Session, rows: List[Dict[str, Any]]) -> None:
+        """Insert or replace many rows in one statement"""
+        if not rows:
+            return
+        insert = UPSERT_DIALECTS[db.get_bind().dialect.name]
+        statement = insert(ClientRecommendation)
+        statement = statement.on_conflict_do_update(
+            index_elements=[ClientRecommendation.client_id],
+            set_={
+                column: statement.excluded[column]
+                for column in (
+                    "baseline",
+                    "interventions",
+                    "model_version",
+                    "scored_at",
+                )
+            },
+        )
+        db.execute(statement, rows)
+        db.commit()
+
+    @staticmethod
+    def score_clients(
+        db: Session,
+        client_ids: Optional[Iterable[int]] = None,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> Dict[str, Any]:
+        """Score clients chunk by chunk and upsert their recommendations"""
+        started = time.perf_counter()
+        scored = skipped = 0
+        repo = SQLAlchemyClientRepository(db)
+        chunks = repo.iter_feature_chunks(chunk_size, client_ids)
+        while True:
+            # Taken before the chunk is read, so a client changed while it is
+            # being scored stays stale.
+            scored_at = utcnow()
+            frame = next(chunks, None)
+            if frame is None:
+                break
+            # Clients with missing predictive fields cannot be scored.
+            complete = frame.dropna()
+            skipped += len(frame) - len(complete)
+            if complete.empty:
+                continue
+            baselines, predictions = score_batch(encode_frame(complete))
+            model_version = serving_model()
+            RecommendationService.upsert(
+                db,
+                [
+                    RecommendationService.to_row(
+                        int(client_id),
+                        summarize_predictions(baseline, combination_predictions),
+                        model_version,
+                        scored_at,
+                    )
+                    for client_id, baseline, combination_predictions in zip(
+                        complete["id"], baselines, predictions
+                    )
+                ],
+            )
+            scored += len(complete)
+        return {
+            "scored": scored,
+            "skipped": skipped,
+            "seconds": time.perf_counter() - started,
+            "model_version": serving_model(),
+        }
+
+
+class RecommendationRefreshJob:
+    """
+    Daemon thread re-scoring every client at a fixed interval, in the one
+    process on the host that holds the lock file.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        interval_seconds: float = REFRESH_SECONDS,
+        chunk_size: int = CHUNK_SIZE,
+        lock_path: str = LOCK_PATH,
+    ):
+        self.session_factory = session_factory
+        self.interval_seconds = interval_seconds
+        self.chunk_size = chunk_size
+        self.lock_path = lock_path
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._lock_file: Optional[IO[str]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_leader(self) -> bool:
+        """Whether this process holds the lock and runs the refresh"""
+        return self._lock_file is not None
+
+    def acquire(self) -> bool:
+        """
+        Take the lock file without waiting, keeping it until release().
+
+        Returns:
+            bool: True if this process now holds the lock
+        """
+        if self._lock_file is None:
+            os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+            lock_file = open(self.lock_path, "w")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+        return True
+
+    def release(self) -> None:
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def run_once(self) -> Dict[str, Any]:
+        db = self.session_factory()
+        try:
+            self.last_run = RecommendationService.score_clients(
+                db, chunk_size=self.chunk_size
+            )
+        finally:
+            db.close()
+        logger.info("Refreshed recommendations: %s", self.last_run)
+        return self.last_run
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            if self.acquire():
+                try:
+                    self.run_once()
+                except Exception:
+                    logger.exception("Recommendation refresh failed")
+            self._stop.wait(self.interval_seconds)
+
+    def start(self) -> None:
+        if self.interval_seconds <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._loop, name="recommendation-refresh", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.release()
+
+
+def rescore_clients(client_ids: List[int]) -> Dict[str, Any]:
+    """Re-score the given clients in a session of their own"""
+    db = SessionLocal()
+    try:
+        return RecommendationService.score_clients(db, client_ids=client_ids)
+    finally:
+        db.close()
+
+
+def stale_client_ids() -> List[int]:
+    """Clients changed since they were scored, e.g. before a restart"""
+    db = SessionLocal()
+    try:
+        return SQLAlchemyClientRepository(db).get_stale_recommendation_ids()
+    finally:
+        db.close()
+
+
+recommendation_job = RecommendationRefreshJob(SessionLocal)
+rescore_worker = RescoreWorker(dirty_clients, rescore_clients, stale_client_ids)
@@ -0,0 +1,232 @@
+"""
+Queue of clients whose predictive features changed since they were scored.
+
+Client updates mark a client dirty only when one of the 24 model input
+fields actually changes value. A background worker drains the queue in
+batches and re-scores just those clients, so keeping recommendations fresh
+costs work proportional to the write rate rather than to the table size.
+
+The queue is per process. Whether a stored row is stale is recorded in the
+database (client_recommendations.features_changed_at), so every worker
+stops serving it at once, and a starting worker queues the clients left
+stale, e.g. by a restart.
+
+Configuration (environment variables):
+    RESCORE_BATCH_SIZE: Most clients re-scored per batch (default 100)
+    RESCORE_MAX_WAIT_SECONDS: How long the worker lets updates accumulate
+        before re-scoring a partial batch (default 1)
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from app.clients.service.columnar_preprocessing import CLIENT_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("RESCORE_BATCH_SIZE", "100"))
+MAX_WAIT_SECONDS = float(os.getenv("RESCORE_MAX_WAIT_SECONDS", "1"))
+
+
+def changed_predictive_fields(client: Any, update_data: Dict[str, Any]) -> List[str]:
+    """
+    Names of model input fields whose value an update would change.
+
+    Args:
+        client: Client ORM object, before the update is applied
+        update_data (dict): Field name to new value
+
+    Returns:
+        list: Changed predictive field names, empty if none changed
+    """
+    return [
+        field
+        for field in CLIENT_COLUMNS
+        if field in update_data and getattr(client, field) != update_data[field]
+    ]
+
+
+class DirtyClientQueue:
+    """
+    Thread-safe, de-duplicating set of client ids waiting to be re-scored.
+    """
+
+    def __init__(self):
+        self._pending: Dict[int, None] = {}
+        self._in_flight: set = set()
+        self._condition = threading.Condition()
+        self._marked = 0
+
+    def mark_dirty(self, client_id: int) -> None:
+        with self._condition:
+            self._pending[client_id] = None
+            self._marked += 1
+            self._condition.notify()
+
+    def is_dirty(self, client_id: int) -> bool:
+        """Whether the client is waiting for or undergoing re-scoring"""
+        with self._condition:
+            return client_id in self._pending or client_id in self._in_flight
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait up to timeout for dirty clients, True if any are pending"""
+        with self._condition:
+            if not self._pending:
+                self._condition.wait(timeout)
+            return bool(self._pending)
+
+    def wake(self) -> None:
+        """Release threads blocked in wait()"""
+        with self._condition:
+            self._condition.notify_all()
+
+    def take(self, max_items: int) -> List[int]:
+        """
+        Claim at most max_items dirty clients.
+
+        Claimed ids stay dirty until done() is called for them.
+        """
+        with self._condition:
+            batch = list(self._pending)[:max_items]
+            for client_id in batch:
+                del self._pending[client_id]
+            self._in_flight.update(batch)
+            return batch
+
+    def done(self, client_ids: Iterable[int]) -> None:
+        with self._condition:
+            self._in_flight.difference_update(client_ids)
+
+    def retry(self, client_ids: Iterable[int]) -> None:
+        """Put claimed ids back, e.g. after a failed re-score"""
+        with self._condition:
+            for client_id in client_ids:
+                self._in_flight.discard(client_id)
+                self._pending[client_id] = None
+
+    def clear(self) -> None:
+        with self._condition:
+            self._pending.clear()
+            self._in_flight.clear()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            return {
+                "pending": len(self._pending),
+                "in_flight": len(self._in_flight),
+                "marked": self._marked,
+            }
+
+
+class RescoreWorker:
+    """
+    Daemon thread draining a DirtyClientQueue in batches.
+    """
+
+    def __init__(
+        self,
+        queue: DirtyClientQueue,
+        rescore: Callable[[List[int]], Any],
+        pending: Optional[Callable[[], Iterable[int]]] = None,
+        batch_size: int = BATCH_SIZE,
+        max_wait_seconds: float = MAX_WAIT_SECONDS,
+    ):
+        """
+        Args:
+            queue: Queue to drain
+            rescore: Re-scores and stores the given client ids
+            pending: Returns the ids of clients already stale at start
+            batch_size: Most clients re-scored per call
+            max_wait_seconds: Time updates may accumulate into one batch
+        """
+        self.queue = queue
+        self.rescore = rescore
+        self.pending = pending
+        self.batch_size = batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.batches = 0
+        self.rescored = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> int:
+        """
+        Re-score one batch of dirty clients.
+
+        Returns:
+            int: Number of clients re-scored
+        """
+        batch = self.queue.take(self.batch_size)
+        if not batch:
+            return 0
+        try:
+            self.rescore(batch)
+        except Exception:
+            self.queue.retry(batch)
+            raise
+        self.queue.done(batch)
+        self.batches += 1
+        self.rescored += len(batch)
+        return len(batch)
+
+    def queue_pending(self) -> int:
+        """
+        Queue the clients that were already stale, e.g. before a restart.
+
+        Returns:
+            int: Number of clients queued
+        """
+        if self.pending is None:
+            return 0
+        client_ids = list(self.pending())
+        for client_id in client_ids:
+            self.queue.mark_dirty(client_id)
+        return len(client_ids)
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            if not self.queue.wait(self.max_wait_seconds):
+                continue
+            if len(self.queue) < self.batch_size:
+                # Let a burst of updates accumulate into one batch.
+                self._stop.wait(self.max_wait_seconds)
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Re-scoring dirty clients failed")
+                self._stop.wait(self.max_wait_seconds)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        try:
+            self.queue_pending()
+        except Exception:
+            logger.exception("Reading stale clients failed")
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._loop, name="client-rescore", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.queue.wake()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.queue.stats(),
+            "batches": self.batches,
+            "rescored": self.rescored,
+        }
+
+
+dirty_clients = DirtyClientQueue()
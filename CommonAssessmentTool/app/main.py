@@ -4,29 +4,76 @@ This module initializes the FastAPI application and includes all routers.
 Handles database initialization and CORS middleware configuration.
 """
 
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app import models
+from app.analytics.router import router as analytics_router
 from app.auth.router import router as auth_router
 from app.clients.router import router as clients_router
+from app.clients.service.recommendation_service import (
+    recommendation_job,
+    rescore_worker,
+)
 from app.database import engine
+from app.ml.drift import drift_monitor
+from app.ml.model_list import warm_up_models
+from app.ml.model_state import watcher as model_state_watcher
+from app.ml.online import online_updater
+from app.ml.prediction_log import prediction_logger
+from app.ml.retrain import retrain_scheduler
 from app.ml.router import router as ml_router
+from app.ml.traffic import shadow_scorer
 
 # Initialize database tables
 models.Base.metadata.create_all(bind=engine)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Models load lazily on first use; optionally warm them up in the background
+    if os.getenv("MODEL_WARMUP", "1") != "0":
+        warm_up_models()
+    # Adopt models switched by other workers without blocking requests
+    model_state_watcher.start()
+    # Keep precomputed recommendations fresh in the background
+    recommendation_job.start()
+    rescore_worker.start()
+    # Apply recorded outcomes to the online model
+    online_updater.start()
+    # Retrain when enough outcomes are recorded or inputs drift
+    retrain_scheduler.start()
+    # Compare served prediction inputs with the training data
+    drift_monitor.start()
+    # Write served predictions to the prediction log in bulk
+    prediction_logger.start()
+    yield
+    prediction_logger.stop()
+    drift_monitor.stop()
+    retrain_scheduler.stop()
+    online_updater.stop()
+    rescore_worker.stop()
+    recommendation_job.stop()
+    model_state_watcher.stop()
+    shadow_scorer.shutdown()
+
+
 # Create FastAPI application
 app = FastAPI(
     title="Case Management API",
     description="API for managing client cases",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Include routers
 app.include_router(auth_router)
 app.include_router(clients_router)
 app.include_router(ml_router)
+app.include_router(analytics_router)
 
 # Configure CORS middleware
 app.add_middleware(
@@ -0,0 +1,230 @@
+"""
+Memory-mapped model artifacts.
+
+An artifact is a directory holding one uncompressed ``.npy`` file per array
+and a ``meta.json`` describing the model kind and its scalar parameters.
+Arrays are opened with ``np.load(mmap_mode="r")``, so every worker process on
+a host maps the same page-cache pages instead of keeping a private heap copy
+of the model. Loading only needs NumPy; scikit-learn is only used to export.
+
+Artifacts are written once. Replacing one that workers load leaves a moment
+in which it does not exist, so new models are published as new registry
+versions instead (see app.ml.registry). Export a pickled scikit-learn model
+with (--overwrite replaces an existing artifact, with no worker running):
+
+    python -m app.ml.artifacts app/clients/service/model.pkl \\
+        app/clients/service/model_forest
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from typing import Any, Dict
+
+import numpy as np
+
+from app.ml.ensemble import EnsembleModel
+from app.ml.forest import CompiledForest
+from app.ml.linear import LinearModel
+from app.ml.neural import MLPModel
+from app.ml.online import OnlineRidge
+
+FORMAT_VERSION = 1
+META_FILE = "meta.json"
+
+MODEL_KINDS: Dict[str, Any] = {
+    CompiledForest.kind: CompiledForest,
+    EnsembleModel.kind: EnsembleModel,
+    LinearModel.kind: LinearModel,
+    MLPModel.kind: MLPModel,
+    OnlineRidge.kind: OnlineRidge,
+}
+
+
+def save_artifact(path, kind, arrays, meta=None, overwrite=False):
+    """
+    Write arrays and metadata to an artifact directory.
+
+    The directory is written next to its destination and renamed into place,
+    so a new artifact appears complete or not at all. Overwriting removes the
+    existing artifact first; a process loading it in between fails, so only
+    overwrite artifacts that no running worker loads.
+
+    Args:
+        path (str): Destination directory
+        kind (str): Model kind, a key of MODEL_KINDS
+        arrays (dict): Array name to np.array
+        meta (dict): Extra JSON-serializable metadata
+        overwrite (bool): Replace an existing artifact at path
+
+    Raises:
+        FileExistsError: If path exists and overwrite is False
+    """
+    path = os.path.abspath(path)
+    if not overwrite and os.path.exists(path):
+        raise FileExistsError(f"Artifact {path} exists; pass overwrite to replace it")
+    staging_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(staging_path, ignore_errors=True)
+    os.makedirs(staging_path)
+    for name, array in arrays.items():
+        np.save(os.path.join(staging_path, f"{name}.npy"), np.ascontiguousarray(array))
+    full_meta = dict(meta or {})
+    full_meta.update(
+        {"kind": kind, "format_version": FORMAT_VERSION, "arrays": sorted(arrays)}
+    )
+    with open(os.path.join(staging_path, META_FILE), "w") as meta_file:
+        json.dump(full_meta, meta_file, indent=2, sort_keys=True)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(staging_path, path)
+
+
+def read_meta(path):
+    """
+    Read an artifact's metadata without touching its arrays.
+
+    Args:
+        path (str): Artifact directory
+
+    Returns:
+        dict: Parsed meta.json
+    """
+    with open(os.path.join(path, META_FILE)) as meta_file:
+        meta = json.load(meta_file)
+    if meta.get("format_version") != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported artifact format {meta.get('format_version')} at {path}"
+        )
+    return meta
+
+
+def artifact_digest(path):
+    """
+    Content digest of an artifact, stable across processes and restarts.
+
+    Args:
+        path (str): Artifact directory
+
+    Returns:
+        str: 16 hex characters identifying the artifact's meta and arrays
+    """
+    meta = read_meta(path)
+    digest = hashlib.blake2b(digest_size=8)
+    for name in [META_FILE] + [f"{array}.npy" for array in meta["arrays"]]:
+        with open(os.path.join(path, name), "rb") as artifact_file:
+            for block in iter(lambda: artifact_file.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def load_artifact(path, mmap=True):
+    """
+    Open an artifact's arrays.
+
+    Args:
+        path (str): Artifact directory
+        mmap (bool): Map arrays read-only instead of reading them into memory
+
+    Returns:
+        tuple: (meta dict, dict of array name to np.array)
+    """
+    meta = read_meta(path)
+    arrays = {
+        # np.asarray drops the memmap subclass but keeps the mapped buffer.
+        name: np.asarray(
+            np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+        )
+        for name in meta["arrays"]
+    }
+    return meta, arrays
+
+
+def load_model(path, mmap=True):
+    """
+    Load an artifact into its NumPy runtime model.
+
+    Args:
+        path (str): Artifact directory
+        mmap (bool): Map arrays read-only instead of reading them into memory
+
+    Returns:
+        CompiledForest, LinearModel, MLPModel or EnsembleModel
+    """
+    meta, arrays = load_artifact(path, mmap=mmap)
+    if meta["kind"] not in MODEL_KINDS:
+        raise ValueError(f"Unknown model kind '{meta['kind']}' at {path}")
+    return MODEL_KINDS[meta["kind"]].from_artifact(arrays, meta)
+
+
+def save_model(model, path, meta=None, overwrite=False):
+    """
+    Write a runtime model to an artifact directory.
+
+    Args:
+        model: CompiledForest, LinearModel, MLPModel or EnsembleModel
+        path (str): Destination directory
+        meta (dict): Extra JSON-serializable metadata
+        overwrite (bool): Replace an existing artifact, see save_artifact
+    """
+    arrays, model_meta = model.to_artifact()
+    model_meta.update(meta or {})
+    save_artifact(path, model.kind, arrays, model_meta, overwrite)
+
+
+def from_sklearn(estimator):
+    """
+    Convert a fitted scikit-learn estimator into its NumPy runtime model.
+
+    Args:
+        estimator: Fitted forest, linear model or MLP
+
+    Returns:
+        CompiledForest, LinearModel or MLPModel
+    """
+    if hasattr(estimator, "estimators_"):
+        return CompiledForest.from_sklearn(estimator)
+    if hasattr(estimator, "coefs_"):
+        return MLPModel.from_sklearn(estimator)
+    if hasattr(estimator, "coef_"):
+        return LinearModel.from_sklearn(estimator)
+    raise ValueError(f"Cannot export estimator of type {type(estimator).__name__}")
+
+
+def export_sklearn_model(estimator, path, meta=None, overwrite=False):
+    """
+    Convert a fitted scikit-learn estimator and write it as an artifact.
+
+    Args:
+        estimator: Fitted forest, linear model or MLP
+        path (str): Destination directory
+        meta (dict): Extra JSON-serializable metadata
+        overwrite (bool): Replace an existing artifact, see save_artifact
+
+    Returns:
+        The exported runtime model
+    """
+    model = from_sklearn(estimator)
+    save_model(model, path, meta, overwrite)
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a pickled model.")
+    parser.add_argument("model_path", help="Pickled scikit-learn estimator")
+    parser.add_argument("output_path", help="Destination artifact directory")
+    parser.add_argument(
+        "--overwrite", action="store_true", help="Replace an existing artifact"
+    )
+    args = parser.parse_args()
+    with open(args.model_path, "rb") as model_file:
+        estimator = pickle.load(model_file)
+    model = export_sklearn_model(estimator, args.output_path, overwrite=args.overwrite)
+    print(
+        f"Exported {type(estimator).__name__} as '{model.kind}' to {args.output_path}"
+    )
+
+
+if __name__ == "__main__":
+    main()
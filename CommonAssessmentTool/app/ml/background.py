@@ -0,0 +1,117 @@
+"""
+Bounded in-memory queue drained in batches by a daemon thread.
+
+Serving threads only append items to the queue, without waiting; when it
+holds max_pending items new ones are dropped and counted instead. The
+thread wakes once batch_size items are queued, or max_wait_seconds after it
+last woke, and hands them to run_once() in batches of at most batch_size.
+A failed batch is logged and the thread waits max_wait_seconds before the
+next one.
+"""
+
+import logging
+import threading
+from collections import deque
+from typing import Any, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class QueueWorker:
+    """
+    Base of background consumers of a bounded queue. Subclasses implement
+    run_once(), which takes its batch with _take().
+    """
+
+    thread_name = "queue-worker"
+    failure_message = "Processing queued items failed"
+
+    def __init__(self, batch_size: int, max_wait_seconds: float, max_pending: int):
+        """
+        Args:
+            batch_size (int): Most items taken per batch
+            max_wait_seconds (float): Longest time items wait for a batch
+            max_pending (int): Items queued before new ones are dropped
+        """
+        self.batch_size = batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.max_pending = max_pending
+        self._pending: deque = deque()
+        self._condition = threading.Condition()
+        self.dropped = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _enqueue(self, items: Iterable[Any], count: int) -> bool:
+        """
+        Queue items, or drop all of them if they do not fit.
+
+        Args:
+            items: The items, consumed only if queued
+            count (int): Number of items
+
+        Returns:
+            bool: False if the queue was full and the items were dropped
+        """
+        with self._condition:
+            if len(self._pending) + count > self.max_pending:
+                self.dropped += count
+                return False
+            self._pending.extend(items)
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+        return True
+
+    def _take(self) -> List[Any]:
+        with self._condition:
+            count = min(self.batch_size, len(self._pending))
+            return [self._pending.popleft() for _ in range(count)]
+
+    @property
+    def pending(self) -> int:
+        with self._condition:
+            return len(self._pending)
+
+    def run_once(self) -> int:
+        """
+        Process one batch of queued items.
+
+        Returns:
+            int: Number of items processed
+        """
+        raise NotImplementedError
+
+    def _work(self) -> None:
+        """One wakeup of the thread; subclasses add periodic work here"""
+        self.run_once()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            with self._condition:
+                if len(self._pending) < self.batch_size:
+                    self._condition.wait(self.max_wait_seconds)
+            if self._stop.is_set():
+                break
+            try:
+                self._work()
+            except Exception:
+                logger.exception(self.failure_message)
+                self._stop.wait(self.max_wait_seconds)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._loop, name=self.thread_name, daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the thread; items still queued stay queued"""
+        self._stop.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
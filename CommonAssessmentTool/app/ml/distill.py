@@ -0,0 +1,230 @@
+"""
+Distilled fast tier of the intervention forest.
+
+Every recommendation walks the 100 trees of the intervention forest (the
+teacher) for 129 rows per client. The student maps the 24 client features
+straight to the teacher's whole response over the 128 intervention
+combinations: a small multi-output forest whose leaves hold a 128-value
+surface each. Serving a client is one row through a handful of trees,
+exported to a float32 CompiledForest, so the fast tier stays NumPy only.
+
+The student is fit on teacher predictions for sampled clients: half are
+rows of the training data, half combine columns of different rows, which
+covers feature combinations the data lacks. The report compares the
+student with the teacher on separately sampled clients:
+
+    mae               mean absolute error over all 128 combinations
+    top3_agreement    share of the student's best 3 combinations that score
+                      within the teacher's best 3 (ties count as agreeing)
+    top3_regret       mean teacher-score shortfall of the student's best 3
+    latency           p50/p99 per single-client score_batch call, teacher
+                      engines and the student
+
+Distill, report and register the student as the fast tier engine's
+FAST_MODEL (see app.clients.service.logic) with:
+
+    python -m app.ml.distill [--clients 20000] [--trees 8] [--leaves 1024]
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from app.ml.forest import CompiledForest
+
+
+def sample_clients(data: np.ndarray, count: int, rng: np.random.RandomState):
+    """
+    Sample client feature rows for distillation.
+
+    Args:
+        data (np.array): Client features of the training data, shape (m, 24)
+        count (int): Number of clients
+        rng (np.random.RandomState): Random state
+
+    Returns:
+        np.array: Clients of shape (count, 24); the first half are data rows,
+            the rest draw every column from a different random row
+    """
+    real = data[rng.randint(len(data), size=count // 2)]
+    mixed = np.column_stack(
+        [
+            data[rng.randint(len(data), size=count - len(real)), column]
+            for column in range(data.shape[1])
+        ]
+    )
+    return np.vstack([real, mixed])
+
+
+def train_student(
+    clients: np.ndarray,
+    surfaces: np.ndarray,
+    n_trees: int = 8,
+    max_leaves: int = 1024,
+    seed: int = 0,
+) -> CompiledForest:
+    """
+    Fit a multi-output forest from client features to teacher surfaces.
+
+    Args:
+        clients (np.array): Client features of shape (n, 24)
+        surfaces (np.array): Teacher predictions of shape (n, 128), ordered
+            like intervention_permutations
+        n_trees (int): Trees in the student
+        max_leaves (int): Leaves per tree
+        seed (int): Random seed
+
+    Returns:
+        CompiledForest: Student with float32 leaf surfaces
+    """
+    from sklearn.ensemble import RandomForestRegressor
+
+    forest = RandomForestRegressor(
+        n_estimators=n_trees,
+        max_features=0.5,
+        max_leaf_nodes=max_leaves,
+        random_state=seed,
+        n_jobs=-1,
+    ).fit(clients, surfaces)
+    student = CompiledForest.from_sklearn(forest)
+    # Halves the artifact; the error is far below the student's own.
+    student.value = student.value.astype(np.float32)
+    return student
+
+
+def fidelity(student_surfaces: np.ndarray, teacher_surfaces: np.ndarray):
+    """
+    How closely student surfaces follow the teacher's.
+
+    Args:
+        student_surfaces (np.array): Student predictions of shape (n, 128)
+        teacher_surfaces (np.array): Teacher predictions of shape (n, 128)
+
+    Returns:
+        dict: mae, max_error, top3_agreement and top3_regret
+    """
+    errors = np.abs(student_surfaces - teacher_surfaces)
+    picks = np.argsort(-student_surfaces, axis=1, kind="stable")[:, :3]
+    picked = np.sort(np.take_along_axis(teacher_surfaces, picks, axis=1), axis=1)
+    best = np.sort(teacher_surfaces, axis=1)[:, -3:]
+    return {
+        "mae": float(errors.mean()),
+        "max_error": float(errors.max()),
+        "top3_agreement": float((picked >= best[:, :1]).mean()),
+        "top3_regret": float((best - picked).mean()),
+    }
+
+
+def time_per_client(score, clients: np.ndarray, repeats: int = 1) -> Dict[str, float]:
+    """
+    p50 and p99 milliseconds of score(rows) for single clients.
+    """
+    timings = []
+    for _ in range(repeats):
+        for client in clients:
+            start = time.perf_counter()
+            score([client])
+            timings.append((time.perf_counter() - start) * 1000)
+    p50, p99 = np.percentile(timings, [50, 99])
+    return {"p50_ms": float(p50), "p99_ms": float(p99)}
+
+
+def distill(
+    n_clients: int = 20000,
+    n_eval: int = 1000,
+    n_trees: int = 8,
+    max_leaves: int = 1024,
+    seed: int = 0,
+    data_path: Optional[str] = None,
+):
+    """
+    Distill the intervention forest and report fidelity against latency.
+
+    Args:
+        n_clients (int): Sampled clients to train on
+        n_eval (int): Separately sampled clients to report on
+        n_trees (int): Trees in the student
+        max_leaves (int): Leaves per tree
+        seed (int): Random seed
+        data_path (str): Training CSV, the service's data_commontool.csv
+            when omitted
+
+    Returns:
+        tuple: (CompiledForest student, report dict)
+    """
+    import pandas as pd
+
+    from app.clients.service import logic
+    from app.clients.service.columnar_preprocessing import CLIENT_COLUMNS
+    from app.ml.registry import data_hash
+
+    data = pd.read_csv(data_path or logic.DATA_PATH)[CLIENT_COLUMNS].to_numpy()
+    rng = np.random.RandomState(seed)
+    clients = sample_clients(data, n_clients, rng)
+    holdout = sample_clients(data, n_eval, rng)
+
+    start = time.perf_counter()
+    surfaces = logic.score_batch(clients, "compiled")[1]
+    teacher_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    student = train_student(clients, surfaces, n_trees, max_leaves, seed)
+    fit_seconds = time.perf_counter() - start
+
+    report: Dict[str, Any] = {
+        "teacher": logic.MODEL_VERSION,
+        "training_data_hash": data_hash(clients, surfaces),
+        "clients": n_clients,
+        "trees": n_trees,
+        "max_leaves": max_leaves,
+        "teacher_seconds": round(teacher_seconds, 2),
+        "fit_seconds": round(fit_seconds, 2),
+        **fidelity(student.predict(holdout), logic.score_batch(holdout, "compiled")[1]),
+    }
+    timed = holdout[:200]
+    report["latency"] = {
+        "compiled": time_per_client(
+            lambda rows: logic.score_batch(rows, "compiled"), timed
+        ),
+        "partial": time_per_client(
+            lambda rows: logic.score_batch(rows, "partial"), timed
+        ),
+        "student": time_per_client(student.predict, timed, repeats=5),
+    }
+    return student, report
+
+
+def main():
+    from app.clients.service.columnar_preprocessing import CLIENT_COLUMNS
+    from app.clients.service.logic import FAST_MODEL
+    from app.ml.model_list import registry
+
+    parser = argparse.ArgumentParser(description="Distill the intervention forest.")
+    parser.add_argument("--clients", type=int, default=20000)
+    parser.add_argument("--eval-clients", type=int, default=1000)
+    parser.add_argument("--trees", type=int, default=8)
+    parser.add_argument("--leaves", type=int, default=1024)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--name", default=FAST_MODEL)
+    parser.add_argument("--no-register", action="store_true")
+    args = parser.parse_args()
+
+    student, report = distill(
+        args.clients, args.eval_clients, args.trees, args.leaves, args.seed
+    )
+    print(json.dumps(report, indent=2))
+    if not args.no_register:
+        metadata = registry.register(
+            args.name,
+            student,
+            CLIENT_COLUMNS,
+            report["training_data_hash"],
+            {"distillation": report},
+        )
+        print(f"Registered {args.name} version {metadata['version']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+"""
+Input drift between client features and a reference dataset.
+
+Every client feature is binned with edges fixed by the reference data:
+features with few distinct values (flags, scales, coded labels) get one bin
+per value, the others quantile bins. FeatureHistograms accumulates bin
+counts batch by batch in fixed memory, so the current population can be
+streamed in chunks of any size, and population_stability_index compares
+two histograms per feature:
+
+    PSI = sum((current% - reference%) * ln(current% / reference%))
+
+By convention a PSI below 0.1 is no shift, up to 0.25 a moderate shift and
+above 0.25 a significant one.
+
+ReservoirSample keeps a uniform sample of fixed size of every row added, the
+quantile sketch of the current population: its quantiles estimate those of
+all rows seen, and ks_statistic compares it with the reference values.
+
+DriftMonitor applies both to prediction traffic. Serving a prediction only
+appends its input records to a bounded queue; a daemon thread encodes
+queued records in batches and adds them to the histograms and the sample,
+so memory stays fixed however many predictions are served. report() gives
+the PSI, the Kolmogorov-Smirnov statistic and quantiles of every feature
+against data_commontool.csv, the training data of the shipped model.
+
+Configuration (environment variables):
+    DRIFT_BATCH_SIZE: Most records encoded per update (default 256)
+    DRIFT_MAX_WAIT_SECONDS: How long records may accumulate before a partial
+        batch is applied (default 1)
+    DRIFT_MAX_PENDING: Records queued before new ones are dropped
+        (default 10000)
+    DRIFT_SAMPLE_SIZE: Rows kept in the sample (default 2048)
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.ml.background import QueueWorker
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("DRIFT_BATCH_SIZE", "256"))
+MAX_WAIT_SECONDS = float(os.getenv("DRIFT_MAX_WAIT_SECONDS", "1"))
+MAX_PENDING = int(os.getenv("DRIFT_MAX_PENDING", "10000"))
+SAMPLE_SIZE = int(os.getenv("DRIFT_SAMPLE_SIZE", "2048"))
+DEFAULT_BINS = 10
+REPORTED_QUANTILES = (0.05, 0.5, 0.95)
+# Floor of bin proportions, so that empty bins do not make the PSI infinite.
+MIN_PROPORTION = 1e-4
+
+
+def reference_edges(column: np.ndarray, bins: int = DEFAULT_BINS) -> np.ndarray:
+    """
+    Inner bin edges of one feature.
+
+    Args:
+        column (np.array): Reference values of the feature
+        bins (int): Most bins
+
+    Returns:
+        np.array: Increasing edges; values equal to an edge fall in the bin
+            above it
+    """
+    present = column[~np.isnan(column)]
+    values = np.unique(present)
+    if len(values) <= bins:
+        return (values[:-1] + values[1:]) / 2
+    # Quantiles of the values as observed, so bins follow where the mass is.
+    return np.unique(np.quantile(present, np.linspace(0, 1, bins + 1)[1:-1]))
+
+
+class FeatureHistograms:
+    """
+    Per-feature bin counts over fixed edges.
+    """
+
+    def __init__(self, edges: List[np.ndarray]):
+        """
+        Args:
+            edges (list): Inner bin edges of every feature
+        """
+        self.edges = edges
+        self.counts = [np.zeros(len(e) + 1, dtype=np.int64) for e in edges]
+
+    @classmethod
+    def from_reference(cls, reference: np.ndarray, bins: int = DEFAULT_BINS):
+        """
+        Histograms of a reference dataset, binned by its own distribution.
+
+        Args:
+            reference (np.array): Reference rows of shape (n, n_features)
+            bins (int): Most bins per feature
+        """
+        reference = np.asarray(reference, dtype=np.float64)
+        histograms = cls([reference_edges(column, bins) for column in reference.T])
+        histograms.add(reference)
+        return histograms
+
+    def empty_like(self) -> "FeatureHistograms":
+        """Histograms with the same edges and no counts"""
+        return FeatureHistograms(self.edges)
+
+    @property
+    def total(self) -> int:
+        return int(self.counts[0].sum()) if self.counts else 0
+
+    def add(self, X: np.ndarray) -> None:
+        """
+        Count a batch of rows of shape (n, n_features).
+        """
+        X = np.asarray(X, dtype=np.float64).reshape(-1, len(self.edges))
+        for counts, edges, column in zip(self.counts, self.edges, X.T):
+            indices = np.searchsorted(edges, column, side="right")
+            counts += np.bincount(indices, minlength=len(counts))
+
+    def proportions(self) -> List[np.ndarray]:
+        return [counts / max(counts.sum(), 1) for counts in self.counts]
+
+
+def population_stability_index(
+    reference: FeatureHistograms, current: FeatureHistograms
+) -> np.ndarray:
+    """
+    PSI of every feature between two histograms with the same edges.
+
+    Returns:
+        np.array: PSI per feature, shape (n_features,)
+    """
+    scores = []
+    for expected, actual in zip(reference.proportions(), current.proportions()):
+        expected = np.maximum(expected, MIN_PROPORTION)
+        actual = np.maximum(actual, MIN_PROPORTION)
+        scores.append(float(np.sum((actual - expected) * np.log(actual / expected))))
+    return np.array(scores)
+
+
+def max_drift(
+    reference: FeatureHistograms, current: FeatureHistograms
+) -> Optional[float]:
+    """
+    Largest PSI over all features, None if current has no rows.
+    """
+    if current.total == 0:
+        return None
+    return float(population_stability_index(reference, current).max())
+
+
+class ReservoirSample:
+    """
+    Uniform random sample of fixed size of all rows added.
+    """
+
+    def __init__(self, n_features: int, size: int = SAMPLE_SIZE, seed=None):
+        """
+        Args:
+            n_features (int): Columns of the rows
+            size (int): Rows kept
+            seed (int): Seed of the replacement choices
+        """
+        self.rows = np.empty((size, n_features))
+        self.seen = 0
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def sample(self) -> np.ndarray:
+        filled = min(self.seen, len(self.rows))
+        return self.rows[:filled]
+
+    def add(self, X: np.ndarray) -> None:
+        """
+        Offer a batch of rows of shape (n, n_features) to the sample.
+        """
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.rows.shape[1])
+        size = len(self.rows)
+        positions = self.seen + np.arange(len(X))
+        # Row t is kept with probability size / (t + 1), replacing a random row.
+        slots = np.where(
+            positions < size, positions, self._rng.integers(0, positions + 1)
+        )
+        kept = slots < size
+        self.rows[slots[kept]] = X[kept]
+        self.seen += len(X)
+
+    def quantiles(self, q) -> Optional[np.ndarray]:
+        """
+        Quantiles of every feature, shape (len(q), n_features); None if empty.
+        """
+        if not self.seen:
+            return None
+        return np.quantile(self.sample, q, axis=0)
+
+
+def ks_statistic(reference: np.ndarray, current: np.ndarray) -> Optional[float]:
+    """
+    Two-sample Kolmogorov-Smirnov statistic of one feature: the largest
+    distance between the empirical distribution functions.
+
+    Returns:
+        float: Statistic in [0, 1], None if either sample is empty
+    """
+    reference = np.sort(reference[~np.isnan(reference)])
+    current = np.sort(current[~np.isnan(current)])
+    if not len(reference) or not len(current):
+        return None
+    values = np.concatenate([reference, current])
+    reference_cdf = np.searchsorted(reference, values, side="right") / len(reference)
+    current_cdf = np.searchsorted(current, values, side="right") / len(current)
+    return float(np.abs(reference_cdf - current_cdf).max())
+
+
+_training_data = None
+
+
+def training_data() -> np.ndarray:
+    """Client features of data_commontool.csv, read on first use"""
+    global _training_data
+    if _training_data is None:
+        import pandas as pd
+
+        from app.clients.service.columnar_preprocessing import CLIENT_COLUMNS
+        from app.clients.service.logic import DATA_PATH
+
+        frame = pd.read_csv(DATA_PATH)[CLIENT_COLUMNS]
+        _training_data = frame.to_numpy(dtype=float)
+    return _training_data
+
+
+def encode_client_records(records: List[Dict[str, Any]]) -> np.ndarray:
+    from app.clients.service.columnar_preprocessing import encode_records
+
+    return encode_records(records)
+
+
+class DriftMonitor(QueueWorker):
+    """
+    Streams served prediction inputs into histograms and a sample, on a
+    background thread, and compares them with the reference data.
+    """
+
+    thread_name = "drift-monitor"
+    failure_message = "Updating drift statistics failed"
+
+    def __init__(
+        self,
+        reference: Callable[[], np.ndarray] = training_data,
+        encode: Callable[[List[Dict[str, Any]]], np.ndarray] = encode_client_records,
+        columns: Optional[List[str]] = None,
+        batch_size: int = BATCH_SIZE,
+        max_wait_seconds: float = MAX_WAIT_SECONDS,
+        max_pending: int = MAX_PENDING,
+        sample_size: int = SAMPLE_SIZE,
+        bins: int = DEFAULT_BINS,
+    ):
+        """
+        Args:
+            reference: Returns the reference rows, read on first use
+            encode: Encodes queued records into rows of features
+            columns (list): Feature names, CLIENT_COLUMNS when omitted
+            batch_size (int): Most records encoded per update
+            max_wait_seconds (float): Time records may accumulate into one
+                update
+            max_pending (int): Records queued before new ones are dropped
+            sample_size (int): Rows kept in the sample
+            bins (int): Most histogram bins per feature
+        """
+        super().__init__(batch_size, max_wait_seconds, max_pending)
+        self.load_reference = reference
+        self.encode = encode
+        self._columns = columns
+        self.sample_size = sample_size
+        self.bins = bins
+        # Guards the reference and the current histograms and sample
+        self._lock = threading.Lock()
+        self._reference_rows: Optional[np.ndarray] = None
+        self._reference: Optional[FeatureHistograms] = None
+        self._current: Optional[FeatureHistograms] = None
+        self._sample: Optional[ReservoirSample] = None
+        self.received = 0
+        self.failed = 0
+
+    @property
+    def columns(self) -> List[str]:
+        if self._columns is None:
+            from app.clients.service.columnar_preprocessing import CLIENT_COLUMNS
+
+            self._columns = CLIENT_COLUMNS
+        return self._columns
+
+    def observe(self, records: List[Dict[str, Any]]) -> bool:
+        """
+        Queue the input records of a served prediction, without waiting.
+
+        Returns:
+            bool: False if the queue was full and the records were dropped
+        """
+        if not self._enqueue(records, len(records)):
+            return False
+        self.received += len(records)
+        return True
+
+    def _ensure_reference(
+        self,
+    ) -> Tuple[FeatureHistograms, FeatureHistograms, ReservoirSample, np.ndarray]:
+        """
+        The reference histograms, current histograms, current sample and
+        reference rows, set up on first use and never replaced after.
+        """
+        with self._lock:
+            if self._reference is None:
+                rows = np.asarray(self.load_reference(), dtype=np.float64)
+                self._reference = FeatureHistograms.from_reference(rows, self.bins)
+                self._current = self._reference.empty_like()
+                self._sample = ReservoirSample(rows.shape[1], self.sample_size)
+                self._reference_rows = rows
+            assert self._current is not None and self._sample is not None
+            assert self._reference_rows is not None
+            return self._reference, self._current, self._sample, self._reference_rows
+
+    def run_once(self) -> int:
+        """
+        Encode one batch of queued records and add it to the statistics.
+
+        Returns:
+            int: Number of records added
+        """
+        records = self._take()
+        if not records:
+            return 0
+        _, current, sample, _ = self._ensure_reference()
+        try:
+            X = self.encode(records)
+        except Exception:
+            with self._lock:
+                self.failed += len(records)
+            raise
+        with self._lock:
+            current.add(X)
+            sample.add(X)
+        return len(records)
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Drift of every feature between the observed inputs and the reference.
+
+        Returns:
+            dict: Counters, the largest PSI and KS statistic, and per feature
+                its PSI, KS statistic and reference and current quantiles;
+                statistics are None until inputs are observed
+        """
+        reference, observed, reservoir, reference_rows = self._ensure_reference()
+        with self._lock:
+            current = reference.empty_like()
+            current.counts = [counts.copy() for counts in observed.counts]
+            sample = reservoir.sample.copy()
+            seen = reservoir.seen
+        pending = self.pending
+        reference_quantiles = np.nanquantile(reference_rows, REPORTED_QUANTILES, axis=0)
+        current_quantiles = None
+        psi: List[Optional[float]] = [None] * len(self.columns)
+        ks: List[Optional[float]] = [None] * len(self.columns)
+        if current.total:
+            current_quantiles = np.quantile(sample, REPORTED_QUANTILES, axis=0)
+            psi = population_stability_index(reference, current).tolist()
+            ks = [
+                ks_statistic(reference_rows[:, i], sample[:, i])
+                for i in range(len(self.columns))
+            ]
+        features = {}
+        for i, column in enumerate(self.columns):
+            features[column] = {
+                "psi": psi[i],
+                "ks": ks[i],
+                "reference_quantiles": quantile_dict(reference_quantiles[:, i]),
+                "current_quantiles": (
+                    quantile_dict(current_quantiles[:, i])
+                    if current_quantiles is not None
+                    else None
+                ),
+            }
+        measured_psi = [value for value in psi if value is not None]
+        measured_ks = [value for value in ks if value is not None]
+        return {
+            "reference_rows": len(reference_rows),
+            "observed": current.total,
+            "sample_rows": min(seen, self.sample_size),
+            "received": self.received,
+            "pending": pending,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "max_psi": max(measured_psi) if measured_psi else None,
+            "max_ks": max(measured_ks) if measured_ks else None,
+            "features": features,
+        }
+
+
+def quantile_dict(values: np.ndarray) -> Dict[str, float]:
+    return {
+        f"p{round(q * 100)}": float(value)
+        for q, value in zip(REPORTED_QUANTILES, values)
+    }
+
+
+drift_monitor = DriftMonitor()
@@ -0,0 +1,263 @@
+"""
+Weighted ensemble of runtime models evaluated on one shared input matrix.
+
+An EnsembleModel holds member models (CompiledForest, LinearModel or
+MLPModel) that take the same features, such as the intervention forest and
+the logistic model from train_logistic.py, which both score the (129, 31)
+baseline and combination rows of a client. The caller builds that matrix
+once and every member reads the same array.
+
+Members of large batches run concurrently on a small thread pool: forest
+traversal and matrix products spend most of their time in NumPy calls that
+release the GIL. Each member contributes either its predict() output or its positive
+class probability times a scale (100 puts a probability on the success
+rate scale), and the outputs are combined with normalized weights. The
+time spent in every member is kept for the metrics endpoint.
+
+An ensemble is stored as one artifact, with each member's arrays under a
+"member<i>." prefix, so it is registered, checksummed and memory-mapped
+like any other model. Register the forest and logistic blend with:
+
+    python -m app.ml.ensemble --forest-weight 0.7 --logistic-weight 0.3
+"""
+
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.clients.service.prediction_metrics import LatencySample
+
+MEMBER_OUTPUTS = ("predict", "proba")
+# Below this many rows, handing members to the pool costs more than it saves.
+CONCURRENT_MIN_ROWS = 1024
+# Scratch artifact of the logistic member; the registered blend embeds it.
+LOGISTIC_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "models", "model_logreg"
+)
+
+
+class EnsembleMember(NamedTuple):
+    name: str
+    model: Any
+    weight: float
+    output: str = "predict"
+    scale: float = 1.0
+
+
+class EnsembleModel:
+    """
+    Weighted average of member models over the same input.
+    """
+
+    kind = "ensemble"
+
+    def __init__(self, members: List[EnsembleMember], concurrent: bool = True):
+        """
+        Args:
+            members (list): EnsembleMember entries; weights are normalized
+            concurrent (bool): Run members on a thread pool for inputs of at
+                least CONCURRENT_MIN_ROWS rows
+
+        Raises:
+            ValueError: If members disagree on the number of features, an
+                output is unknown or the weights do not sum to a positive value
+        """
+        if not members or len({m.model.n_features for m in members}) != 1:
+            raise ValueError("Ensemble members must take the same features")
+        if any(member.output not in MEMBER_OUTPUTS for member in members):
+            raise ValueError(f"Member outputs must be one of {MEMBER_OUTPUTS}")
+        total_weight = sum(member.weight for member in members)
+        if total_weight <= 0:
+            raise ValueError("Ensemble weights must sum to a positive value")
+        self.members = members
+        self.weights = np.array([member.weight for member in members]) / total_weight
+        self.concurrent = concurrent
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._timings = {member.name: LatencySample() for member in members}
+        self._timings_lock = threading.Lock()
+
+    @property
+    def n_features(self):
+        return self.members[0].model.n_features
+
+    @classmethod
+    def from_artifact(cls, arrays, meta):
+        # Imported here: app.ml.artifacts registers this class as a model kind.
+        from app.ml.artifacts import MODEL_KINDS
+
+        members = []
+        for index, spec in enumerate(meta["members"]):
+            prefix = f"member{index}."
+            member_arrays = {
+                name.removeprefix(prefix): array
+                for name, array in arrays.items()
+                if name.startswith(prefix)
+            }
+            model = MODEL_KINDS[spec["kind"]].from_artifact(member_arrays, spec["meta"])
+            members.append(
+                EnsembleMember(
+                    spec["name"], model, spec["weight"], spec["output"], spec["scale"]
+                )
+            )
+        return cls(members, meta.get("concurrent", True))
+
+    def to_artifact(self):
+        arrays, specs = {}, []
+        for index, member in enumerate(self.members):
+            member_arrays, member_meta = member.model.to_artifact()
+            for name, array in member_arrays.items():
+                arrays[f"member{index}.{name}"] = array
+            specs.append(
+                {
+                    "name": member.name,
+                    "kind": member.model.kind,
+                    "weight": member.weight,
+                    "output": member.output,
+                    "scale": member.scale,
+                    "meta": member_meta,
+                }
+            )
+        meta = {
+            "n_features": self.n_features,
+            "members": specs,
+            "concurrent": self.concurrent,
+        }
+        return arrays, meta
+
+    def _run_member(self, member: EnsembleMember, X: np.ndarray):
+        start = time.perf_counter()
+        if member.output == "proba":
+            values = member.model.predict_proba(X)[:, 1]
+        else:
+            values = member.model.predict(X)
+        values = np.asarray(values, dtype=np.float64) * member.scale
+        return values, (time.perf_counter() - start) * 1000
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=len(self.members), thread_name_prefix="ensemble"
+                    )
+        return self._pool
+
+    def evaluate(self, X) -> Tuple[np.ndarray, Dict[str, float]]:
+        """
+        Combined output and the time spent in each member.
+
+        Args:
+            X (np.array): Input matrix of shape (n, n_features), shared by
+                every member
+
+        Returns:
+            tuple: Weighted outputs of shape (n,) and member name to
+                milliseconds for this call
+        """
+        X = np.asarray(X).reshape(-1, self.n_features)
+        if self.concurrent and len(self.members) > 1 and len(X) >= CONCURRENT_MIN_ROWS:
+            pool = self._executor()
+            results = [
+                future.result()
+                for future in [
+                    pool.submit(self._run_member, member, X) for member in self.members
+                ]
+            ]
+        else:
+            results = [self._run_member(member, X) for member in self.members]
+        combined = np.zeros(len(X), dtype=np.float64)
+        for weight, (values, _) in zip(self.weights, results):
+            combined += weight * values
+        timings = {
+            member.name: elapsed_ms
+            for member, (_, elapsed_ms) in zip(self.members, results)
+        }
+        with self._timings_lock:
+            for name, elapsed_ms in timings.items():
+                self._timings[name].add(elapsed_ms)
+        return combined, timings
+
+    def predict(self, X):
+        """
+        Weighted combination of the member outputs, shape (n,).
+        """
+        return self.evaluate(X)[0]
+
+    def member_timings(self) -> Dict[str, Dict[str, float]]:
+        """Latency summary of every member over its recent calls"""
+        with self._timings_lock:
+            return {
+                member.name: {
+                    "weight": float(weight),
+                    **self._timings[member.name].summary(),
+                }
+                for member, weight in zip(self.members, self.weights)
+            }
+
+
+def build_intervention_ensemble(
+    forest_weight: float,
+    logistic_weight: float,
+    data_path: str,
+    logistic_path: str = LOGISTIC_PATH,
+) -> EnsembleModel:
+    """
+    Blend the intervention forest with a freshly trained logistic model.
+
+    The forest predicts the success rate; the logistic model's probability of
+    a success rate above 70 is scaled by 100 to the same range.
+
+    Args:
+        forest_weight (float): Weight of the forest
+        logistic_weight (float): Weight of the logistic model
+        data_path (str): Training CSV
+        logistic_path (str): Where train_logistic.py writes its artifact
+
+    Returns:
+        EnsembleModel: The blend
+    """
+    from app.clients.ml.models.train_logistic import train_logistic_model
+    from app.clients.service import logic
+
+    logistic = train_logistic_model(data_path, logistic_path)
+    return EnsembleModel(
+        [
+            EnsembleMember("forest", logic.MODEL, forest_weight),
+            EnsembleMember("logistic", logistic, logistic_weight, "proba", 100.0),
+        ]
+    )
+
+
+def main():
+    from app.clients.service.logic import DATA_PATH, ENSEMBLE_MODEL, FEATURE_SCHEMA
+    from app.ml.model_list import registry
+    from app.ml.registry import data_hash
+
+    parser = argparse.ArgumentParser(description="Register the intervention blend.")
+    parser.add_argument("--forest-weight", type=float, default=0.7)
+    parser.add_argument("--logistic-weight", type=float, default=0.3)
+    parser.add_argument("--data-path", default=None, help="Training CSV")
+    parser.add_argument("--name", default=ENSEMBLE_MODEL)
+    args = parser.parse_args()
+    model = build_intervention_ensemble(
+        args.forest_weight, args.logistic_weight, args.data_path or DATA_PATH
+    )
+    data_path = args.data_path or DATA_PATH
+    metadata = registry.register(
+        args.name,
+        model,
+        FEATURE_SCHEMA,
+        data_hash(np.fromfile(data_path, dtype=np.uint8)),
+        {"members": [member.name for member in model.members]},
+    )
+    print(f"Registered {args.name} version {metadata['version']}")
+
+
+if __name__ == "__main__":
+    main()
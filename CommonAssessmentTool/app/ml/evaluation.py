@@ -0,0 +1,330 @@
+"""
+Cross-validated comparison of model configurations.
+
+The evaluation data is encoded once, the success classification of
+app.ml.training (success_rate above SUCCESS_THRESHOLD) from the 31 client
+and intervention features, and cached under a directory named after its
+data hash and fold layout:
+
+    X.npy      float32 features, shape (n, 31)
+    y.npy      bool labels, shape (n,)
+    folds.npy  fold of every row, shape (n,)
+    meta.json  written last; a directory without it is rebuilt
+
+Every (configuration, fold) pair is a task for a process pool. Workers
+memory-map the cached arrays, so they share one copy of the data and only
+the configuration is sent to them. A task fits the configuration's
+model_list family on the other folds and scores the held-out fold, then
+converts the model to its NumPy runtime (see app.ml.artifacts), as served,
+to measure:
+
+    accuracy, roc_auc   on the held-out fold
+    row_ms              p50 latency of predict_proba for one row
+    batch_us_per_row    predict_proba of the whole fold, per row
+    artifact_kb         size of the saved artifact
+
+Results are averaged per configuration. A configuration is on the frontier
+when no other one is at least as accurate and at least as fast (row_ms)
+with one of the two strictly better. Compare the model families with:
+
+    python -m app.ml.evaluation --folds 5 --n-estimators 10 50 100 \\
+        --max-depth 0 8 16 --output evaluation.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.ml.model_list import MODEL_NAMES
+
+# Tree parameters only apply to the forest family.
+TREE_FAMILIES = {"random_forest"}
+LATENCY_ROWS = 200
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "cat-evaluation-folds")
+
+
+def load_csv_matrix(data_path: Optional[str] = None) -> np.ndarray:
+    """
+    Encoded training matrix of a CSV with the training columns.
+
+    Args:
+        data_path (str): CSV path, the service's data_commontool.csv when
+            omitted
+
+    Returns:
+        np.array: float32 matrix of shape (n, 32), success_rate last
+    """
+    import pandas as pd
+
+    from app.clients.service.columnar_preprocessing import CLIENT_COLUMNS
+    from app.clients.service.logic import DATA_PATH
+    from app.ml.training import encode_training_frame
+
+    frame = pd.read_csv(data_path or DATA_PATH)
+    return encode_training_frame(frame.dropna(subset=CLIENT_COLUMNS))
+
+
+def build_folds(
+    matrix: np.ndarray, k: int = 5, seed: int = 42, cache_dir: str = DEFAULT_CACHE_DIR
+) -> str:
+    """
+    Assign rows to K folds and cache the encoded data, unless cached already.
+
+    Args:
+        matrix (np.array): Training matrix with success_rate last
+        k (int): Number of folds
+        seed (int): Seed of the fold assignment
+        cache_dir (str): Directory holding one subdirectory per layout
+
+    Returns:
+        str: Directory of the cached folds
+    """
+    from app.ml.registry import data_hash
+    from app.ml.training import SUCCESS_THRESHOLD
+
+    if len(matrix) < k:
+        raise ValueError(f"Cannot build {k} folds from {len(matrix)} rows")
+    path = os.path.join(cache_dir, f"{data_hash(matrix)}-k{k}-s{seed}")
+    if os.path.exists(os.path.join(path, "meta.json")):
+        return path
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    folds = np.arange(len(matrix)) % k
+    np.random.RandomState(seed).shuffle(folds)
+    np.save(os.path.join(path, "X.npy"), np.ascontiguousarray(matrix[:, :-1]))
+    np.save(os.path.join(path, "y.npy"), matrix[:, -1] > SUCCESS_THRESHOLD)
+    np.save(os.path.join(path, "folds.npy"), folds.astype(np.int8))
+    with open(os.path.join(path, "meta.json"), "w") as meta_file:
+        json.dump({"rows": len(matrix), "folds": k, "seed": seed}, meta_file)
+    return path
+
+
+def load_folds(path: str):
+    """
+    Memory-mapped X, y and fold assignment of cached folds.
+    """
+    return tuple(
+        np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        for name in ("X", "y", "folds")
+    )
+
+
+def expand_grid(
+    families: Sequence[str],
+    n_estimators: Sequence[int] = (100,),
+    max_depth: Sequence[Optional[int]] = (None,),
+) -> List[Dict[str, Any]]:
+    """
+    Configurations to evaluate: every tree family with every combination of
+    n_estimators and max_depth, other families with their defaults.
+
+    Returns:
+        list: Dicts with "family" and "params"
+    """
+    configs: List[Dict[str, Any]] = []
+    for family in families:
+        if family not in MODEL_NAMES:
+            raise ValueError(f"Unknown model family: {family}")
+        if family in TREE_FAMILIES:
+            configs.extend(
+                {"family": family, "params": {"n_estimators": n, "max_depth": d}}
+                for n, d in itertools.product(n_estimators, max_depth)
+            )
+        else:
+            configs.append({"family": family, "params": {}})
+    return configs
+
+
+def config_label(config: Dict[str, Any]) -> str:
+    params = ",".join(f"{name}={value}" for name, value in config["params"].items())
+    return f"{config['family']}({params})"
+
+
+def artifact_size(model) -> int:
+    """Bytes of a runtime model's saved artifact"""
+    from app.ml.artifacts import save_model
+
+    with tempfile.TemporaryDirectory() as path:
+        save_model(model, os.path.join(path, "model"))
+        return sum(
+            entry.stat().st_size for entry in os.scandir(os.path.join(path, "model"))
+        )
+
+
+def evaluate_fold(path: str, config: Dict[str, Any], fold: int) -> Dict[str, float]:
+    """
+    Fit a configuration on all folds but one and score the held-out fold.
+
+    Runs in a pool worker; the data is read from the cache at path.
+
+    Returns:
+        dict: Metrics of the fold, see the module docstring
+    """
+    from sklearn import metrics
+
+    from app.ml.artifacts import from_sklearn
+    from app.ml.model_list import make_estimator
+
+    X, y, folds = load_folds(path)
+    test = folds == fold
+    started = time.perf_counter()
+    estimator = make_estimator(config["family"], **config["params"])
+    estimator.fit(X[~test], y[~test])
+    fit_seconds = time.perf_counter() - started
+
+    model = from_sklearn(estimator)
+    X_test, y_test = np.asarray(X[test]), np.asarray(y[test])
+    started = time.perf_counter()
+    probabilities = model.predict_proba(X_test)[:, 1]
+    batch_seconds = time.perf_counter() - started
+    timings = []
+    for row in X_test[:LATENCY_ROWS]:
+        started = time.perf_counter()
+        model.predict_proba(row)
+        timings.append((time.perf_counter() - started) * 1000)
+    result = {
+        "accuracy": float(metrics.accuracy_score(y_test, probabilities >= 0.5)),
+        "roc_auc": float("nan"),
+        "fit_seconds": fit_seconds,
+        "row_ms": float(np.median(timings)),
+        "batch_us_per_row": batch_seconds / len(X_test) * 1e6,
+        "artifact_kb": artifact_size(model) / 1024,
+    }
+    if len(np.unique(y_test)) == 2:
+        result["roc_auc"] = float(metrics.roc_auc_score(y_test, probabilities))
+    return result
+
+
+def mark_frontier(results: List[Dict[str, Any]]) -> None:
+    """
+    Set "frontier" on results not beaten on both accuracy and row_ms.
+    """
+    for result in results:
+        result["frontier"] = not any(
+            other["accuracy"] >= result["accuracy"]
+            and other["row_ms"] <= result["row_ms"]
+            and (
+                other["accuracy"] > result["accuracy"]
+                or other["row_ms"] < result["row_ms"]
+            )
+            for other in results
+        )
+
+
+def cross_validate(
+    path: str, configs: List[Dict[str, Any]], workers: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Evaluate every configuration on every cached fold in a process pool.
+
+    Args:
+        path (str): Directory of cached folds, see build_folds
+        configs (list): Configurations, see expand_grid
+        workers (int): Pool processes, the CPU count when omitted
+
+    Returns:
+        list: Per configuration its label, family, params, the mean and
+            standard deviation of the accuracy, mean metrics and "frontier",
+            most accurate first
+    """
+    with open(os.path.join(path, "meta.json")) as meta_file:
+        k = json.load(meta_file)["folds"]
+    tasks = list(itertools.product(range(len(configs)), range(k)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(evaluate_fold, path, configs[index], fold)
+            for index, fold in tasks
+        ]
+        fold_results = [future.result() for future in futures]
+
+    results = []
+    for index, config in enumerate(configs):
+        scores = [
+            result for (task, _), result in zip(tasks, fold_results) if task == index
+        ]
+        accuracies = [score["accuracy"] for score in scores]
+        summary = {
+            "label": config_label(config),
+            **config,
+            "accuracy": float(np.mean(accuracies)),
+            "accuracy_std": float(np.std(accuracies)),
+        }
+        for metric in ("roc_auc", "fit_seconds", "row_ms", "batch_us_per_row"):
+            summary[metric] = float(np.nanmean([score[metric] for score in scores]))
+        summary["artifact_kb"] = float(np.mean([s["artifact_kb"] for s in scores]))
+        results.append(summary)
+    mark_frontier(results)
+    return sorted(results, key=lambda result: -result["accuracy"])
+
+
+def format_results(results: List[Dict[str, Any]]) -> str:
+    """Plain text table of cross_validate results"""
+    header = (
+        f"{'config':<52} {'accuracy':>14} {'auc':>6} {'row ms':>7} "
+        f"{'us/row':>7} {'kb':>8}  frontier"
+    )
+    lines = [header]
+    for result in results:
+        lines.append(
+            f"{result['label']:<52} "
+            f"{result['accuracy']:.3f} ± {result['accuracy_std']:.3f} "
+            f"{result['roc_auc']:6.3f} {result['row_ms']:7.3f} "
+            f"{result['batch_us_per_row']:7.2f} {result['artifact_kb']:8.1f}  "
+            f"{'*' if result['frontier'] else ''}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-validate model configs.")
+    parser.add_argument("--data-path", default=None, help="Training CSV")
+    parser.add_argument(
+        "--database-url", default=None, help="Read outcomes from a database instead"
+    )
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--families", nargs="+", default=MODEL_NAMES)
+    parser.add_argument("--n-estimators", type=int, nargs="+", default=[100])
+    parser.add_argument(
+        "--max-depth", type=int, nargs="+", default=[0], help="0 for unlimited"
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--output", default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    if args.database_url:
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+
+        from app.clients.service.client_repository import SQLAlchemyClientRepository
+        from app.ml.training import load_training_matrix
+
+        with sessionmaker(bind=create_engine(args.database_url))() as db:
+            matrix, _ = load_training_matrix(SQLAlchemyClientRepository(db))
+    else:
+        matrix = load_csv_matrix(args.data_path)
+    path = build_folds(matrix, args.folds, args.seed, args.cache_dir)
+    configs = expand_grid(
+        args.families,
+        args.n_estimators,
+        [depth or None for depth in args.max_depth],
+    )
+    results = cross_validate(path, configs, args.workers)
+    print(f"{len(matrix)} rows, {args.folds} folds cached in {path}")
+    print(format_results(results))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
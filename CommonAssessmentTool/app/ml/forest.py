@@ -0,0 +1,216 @@
+"""
+Array-backed tree ensemble runtime.
+
+A fitted scikit-learn forest is exported once into flat NumPy arrays holding
+the feature, threshold, (left, right) children and value of every node of
+every tree. Serving only needs NumPy: a whole batch is evaluated level by
+level, moving every (tree, row) pair one step down its tree per iteration.
+
+Leaves point to themselves, so pairs that reach a leaf early simply stay put
+until the deepest tree is exhausted. Inputs are compared as float32 against
+float64 thresholds and tree outputs are summed in tree order, matching
+scikit-learn's forest ``predict`` and ``predict_proba`` bit for bit.
+
+Forests are stored as memory-mapped artifacts, see app.ml.artifacts.
+"""
+
+import numpy as np
+
+# Number of rows evaluated together; bounds the (trees x rows) working arrays.
+PREDICT_CHUNK_SIZE = 512
+
+
+class CompiledForest:
+    """
+    Flat-array representation of a forest regressor or classifier.
+    """
+
+    kind = "forest"
+
+    def __init__(
+        self,
+        feature,
+        threshold,
+        children,
+        value,
+        roots,
+        n_features,
+        classes=None,
+        max_depth=None,
+    ):
+        """
+        Args:
+            feature (np.array): Split feature per node, 0 for leaves
+            threshold (np.array): Split threshold per node
+            children (np.array): Absolute index of each node's left (row 0) and
+                right (row 1) child, of shape (2, n_nodes); self for leaves
+            value (np.array): Per-node outputs of shape (n_nodes, n_outputs);
+                one column per regression output, class probabilities for classifiers
+            roots (np.array): Absolute index of each tree's root node
+            n_features (int): Number of input features
+            classes (np.array): Class labels for classifiers, None for regressors
+            max_depth (int): Depth of the deepest tree, computed when omitted
+        """
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value.reshape(len(value), -1)
+        self.roots = roots
+        self.n_features = int(n_features)
+        self.classes = classes
+        self.max_depth = (
+            self._compute_max_depth() if max_depth is None else int(max_depth)
+        )
+        # A view, so mapped children stay shared:
+        # child = next_node[go_right * n_nodes + node].
+        self._next_node = children.reshape(-1)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def left(self):
+        return self.children[0]
+
+    @property
+    def right(self):
+        return self.children[1]
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """
+        Flatten a fitted scikit-learn forest.
+
+        Args:
+            model: Fitted RandomForestRegressor (single- or multi-output) or
+                RandomForestClassifier
+
+        Returns:
+            CompiledForest: Equivalent array-backed forest
+        """
+        classes = getattr(model, "classes_", None)
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count) + offset
+            is_leaf = tree.children_left == -1
+            # (n_nodes, n_classes) for classifiers, (n_nodes, n_outputs) for
+            # single- and multi-output regressors.
+            value = tree.value[:, 0, :] if classes is not None else tree.value[:, :, 0]
+            if classes is not None:
+                # Same normalization as DecisionTreeClassifier.predict_proba.
+                normalizer = value.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                value = value / normalizer
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left + offset))
+            rights.append(np.where(is_leaf, node_ids, tree.children_right + offset))
+            values.append(value)
+            roots.append(offset)
+            offset += tree.node_count
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children=np.stack((np.concatenate(lefts), np.concatenate(rights))).astype(
+                np.intp
+            ),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.array(roots, dtype=np.intp),
+            n_features=model.n_features_in_,
+            classes=classes,
+        )
+
+    @classmethod
+    def from_artifact(cls, arrays, meta):
+        children = arrays.get("children")
+        if children is None:
+            # Artifacts written before children were stored as one array.
+            children = np.stack((arrays["left"], arrays["right"]))
+        return cls(
+            feature=arrays["feature"],
+            threshold=arrays["threshold"],
+            children=children,
+            value=arrays["value"],
+            roots=arrays["roots"],
+            n_features=meta["n_features"],
+            classes=arrays.get("classes"),
+            max_depth=meta["max_depth"],
+        )
+
+    def to_artifact(self):
+        arrays = {
+            "feature": self.feature,
+            "threshold": self.threshold,
+            "children": self.children,
+            "value": self.value,
+            "roots": self.roots,
+        }
+        if self.classes is not None:
+            arrays["classes"] = self.classes
+        meta = {
+            "n_features": self.n_features,
+            "n_trees": self.n_trees,
+            "max_depth": self.max_depth,
+        }
+        return arrays, meta
+
+    def predict(self, X):
+        """
+        Predict a batch of rows.
+
+        Args:
+            X (np.array): Input matrix of shape (n, n_features)
+
+        Returns:
+            np.array: Predictions of shape (n,), or (n, n_outputs) for
+                multi-output regressors; class labels for classifiers
+        """
+        outputs = self._predict_outputs(X)
+        if self.classes is not None:
+            return self.classes[outputs.argmax(axis=1)]
+        return outputs[:, 0] if outputs.shape[1] == 1 else outputs
+
+    def predict_proba(self, X):
+        """
+        Class probabilities of shape (n, n_classes).
+        """
+        if self.classes is None:
+            raise ValueError("predict_proba is only available for classifiers")
+        return self._predict_outputs(X)
+
+    def _predict_outputs(self, X):
+        X = np.asarray(X, dtype=np.float32).reshape(-1, self.n_features)
+        outputs = np.empty((len(X), self.value.shape[1]), dtype=np.float64)
+        for start in range(0, len(X), PREDICT_CHUNK_SIZE):
+            stop = start + PREDICT_CHUNK_SIZE
+            outputs[start:stop] = self._predict_chunk(X[start:stop])
+        return outputs
+
+    def _predict_chunk(self, X):
+        flat_inputs = X.ravel()
+        row_offsets = np.arange(len(X), dtype=np.intp) * self.n_features
+        n_nodes = len(self.feature)
+        nodes = np.repeat(self.roots[:, np.newaxis], len(X), axis=1)
+        for _ in range(self.max_depth):
+            inputs = flat_inputs[row_offsets + self.feature[nodes]]
+            go_right = inputs > self.threshold[nodes]
+            nodes = self._next_node[go_right * n_nodes + nodes]
+        leaf_values = self.value[nodes]
+        total = np.zeros(leaf_values.shape[1:], dtype=np.float64)
+        for tree_values in leaf_values:
+            total += tree_values
+        total /= self.n_trees
+        return total
+
+    def _compute_max_depth(self):
+        depth = 0
+        nodes = self.roots
+        is_leaf = self.left == np.arange(len(self.left))
+        while not is_leaf[nodes].all():
+            nodes = np.concatenate((self.left[nodes], self.right[nodes]))
+            nodes = np.unique(nodes[~is_leaf[nodes]])
+            depth += 1
+        return depth
@@ -0,0 +1,245 @@
+"""
+Constraint-aware top-k search over intervention combinations.
+
+For one client every tree of the forest reduces to a function of the
+intervention flags alone: splits on client features follow a single branch,
+so each remaining leaf is reachable under a condition "these flags are on,
+those flags are off". ClientSurface stores those conditions as bit masks.
+
+With some flags decided and the rest free, a leaf is still reachable when its
+condition does not contradict the decided flags; the largest reachable leaf
+value per tree therefore bounds every completion of the partial plan from
+above. The search expands partial plans best-bound-first and stops once k
+complete plans have been popped, so it never enumerates all 2^n plans and
+never sorts them. Constraints (maximum number of services, non-negative
+per-service costs and budget, required and excluded services) prune partial
+plans as soon as they are violated.
+"""
+
+import heapq
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from numpy.typing import ArrayLike
+
+from app.ml.partial_eval import LEAF, InterventionPartialEvaluator
+
+MAX_INTERVENTIONS = 63
+
+
+class ClientSurface:
+    """
+    One client's forest, reduced to leaves conditioned on intervention flags.
+    """
+
+    def __init__(self, tree_starts, ones, zeros, values, n_interventions):
+        """
+        Args:
+            tree_starts (np.array): Index of each tree's first leaf
+            ones (np.array): Per leaf, mask of flags that must be on
+            zeros (np.array): Per leaf, mask of flags that must be off
+            values (np.array): Per leaf, the tree's output
+            n_interventions (int): Number of intervention flags
+        """
+        self.tree_starts = tree_starts
+        self.ones = ones
+        self.zeros = zeros
+        self.values = values
+        self.n_interventions = n_interventions
+
+    @property
+    def n_trees(self):
+        return len(self.tree_starts)
+
+    @classmethod
+    def from_evaluator(
+        cls, evaluator: InterventionPartialEvaluator, client_row, n_interventions
+    ):
+        """
+        Reduce every tree of an evaluator for one client.
+
+        Args:
+            evaluator: Partial evaluator over the forest's trees
+            client_row: Client feature values, length num_client_features
+            n_interventions (int): Number of intervention flags
+
+        Returns:
+            ClientSurface: The client's reduced forest
+        """
+        if n_interventions > MAX_INTERVENTIONS:
+            raise ValueError(f"At most {MAX_INTERVENTIONS} interventions supported")
+        # Trees compare float32 inputs against float64 thresholds.
+        client = np.asarray(client_row, dtype=np.float32).tolist()
+        num_client_features = evaluator.num_client_features
+        tree_starts: List[int] = []
+        ones: List[int] = []
+        zeros: List[int] = []
+        values: List[float] = []
+        for children_left, children_right, feature, threshold, value in evaluator.trees:
+            tree_starts.append(len(values))
+            stack = [(0, 0, 0)]
+            while stack:
+                node, on, off = stack.pop()
+                while children_left[node] != LEAF:
+                    column = feature[node]
+                    if column < num_client_features:
+                        if client[column] <= threshold[node]:
+                            node = children_left[node]
+                        else:
+                            node = children_right[node]
+                        continue
+                    bit = 1 << (column - num_client_features)
+                    off_goes_left = 0.0 <= threshold[node]
+                    on_goes_left = 1.0 <= threshold[node]
+                    if off_goes_left == on_goes_left:
+                        node = (
+                            children_left[node]
+                            if on_goes_left
+                            else children_right[node]
+                        )
+                    elif off_goes_left:
+                        stack.append((children_right[node], on | bit, off))
+                        node, off = children_left[node], off | bit
+                    else:
+                        stack.append((children_left[node], on | bit, off))
+                        node, off = children_right[node], off | bit
+                ones.append(on)
+                zeros.append(off)
+                values.append(value[node])
+        return cls(
+            np.asarray(tree_starts, dtype=np.intp),
+            np.asarray(ones, dtype=np.int64),
+            np.asarray(zeros, dtype=np.int64),
+            np.asarray(values, dtype=np.float64),
+            n_interventions,
+        )
+
+    def upper_bound(self, on: int, off: int) -> float:
+        """
+        Largest prediction any plan with these flags decided can reach.
+
+        With every flag decided this is the plan's exact prediction: tree
+        outputs are summed in tree order and divided by the number of trees,
+        as RandomForestRegressor does.
+
+        Args:
+            on (int): Mask of flags decided on
+            off (int): Mask of flags decided off
+
+        Returns:
+            float: Upper bound on the prediction
+        """
+        reachable = ((self.ones & off) == 0) & ((self.zeros & on) == 0)
+        best_per_tree = np.maximum.reduceat(
+            np.where(reachable, self.values, -np.inf), self.tree_starts
+        )
+        # cumsum adds sequentially, so bounds and exact scores round alike.
+        return float(np.cumsum(best_per_tree)[-1] / self.n_trees)
+
+    def predict(self, on: int) -> float:
+        """
+        Exact prediction of the plan with exactly the flags in on enabled.
+        """
+        full = (1 << self.n_interventions) - 1
+        return self.upper_bound(on, full & ~on)
+
+
+def mask_of(indices: Sequence[int]) -> int:
+    mask = 0
+    for index in indices:
+        mask |= 1 << index
+    return mask
+
+
+def search_top_k(
+    surface: ClientSurface,
+    k: int = 3,
+    max_services: Optional[int] = None,
+    costs: Optional[ArrayLike] = None,
+    budget: Optional[float] = None,
+    required: Sequence[int] = (),
+    excluded: Sequence[int] = (),
+) -> Dict[str, Any]:
+    """
+    Find the k best plans that satisfy the constraints.
+
+    Args:
+        surface: The client's reduced forest
+        k (int): Number of plans to return
+        max_services (int): Most interventions per plan, None for no limit
+        costs (list): Non-negative cost per intervention, required when
+            budget is given
+        budget (float): Largest total cost of a plan, None for no limit
+        required (list): Intervention indices every plan must include
+        excluded (list): Intervention indices no plan may include
+
+    Returns:
+        dict: "plans" as a best-first list of (score, intervention indices,
+            cost) tuples, "expanded" partial plans and "pruned" branches
+
+    Raises:
+        ValueError: If a cost is negative, which would make pruning on the
+            budget unsound, or a service is both required and excluded
+    """
+    n = surface.n_interventions
+    cost_of = np.zeros(n) if costs is None else np.asarray(costs, dtype=np.float64)
+    if (cost_of < 0).any():
+        raise ValueError("Intervention costs must not be negative")
+    max_services = n if max_services is None else max_services
+    budget = np.inf if budget is None else budget
+    required_mask, excluded_mask = mask_of(required), mask_of(excluded)
+    if required_mask & excluded_mask:
+        raise ValueError("An intervention cannot be both required and excluded")
+
+    free_bits = [
+        bit for bit in range(n) if not (required_mask | excluded_mask) >> bit & 1
+    ]
+    root_cost = float(cost_of[list(required)].sum()) if len(required) else 0.0
+    plans: List[tuple] = []
+    expanded = pruned = 0
+    if bin(required_mask).count("1") > max_services or root_cost > budget:
+        return {"plans": plans, "expanded": expanded, "pruned": pruned}
+
+    # Entries: (-bound, -depth, tie breaker, on, off, cost). Deeper entries
+    # win ties so complete plans surface as early as possible.
+    counter = 0
+    frontier = [
+        (
+            -surface.upper_bound(required_mask, excluded_mask),
+            0,
+            counter,
+            required_mask,
+            excluded_mask,
+            root_cost,
+        )
+    ]
+    while frontier and len(plans) < k:
+        negative_bound, negative_depth, _, on, off, cost = heapq.heappop(frontier)
+        depth = -negative_depth
+        if depth == len(free_bits):
+            # Every flag is decided, so the bound is the exact prediction.
+            indices = [bit for bit in range(n) if on >> bit & 1]
+            plans.append((-negative_bound, indices, cost))
+            continue
+        expanded += 1
+        bit = 1 << free_bits[depth]
+        for child_on, child_off, child_cost in (
+            (on | bit, off, cost + cost_of[free_bits[depth]]),
+            (on, off | bit, cost),
+        ):
+            if bin(child_on).count("1") > max_services or child_cost > budget:
+                pruned += 1
+                continue
+            counter += 1
+            heapq.heappush(
+                frontier,
+                (
+                    -surface.upper_bound(child_on, child_off),
+                    -(depth + 1),
+                    counter,
+                    child_on,
+                    child_off,
+                    child_cost,
+                ),
+            )
+    return {"plans": plans, "expanded": expanded, "pruned": pruned}
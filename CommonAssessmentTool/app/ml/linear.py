@@ -0,0 +1,94 @@
+"""
+NumPy runtime for linear models.
+
+Covers linear regressors and logistic regression classifiers exported from
+scikit-learn, evaluated as ``X @ coef.T + intercept``.
+"""
+
+import numpy as np
+
+
+def expit(values):
+    """
+    Logistic sigmoid.
+    """
+    return 1.0 / (1.0 + np.exp(-values))
+
+
+def softmax(values):
+    """
+    Row-wise softmax.
+    """
+    shifted = np.exp(values - values.max(axis=1, keepdims=True))
+    return shifted / shifted.sum(axis=1, keepdims=True)
+
+
+class LinearModel:
+    """
+    Linear regressor or logistic regression classifier.
+    """
+
+    kind = "linear"
+
+    def __init__(self, coef, intercept, classes=None):
+        """
+        Args:
+            coef (np.array): Weights of shape (n_targets, n_features)
+            intercept (np.array): Bias of shape (n_targets,)
+            classes (np.array): Class labels for classifiers, None for regressors
+        """
+        self.coef = np.atleast_2d(coef)
+        self.intercept = np.atleast_1d(intercept)
+        self.classes = classes
+
+    @property
+    def n_features(self):
+        return self.coef.shape[1]
+
+    @classmethod
+    def from_sklearn(cls, estimator):
+        """
+        Build from a fitted scikit-learn linear model.
+        """
+        return cls(
+            coef=np.asarray(estimator.coef_, dtype=np.float64),
+            intercept=np.asarray(estimator.intercept_, dtype=np.float64),
+            classes=getattr(estimator, "classes_", None),
+        )
+
+    @classmethod
+    def from_artifact(cls, arrays, meta):
+        return cls(arrays["coef"], arrays["intercept"], arrays.get("classes"))
+
+    def to_artifact(self):
+        arrays = {"coef": self.coef, "intercept": self.intercept}
+        if self.classes is not None:
+            arrays["classes"] = self.classes
+        return arrays, {"n_features": self.n_features}
+
+    def decision_function(self, X):
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.n_features)
+        return X @ self.coef.T + self.intercept
+
+    def predict_proba(self, X):
+        """
+        Class probabilities of shape (n, n_classes).
+        """
+        if self.classes is None:
+            raise ValueError("predict_proba is only available for classifiers")
+        scores = self.decision_function(X)
+        if scores.shape[1] == 1:
+            positive = expit(scores[:, 0])
+            return np.column_stack((1.0 - positive, positive))
+        return softmax(scores)
+
+    def predict(self, X):
+        """
+        Class labels for classifiers, target values for regressors.
+        """
+        scores = self.decision_function(X)
+        if self.classes is None:
+            return scores[:, 0] if scores.shape[1] == 1 else scores
+        if scores.shape[1] == 1:
+            return self.classes[(scores[:, 0] > 0).astype(int)]
+        return self.classes[scores.argmax(axis=1)]
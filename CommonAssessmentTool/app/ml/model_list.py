@@ -1,30 +1,133 @@
+"""
+Selectable machine learning models.
+
+Models live in a versioned registry under app/ml/models/ (see
+app.ml.registry). Nothing is loaded at import: listing models reads only
+their metadata, a model's memory-mapped artifact is opened on first use, and
+warm_up_models() can load them in the background at startup. Requests only
+serve registered versions; register a dummy-data version of every model
+family that has none with:
+
+    python -m app.ml.model_list
+"""
+
+import argparse
+import os
+from typing import Any, Dict, List, Tuple
+
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.linear_model import LogisticRegression
-from sklearn.neural_network import MLPClassifier
 
-# Dummy training data
-X_dummy = np.random.rand(100, 24)
-y_dummy = np.random.randint(2, size=100)
+from app.clients.service.columnar_preprocessing import CLIENT_COLUMNS
+from app.ml.artifacts import from_sklearn
+from app.ml.registry import CLIENT_ROLE, ModelRegistry, data_hash
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+MODEL_NAMES = ["logistic_regression", "random_forest", "neural_net"]
+
+registry = ModelRegistry(MODELS_DIR)
+
+
+def dummy_training_data():
+    rng = np.random.RandomState(42)
+    X_dummy = rng.rand(100, 24)
+    y_dummy = rng.randint(2, size=100)
+    return X_dummy, y_dummy
+
+
+def make_estimator(model_name: str, **params):
+    """
+    Unfitted scikit-learn classifier of one of the MODEL_NAMES families.
+
+    Args:
+        model_name (str): One of MODEL_NAMES
+        params: Parameters overriding the family's defaults
+
+    Raises:
+        ValueError: If the family is unknown
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.neural_network import MLPClassifier
+
+    defaults: Dict[str, Tuple[Any, Dict[str, Any]]] = {
+        "logistic_regression": (LogisticRegression, {}),
+        "random_forest": (RandomForestClassifier, {"random_state": 42}),
+        "neural_net": (
+            MLPClassifier,
+            {"hidden_layer_sizes": (64, 32), "max_iter": 500, "random_state": 42},
+        ),
+    }
+    if model_name not in defaults:
+        raise ValueError(f"Unknown model family: {model_name}")
+    estimator, family_params = defaults[model_name]
+    return estimator(**{**family_params, **params})
 
-# Initialize models
-logistic_regression = LogisticRegression().fit(X_dummy, y_dummy)
-random_forest = RandomForestClassifier().fit(X_dummy, y_dummy)
-neural_net = MLPClassifier(hidden_layer_sizes=(64, 32), max_iter=500).fit(
-    X_dummy, y_dummy
-)
 
-# Store them in the model dictionary
-available_models = {
-    "logistic_regression": logistic_regression,
-    "random_forest": random_forest,
-    "neural_net": neural_net,
-}
+def train_dummy_model(model_name: str):
+    """
+    Train one of the dummy models on seeded random data.
+    """
+    X_dummy, y_dummy = dummy_training_data()
+    return make_estimator(model_name).fit(X_dummy, y_dummy)
 
 
-def list_available_models():
-    return list(available_models.keys())
+def register_dummy_model(model_name: str) -> Dict[str, Any]:
+    """
+    Train a dummy model and register it as a new version.
+    """
+    model = from_sklearn(train_dummy_model(model_name))
+    return registry.register(
+        model_name,
+        model,
+        CLIENT_COLUMNS,
+        data_hash(*dummy_training_data()),
+        role=CLIENT_ROLE,
+    )
+
+
+def list_available_models() -> List[str]:
+    """
+    Registered models served by the /ml endpoints: those registered with
+    the client role. Intervention models, such as ensembles over the full
+    prediction matrix and the fast tier's surface model, are served by their
+    prediction engine.
+    """
+    return [name for name in registry.names() if serves_clients(name)]
+
+
+def serves_clients(model_name: str) -> bool:
+    """Whether the latest version of a registered model has the client role"""
+    return registry.metadata(model_name).get("role") == CLIENT_ROLE
+
+
+def list_model_metadata() -> List[Dict[str, Any]]:
+    """Metadata of the latest version of every registered model"""
+    return registry.list_models()
 
 
 def get_model(model_name: str):
-    return available_models.get(model_name)
+    if model_name not in registry.names() or not serves_clients(model_name):
+        return None
+    return registry.load(model_name)
+
+
+def warm_up_models():
+    """Load every model in a background thread"""
+    return registry.warm_up(list_available_models(), load=get_model)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Register dummy models for families without a version."
+    )
+    parser.add_argument("--families", nargs="+", default=MODEL_NAMES)
+    args = parser.parse_args()
+    for model_name in args.families:
+        if registry.versions(model_name):
+            continue
+        metadata = register_dummy_model(model_name)
+        print(f"Registered {model_name}:{metadata['version']}")
+
+
+if __name__ == "__main__":
+    main()
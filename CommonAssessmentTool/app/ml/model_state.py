@@ -1,22 +1,367 @@
-from app.ml.model_list import get_model
+"""
+The active selectable model, switched atomically across worker processes.
 
-_current_model = "logistic_regression"
+Which model is active is recorded in a small JSON state file shared by every
+worker on the host: the model name and registry version, a generation
+counter that every publish increments, and the previously active model.
+Writers hold an exclusive lock on a companion lock file and replace the
+state file atomically, so readers see either the old or the new state.
 
+Every process serves from an immutable ActiveModel snapshot held in a single
+module global. A request takes the snapshot once and uses it throughout, so
+it can never observe a half-switched state. Switching:
 
-def get_current_model():
-    return _current_model
+1. loads the new version from the registry and warms it with synthetic
+   batches, while the current snapshot keeps serving;
+2. publishes it as the next generation in the state file;
+3. replaces the local snapshot with one reference assignment.
 
+Other workers notice the new generation, either through ModelStateWatcher
+(started with the app) or lazily when a request asks for the active model,
+and likewise load and warm the model before swapping. Rollback publishes
+the previously active model as a new generation.
 
-def set_current_model(model_name: str):
-    global _current_model
-    if get_model(model_name):
-        _current_model = model_name
-    else:
-        raise ValueError(f"Model {model_name} not found.")
+A generation may also name a canary model, serving a percentage of requests,
+and a shadow model, scored in the background on a sample of requests (see
+app.ml.traffic). They are loaded, warmed and swapped in together with the
+primary model as one immutable Deployment snapshot, and switching the
+primary model keeps them.
+
+Configuration (environment variables):
+    MODEL_STATE_PATH: Shared state file (default app/ml/models/active.json)
+    MODEL_SYNC_SECONDS: How often workers check the state file (default 1)
+    MODEL_WARMUP_BATCHES: Synthetic batches run before publishing (default 3)
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+import numpy as np
+
+from app.clients.service.columnar_preprocessing import CLIENT_COLUMNS
+from app.ml.model_list import MODELS_DIR, get_model, registry
+from app.ml.model_version import bump_model_version
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "logistic_regression"
+STATE_PATH = os.getenv("MODEL_STATE_PATH", os.path.join(MODELS_DIR, "active.json"))
+SYNC_SECONDS = float(os.getenv("MODEL_SYNC_SECONDS", "1"))
+WARMUP_BATCHES = int(os.getenv("MODEL_WARMUP_BATCHES", "3"))
+WARMUP_BATCH_SIZE = 64
+
+
+class ActiveModel(NamedTuple):
+    generation: int
+    name: str
+    version: int
+    model: Any
+
+    @property
+    def label(self) -> str:
+        """Value of the X-Model-Version response header"""
+        return f"{self.name}:{self.version}"
+
+
+def warm_up(model: Any, batches: int = WARMUP_BATCHES) -> None:
+    """
+    Run synthetic batches through a model before it takes traffic.
+
+    This touches every memory-mapped page the model reads and checks that
+    its outputs are finite.
+
+    Raises:
+        ValueError: If the model produces non-finite outputs
+    """
+    rng = np.random.RandomState(0)
+    for _ in range(batches):
+        X = rng.randint(0, 11, (WARMUP_BATCH_SIZE, model.n_features))
+        outputs = [model.predict(X)]
+        if hasattr(model, "predict_proba"):
+            outputs.append(model.predict_proba(X))
+        if not all(np.isfinite(np.asarray(out, dtype=float)).all() for out in outputs):
+            raise ValueError("Model produced non-finite outputs during warm-up")
+
+
+class ModelStateFile:
+    """
+    JSON state shared by all workers, updated under an exclusive file lock.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def read(self) -> Dict[str, Any]:
+        try:
+            with open(self.path) as state_file:
+                return json.load(state_file)
+        except FileNotFoundError:
+            return {"generation": 0, "name": DEFAULT_MODEL, "version": None}
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(f"{self.path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def update(self, change: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        """
+        Apply change to the current state and publish it as the next generation.
+
+        Returns:
+            dict: The published state
+        """
+        with self._locked():
+            current = self.read()
+            state = change(current)
+            state["generation"] = current["generation"] + 1
+            state["published_at"] = datetime.now(timezone.utc).isoformat(
+                timespec="seconds"
+            )
+            staging_path = f"{self.path}.tmp-{os.getpid()}"
+            with open(staging_path, "w") as state_file:
+                json.dump(state, state_file, indent=2, sort_keys=True)
+            os.replace(staging_path, self.path)
+            return state
+
+
+state_file = ModelStateFile(STATE_PATH)
+_deployment: Optional["Deployment"] = None
+_last_sync = 0.0
+_activate_lock = threading.Lock()
+TRAFFIC_ROLES = ("canary", "shadow")
+
+
+class Deployment(NamedTuple):
+    """
+    Every model one published generation serves with: the primary model,
+    an optional canary taking canary_percent of requests and an optional
+    shadow scored on a shadow_rate sample of requests.
+    """
+
+    primary: ActiveModel
+    canary: Optional[ActiveModel] = None
+    canary_percent: float = 0.0
+    shadow: Optional[ActiveModel] = None
+    shadow_rate: float = 0.0
+
+    @property
+    def generation(self) -> int:
+        return self.primary.generation
+
+    def members(self):
+        return [model for model in (self.primary, self.canary, self.shadow) if model]
+
+
+def _load(name: str, version: Optional[int]):
+    if get_model(name) is None:
+        raise ValueError(f"Model {name} not found.")
+    version = registry.resolve(name, version)
+    model = registry.load(name, version)
+    # The ML endpoints take client features only; intervention models such as
+    # ensembles over the full prediction matrix are served by their engine.
+    if model.n_features != len(CLIENT_COLUMNS):
+        raise ValueError(
+            f"Model {name} takes {model.n_features} features, "
+            f"not the {len(CLIENT_COLUMNS)} client features."
+        )
+    return version, model
+
+
+def _activate(state: Dict[str, Any], warm: Optional[Dict[str, Any]] = None):
+    """
+    Load, warm up and swap in the models a state describes.
+
+    Args:
+        state (dict): Published state
+        warm (dict): Models already loaded and warm, keyed by "name:version"
+
+    Returns:
+        Deployment: The deployment now serving
+    """
+    global _deployment
+    with _activate_lock:
+        if _deployment is not None and _deployment.generation >= state["generation"]:
+            return _deployment
+        current = _deployment.members() if _deployment is not None else []
+        warm = {**{model.label: model.model for model in current}, **(warm or {})}
+
+        def member(spec: Dict[str, Any]) -> ActiveModel:
+            version = registry.resolve(spec["name"], spec["version"])
+            model = warm.get(f"{spec['name']}:{version}")
+            if model is None:
+                version, model = _load(spec["name"], version)
+                warm_up(model)
+            return ActiveModel(state["generation"], spec["name"], version, model)
+
+        traffic = state.get("traffic") or {}
+        canary, shadow = (traffic.get(role) for role in TRAFFIC_ROLES)
+        _deployment = Deployment(
+            member(state),
+            member(canary) if canary else None,
+            canary["percent"] if canary else 0.0,
+            member(shadow) if shadow else None,
+            shadow["sample_rate"] if shadow else 0.0,
+        )
+        bump_model_version()
+        return _deployment
+
+
+def sync() -> Deployment:
+    """
+    Adopt the generation in the state file if it is newer than ours.
+    """
+    global _last_sync
+    _last_sync = time.monotonic()
+    state = state_file.read()
+    if _deployment is None or state["generation"] > _deployment.generation:
+        return _activate(state)
+    return _deployment
+
+
+def deployment() -> Deployment:
+    """
+    Snapshot of the active deployment; use the same snapshot for a whole request.
+    """
+    if _deployment is None:
+        return sync()
+    if not watcher.running and time.monotonic() - _last_sync >= SYNC_SECONDS:
+        try:
+            return sync()
+        except Exception:
+            # Keep serving the models we have rather than failing the request.
+            logger.exception("Adopting the published model failed")
+    return _deployment
+
+
+def active_model() -> ActiveModel:
+    """
+    Snapshot of the primary model; use the same snapshot for a whole request.
+    """
+    return deployment().primary
+
+
+def get_current_model() -> str:
+    return active_model().name
+
+
+def set_current_model(model_name: str, version: Optional[int] = None) -> ActiveModel:
+    """
+    Load and warm a model version, then publish it to every worker.
+    Canary and shadow settings stay as they are.
+
+    Raises:
+        ValueError: If the model or version is unknown or fails warm-up
+    """
+    version, model = _load(model_name, version)
+    warm_up(model)
+    state = state_file.update(
+        lambda current: {
+            "name": model_name,
+            "version": version,
+            "previous": {"name": current["name"], "version": current["version"]},
+            "traffic": current.get("traffic"),
+        }
+    )
+    return _activate(state, {f"{model_name}:{version}": model}).primary
+
+
+def set_traffic(
+    canary: Optional[Dict[str, Any]] = None, shadow: Optional[Dict[str, Any]] = None
+) -> Deployment:
+    """
+    Load and warm canary and shadow models, then publish them to every worker.
+
+    Args:
+        canary (dict): name, version and percent of requests to serve, or None
+        shadow (dict): name, version and sample_rate of requests to score in
+            the background, or None
+
+    Returns:
+        Deployment: The deployment now serving
+
+    Raises:
+        ValueError: If a model is unknown, not selectable or fails warm-up
+    """
+    traffic: Dict[str, Optional[Dict[str, Any]]] = {}
+    warm: Dict[str, Any] = {}
+    for role, spec in zip(TRAFFIC_ROLES, (canary, shadow)):
+        if not spec:
+            traffic[role] = None
+            continue
+        version, model = _load(spec["name"], spec.get("version"))
+        warm_up(model)
+        warm[f"{spec['name']}:{version}"] = model
+        traffic[role] = {**spec, "version": version}
+    state = state_file.update(lambda current: {**current, "traffic": traffic})
+    return _activate(state, warm)
+
+
+def rollback() -> ActiveModel:
+    """
+    Publish the previously active model again.
+
+    Raises:
+        ValueError: If no model was active before the current one
+    """
+    previous = state_file.read().get("previous")
+    if not previous:
+        raise ValueError("No previous model to roll back to.")
+    return set_current_model(previous["name"], previous["version"])
 
 
 def predict(X):
-    model = get_model(_current_model)
-    if model is None:
-        raise ValueError("Model is not loaded")
-    return model.predict_proba(X)[:, 1]
+    return active_model().model.predict_proba(X)[:, 1]
+
+
+class ModelStateWatcher:
+    """
+    Daemon thread adopting newly published generations in the background,
+    so that request threads never load a model themselves.
+    """
+
+    def __init__(self, interval: float = SYNC_SECONDS):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                sync()
+            except Exception:
+                logger.exception("Adopting the published model failed")
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        sync()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._loop, name="model-state-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+watcher = ModelStateWatcher()
@@ -0,0 +1,45 @@
+"""
+Process-wide version of the active prediction model.
+
+Anything that changes which model serves predictions bumps the version, and
+anything derived from model output (such as cached predictions) records the
+version it was computed with so it can tell when it has gone stale. A
+prediction engine whose model changes in place, such as the online model,
+bumps a version of its own instead, which only its derived results follow.
+"""
+
+import threading
+from typing import Dict, Optional
+
+_version = 0
+_engine_versions: Dict[str, int] = {}
+_lock = threading.Lock()
+
+
+def get_model_version(engine: Optional[str] = None) -> int:
+    """
+    The process-wide version, or the version of one engine's model.
+    """
+    if engine is None:
+        return _version
+    return _engine_versions.get(engine, 0)
+
+
+def bump_model_version(engine: Optional[str] = None) -> int:
+    """
+    Mark the active model, or one prediction engine's model, as changed.
+
+    Args:
+        engine (str): Prediction engine whose model changed; results of the
+            other engines stay valid. Omit to invalidate every engine.
+
+    Returns:
+        int: The new model version
+    """
+    global _version
+    with _lock:
+        if engine is None:
+            _version += 1
+            return _version
+        _engine_versions[engine] = _engine_versions.get(engine, 0) + 1
+        return _engine_versions[engine]
@@ -0,0 +1,117 @@
+"""
+NumPy runtime for multi-layer perceptrons exported from scikit-learn.
+"""
+
+from typing import Callable, Dict
+
+import numpy as np
+
+from app.ml.linear import expit, softmax
+
+ACTIVATIONS: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    "identity": lambda values: values,
+    "logistic": expit,
+    "tanh": np.tanh,
+    "relu": lambda values: np.maximum(values, 0),
+}
+
+
+class MLPModel:
+    """
+    Feed-forward network with one weight matrix and bias per layer.
+    """
+
+    kind = "mlp"
+
+    def __init__(self, coefs, intercepts, activation, out_activation, classes=None):
+        """
+        Args:
+            coefs (list): Weight matrices, one per layer
+            intercepts (list): Bias vectors, one per layer
+            activation (str): Hidden layer activation, a key of ACTIVATIONS
+            out_activation (str): "identity", "logistic" or "softmax"
+            classes (np.array): Class labels for classifiers, None for regressors
+        """
+        self.coefs = list(coefs)
+        self.intercepts = list(intercepts)
+        self.activation = activation
+        self.out_activation = out_activation
+        self.classes = classes
+
+    @property
+    def n_features(self):
+        return self.coefs[0].shape[0]
+
+    @classmethod
+    def from_sklearn(cls, estimator):
+        """
+        Build from a fitted MLPClassifier or MLPRegressor.
+        """
+        return cls(
+            coefs=[np.asarray(coef, dtype=np.float64) for coef in estimator.coefs_],
+            intercepts=[
+                np.asarray(intercept, dtype=np.float64)
+                for intercept in estimator.intercepts_
+            ],
+            activation=estimator.activation,
+            out_activation=estimator.out_activation_,
+            classes=getattr(estimator, "classes_", None),
+        )
+
+    @classmethod
+    def from_artifact(cls, arrays, meta):
+        n_layers = meta["n_layers"]
+        return cls(
+            coefs=[arrays[f"coef_{layer}"] for layer in range(n_layers)],
+            intercepts=[arrays[f"intercept_{layer}"] for layer in range(n_layers)],
+            activation=meta["activation"],
+            out_activation=meta["out_activation"],
+            classes=arrays.get("classes"),
+        )
+
+    def to_artifact(self):
+        arrays = {}
+        for layer, (coef, intercept) in enumerate(zip(self.coefs, self.intercepts)):
+            arrays[f"coef_{layer}"] = coef
+            arrays[f"intercept_{layer}"] = intercept
+        if self.classes is not None:
+            arrays["classes"] = self.classes
+        meta = {
+            "n_layers": len(self.coefs),
+            "activation": self.activation,
+            "out_activation": self.out_activation,
+            "n_features": self.n_features,
+        }
+        return arrays, meta
+
+    def _forward(self, X):
+        activations = np.asarray(X, dtype=np.float64).reshape(-1, self.n_features)
+        hidden = ACTIVATIONS[self.activation]
+        last_layer = len(self.coefs) - 1
+        for layer, (coef, intercept) in enumerate(zip(self.coefs, self.intercepts)):
+            activations = activations @ coef + intercept
+            if layer != last_layer:
+                activations = hidden(activations)
+        if self.out_activation == "softmax":
+            return softmax(activations)
+        return ACTIVATIONS[self.out_activation](activations)
+
+    def predict_proba(self, X):
+        """
+        Class probabilities of shape (n, n_classes).
+        """
+        if self.classes is None:
+            raise ValueError("predict_proba is only available for classifiers")
+        output = self._forward(X)
+        if output.shape[1] == 1:
+            return np.column_stack((1.0 - output[:, 0], output[:, 0]))
+        return output
+
+    def predict(self, X):
+        """
+        Class labels for classifiers, target values for regressors.
+        """
+        if self.classes is None:
+            output = self._forward(X)
+            return output[:, 0] if output.shape[1] == 1 else output
+        return self.classes[self.predict_proba(X).argmax(axis=1)]
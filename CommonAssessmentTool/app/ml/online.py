@@ -0,0 +1,458 @@
+"""
+Online updates of an intervention model from recorded outcomes.
+
+OnlineRidge is a ridge regression of success_rate on the 31 client and
+intervention features (the prediction matrix columns) that keeps its
+sufficient statistics, X'X and X'y, next to its weights. Adding a batch of
+outcomes adds that batch's statistics and re-solves one 32 x 32 system, so
+updates cost the same however many outcomes came before, and the model
+after any sequence of batches equals a ridge fit on all of them at once.
+
+Recording an outcome (ClientCaseService.update_client_services setting
+success_rate) only appends the case's key to OutcomeUpdater's queue. Its
+daemon thread reads queued cases from the database in mini-batches, builds
+an updated model and swaps it in with one reference assignment; serving
+threads read that reference without a lock. The "online" prediction engine
+(see app.clients.service.logic) serves it; with PREDICTION_EXECUTOR=process,
+executor processes serve the version registered when they first used it.
+Each update bumps the "online" model version only, so just that engine's
+cached predictions are invalidated.
+
+The model is append-only: every recorded outcome adds a row, including a
+new success_rate for a case whose earlier outcome was already applied, and
+nothing is ever subtracted. Subtracting would need the exact row applied
+before, which is gone once the client's features change and was never
+applied if the queue dropped it. Corrected outcomes therefore weigh in
+alongside the ones they replace until the model is refit from the database
+with the command below.
+
+Updates are checkpointed as new versions of ONLINE_MODEL in the registry
+every ONLINE_CHECKPOINT_OUTCOMES outcomes or ONLINE_CHECKPOINT_SECONDS, and
+on shutdown. Each worker applies the outcomes it received, so a checkpoint
+adds the statistics gathered since the worker's last checkpoint to the
+latest registered version, under a file lock, and the worker then serves
+the merged model. Register the first version, fit on every outcome in the
+database, with:
+
+    python -m app.ml.online [--alpha 1.0]
+
+Configuration (environment variables):
+    ONLINE_MODEL: Registered model name (default intervention_online)
+    ONLINE_BATCH_SIZE: Most outcomes applied per update (default 64)
+    ONLINE_MAX_WAIT_SECONDS: How long outcomes may accumulate before a
+        partial batch is applied (default 1)
+    ONLINE_MAX_PENDING: Outcomes queued before new ones are dropped
+        (default 10000)
+    ONLINE_CHECKPOINT_OUTCOMES: Outcomes between checkpoints (default 500)
+    ONLINE_CHECKPOINT_SECONDS: Longest time between checkpoints of applied
+        outcomes (default 300)
+"""
+
+import argparse
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.ml.background import QueueWorker
+from app.ml.model_version import bump_model_version
+
+logger = logging.getLogger(__name__)
+
+ONLINE_MODEL = os.getenv("ONLINE_MODEL", "intervention_online")
+BATCH_SIZE = int(os.getenv("ONLINE_BATCH_SIZE", "64"))
+MAX_WAIT_SECONDS = float(os.getenv("ONLINE_MAX_WAIT_SECONDS", "1"))
+MAX_PENDING = int(os.getenv("ONLINE_MAX_PENDING", "10000"))
+CHECKPOINT_OUTCOMES = int(os.getenv("ONLINE_CHECKPOINT_OUTCOMES", "500"))
+CHECKPOINT_SECONDS = float(os.getenv("ONLINE_CHECKPOINT_SECONDS", "300"))
+
+
+class OnlineRidge:
+    """
+    Ridge regression that can be updated with further batches of data.
+
+    Instances are never modified: updated() returns a new model, so a model
+    can keep serving while its successor is built.
+    """
+
+    kind = "online_ridge"
+
+    def __init__(self, gram, moment, count: int = 0, alpha: float = 1.0):
+        """
+        Args:
+            gram (np.array): X'X of the features with a trailing column of
+                ones, shape (n_features + 1, n_features + 1)
+            moment (np.array): X'y of the same, shape (n_features + 1,)
+            count (int): Number of rows the statistics cover
+            alpha (float): L2 penalty of the weights; the intercept is not
+                penalized
+        """
+        self.gram = np.asarray(gram, dtype=np.float64)
+        self.moment = np.asarray(moment, dtype=np.float64)
+        self.count = int(count)
+        self.alpha = float(alpha)
+        solution = np.zeros(len(self.moment))
+        if self.count:
+            penalty = np.full(len(self.moment), self.alpha)
+            penalty[-1] = 0.0
+            solution = np.linalg.solve(self.gram + np.diag(penalty), self.moment)
+        self.coef = solution[:-1]
+        self.intercept = float(solution[-1])
+
+    @classmethod
+    def empty(cls, n_features: int, alpha: float = 1.0) -> "OnlineRidge":
+        """A model that has seen no data and predicts 0"""
+        size = n_features + 1
+        return cls(np.zeros((size, size)), np.zeros(size), 0, alpha)
+
+    @property
+    def n_features(self):
+        return len(self.moment) - 1
+
+    @staticmethod
+    def statistics(X, y) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Sufficient statistics of a batch.
+
+        Args:
+            X (np.array): Features of shape (n, n_features)
+            y (np.array): Targets of shape (n,)
+
+        Returns:
+            tuple: X'X and X'y of X with a trailing column of ones
+        """
+        X = np.asarray(X, dtype=np.float64)
+        design = np.empty((len(X), X.shape[1] + 1))
+        design[:, :-1] = X
+        design[:, -1] = 1.0
+        return design.T @ design, design.T @ np.asarray(y, dtype=np.float64)
+
+    def updated(self, gram, moment, count: int) -> "OnlineRidge":
+        """
+        A new model whose statistics also cover another batch's.
+        """
+        return OnlineRidge(
+            self.gram + gram, self.moment + moment, self.count + count, self.alpha
+        )
+
+    def partial_fit(self, X, y) -> "OnlineRidge":
+        """
+        A new model fit on the data so far plus a batch.
+
+        Args:
+            X (np.array): Features of shape (n, n_features)
+            y (np.array): Targets of shape (n,)
+
+        Returns:
+            OnlineRidge: The updated model; this one is unchanged
+        """
+        return self.updated(*self.statistics(X, y), len(y))
+
+    @classmethod
+    def from_artifact(cls, arrays, meta):
+        return cls(arrays["gram"], arrays["moment"], meta["count"], meta["alpha"])
+
+    def to_artifact(self):
+        arrays = {"gram": self.gram, "moment": self.moment}
+        meta = {"n_features": self.n_features, "count": self.count, "alpha": self.alpha}
+        return arrays, meta
+
+    def predict(self, X):
+        """
+        Predicted targets of shape (n,).
+        """
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.n_features)
+        return X @ self.coef + self.intercept
+
+
+def load_outcomes(case_keys: List[Tuple[int, int]], session_factory=None):
+    """
+    Encoded outcomes of the given cases, read in a session of their own.
+
+    Args:
+        case_keys (list): (client_id, user_id) of the cases
+        session_factory: Creates the session, app.database.SessionLocal when
+            omitted
+
+    Returns:
+        tuple: Features of shape (n, 31) and success rates of shape (n,) of
+            the cases that have an outcome and complete client features
+    """
+    import pandas as pd
+
+    from app.clients.service.client_repository import SQLAlchemyClientRepository
+    from app.clients.service.columnar_preprocessing import CLIENT_COLUMNS
+    from app.database import SessionLocal
+    from app.ml.training import encode_training_frame
+
+    db = (session_factory or SessionLocal)()
+    try:
+        repo = SQLAlchemyClientRepository(db)
+        frame = pd.concat(
+            list(repo.iter_training_chunks(len(case_keys), case_keys)),
+            ignore_index=True,
+        )
+    finally:
+        db.close()
+    rows = encode_training_frame(frame.dropna(subset=CLIENT_COLUMNS))
+    return rows[:, :-1], rows[:, -1]
+
+
+class OutcomeUpdater(QueueWorker):
+    """
+    Daemon thread applying recorded outcomes to the online model in
+    mini-batches and checkpointing it to the registry.
+    """
+
+    thread_name = "online-updater"
+    failure_message = "Applying recorded outcomes failed"
+
+    def __init__(
+        self,
+        name: str = ONLINE_MODEL,
+        registry=None,
+        load: Callable[[List[Tuple[int, int]]], Any] = load_outcomes,
+        batch_size: int = BATCH_SIZE,
+        max_wait_seconds: float = MAX_WAIT_SECONDS,
+        max_pending: int = MAX_PENDING,
+        checkpoint_outcomes: int = CHECKPOINT_OUTCOMES,
+        checkpoint_seconds: float = CHECKPOINT_SECONDS,
+        alpha: float = 1.0,
+    ):
+        """
+        Args:
+            name (str): Registered model name
+            registry (ModelRegistry): Registry of the checkpoints, the shared
+                app.ml.model_list registry when omitted
+            load: Returns (features, success rates) of the given case keys
+            batch_size (int): Most outcomes applied per update
+            max_wait_seconds (float): Time outcomes may accumulate into one
+                update
+            max_pending (int): Outcomes queued before new ones are dropped
+            checkpoint_outcomes (int): Outcomes between checkpoints
+            checkpoint_seconds (float): Longest time between checkpoints
+            alpha (float): L2 penalty of a model started from scratch
+        """
+        super().__init__(batch_size, max_wait_seconds, max_pending)
+        self.name = name
+        self._registry = registry
+        self.load = load
+        self.checkpoint_outcomes = checkpoint_outcomes
+        self.checkpoint_seconds = checkpoint_seconds
+        self.alpha = alpha
+        self._model: Optional[OnlineRidge] = None
+        self._base_version: Optional[int] = None
+        self._load_lock = threading.Lock()
+        # Statistics applied since the last checkpoint: X'X, X'y and count
+        self._delta: Optional[Tuple[np.ndarray, np.ndarray, int]] = None
+        self._last_checkpoint = time.monotonic()
+        self.recorded = 0
+        self.applied = 0
+        self.batches = 0
+        self.checkpoints = 0
+
+    @property
+    def registry(self):
+        if self._registry is None:
+            from app.ml.model_list import registry
+
+            self._registry = registry
+        return self._registry
+
+    @property
+    def model(self) -> Optional[OnlineRidge]:
+        """
+        The model serving now, None until a version is registered or an
+        outcome applied. Read without locking.
+        """
+        model = self._model
+        if model is None:
+            with self._load_lock:
+                if self._model is None and self.registry.versions(self.name):
+                    self._base_version = self.registry.resolve(self.name)
+                    self._model = self.registry.load(self.name, self._base_version)
+                model = self._model
+        return model
+
+    def record(self, client_id: int, user_id: int) -> bool:
+        """
+        Queue a case whose outcome was recorded, without waiting.
+
+        The case's current row is added to the model when applied, also if
+        an earlier outcome of the same case was applied before; see the
+        module docstring.
+
+        Returns:
+            bool: False if the queue was full and the outcome was dropped
+        """
+        if not self._enqueue([(client_id, user_id)], 1):
+            return False
+        self.recorded += 1
+        return True
+
+    def run_once(self) -> int:
+        """
+        Apply one mini-batch of queued outcomes.
+
+        Returns:
+            int: Number of outcomes applied
+        """
+        keys = self._take()
+        if not keys:
+            return 0
+        X, y = self.load(keys)
+        if not len(y):
+            return 0
+        gram, moment = OnlineRidge.statistics(X, y)
+        model = self.model or OnlineRidge.empty(X.shape[1], self.alpha)
+        self._model = model.updated(gram, moment, len(y))
+        bump_model_version("online")
+        if self._delta is None:
+            self._delta = (gram, moment, len(y))
+        else:
+            self._delta = (
+                self._delta[0] + gram,
+                self._delta[1] + moment,
+                self._delta[2] + len(y),
+            )
+        self.applied += len(y)
+        self.batches += 1
+        if self._delta[2] >= self.checkpoint_outcomes:
+            self.checkpoint()
+        return len(y)
+
+    @contextmanager
+    def _locked(self):
+        root = self.registry.root
+        os.makedirs(root, exist_ok=True)
+        with open(os.path.join(root, f"{self.name}.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def checkpoint(self) -> Optional[Dict[str, Any]]:
+        """
+        Register the outcomes applied since the last checkpoint as a new
+        version. Called from the updating thread only.
+
+        Returns:
+            dict: The new version's metadata, None if nothing was applied
+        """
+        from app.clients.service.logic import FEATURE_SCHEMA
+        from app.ml.registry import data_hash
+
+        self._last_checkpoint = time.monotonic()
+        if self._delta is None:
+            return None
+        gram, moment, count = self._delta
+        with self._locked():
+            versions = self.registry.versions(self.name)
+            latest = versions[-1] if versions else None
+            if latest == self._base_version and self._model is not None:
+                model = self._model
+            else:
+                # Other workers checkpointed since; add our outcomes to theirs.
+                base = self.registry.load(self.name, latest)
+                model = base.updated(gram, moment, count)
+            metadata = self.registry.register(
+                self.name,
+                model,
+                FEATURE_SCHEMA,
+                data_hash(model.gram, model.moment),
+                {"online": {"outcomes": model.count, "base_version": latest}},
+            )
+        if model is not self._model:
+            self._model = model
+            bump_model_version("online")
+        self._base_version = metadata["version"]
+        self._delta = None
+        self.checkpoints += 1
+        return metadata
+
+    def _work(self) -> None:
+        self.run_once()
+        if time.monotonic() - self._last_checkpoint >= self.checkpoint_seconds:
+            self.checkpoint()
+
+    def stop(self) -> None:
+        """Stop the thread, then apply and checkpoint what is still queued"""
+        super().stop()
+        try:
+            while self.pending:
+                self.run_once()
+            self.checkpoint()
+        except Exception:
+            logger.exception("Checkpointing recorded outcomes failed")
+
+    def stats(self) -> Dict[str, Any]:
+        model = self._model
+        return {
+            "pending": self.pending,
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "applied": self.applied,
+            "batches": self.batches,
+            "checkpoints": self.checkpoints,
+            "version": self._base_version,
+            "outcomes": model.count if model is not None else 0,
+        }
+
+
+online_updater = OutcomeUpdater()
+
+
+def fit_online_model(X, y, alpha: float = 1.0, chunk_size: int = 50_000) -> OnlineRidge:
+    """
+    Fit an OnlineRidge on a dataset, one chunk of rows at a time.
+    """
+    model = OnlineRidge.empty(X.shape[1], alpha)
+    for start in range(0, len(y), chunk_size):
+        end = start + chunk_size
+        model = model.partial_fit(X[start:end], y[start:end])
+    return model
+
+
+def main():
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.clients.service.client_repository import SQLAlchemyClientRepository
+    from app.clients.service.logic import FEATURE_SCHEMA
+    from app.database import SQLALCHEMY_DATABASE_URL
+    from app.ml.model_list import registry
+    from app.ml.registry import data_hash
+    from app.ml.training import load_training_matrix
+
+    parser = argparse.ArgumentParser(description="Register the online model.")
+    parser.add_argument("--database-url", default=SQLALCHEMY_DATABASE_URL)
+    parser.add_argument("--alpha", type=float, default=1.0)
+    parser.add_argument("--name", default=ONLINE_MODEL)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    with sessionmaker(bind=engine)() as db:
+        matrix, stats = load_training_matrix(SQLAlchemyClientRepository(db))
+    if not stats["rows"]:
+        parser.error("No client cases with a recorded success rate")
+    model = fit_online_model(matrix[:, :-1], matrix[:, -1], args.alpha)
+    metadata = registry.register(
+        args.name,
+        model,
+        FEATURE_SCHEMA,
+        data_hash(model.gram, model.moment),
+        {"online": {"outcomes": model.count, "base_version": None}},
+    )
+    print(json.dumps(stats))
+    print(f"Registered {args.name} version {metadata['version']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Intervention-aware partial evaluation of tree ensembles.
+
+The intervention sweep scores one client against every combination of
+intervention flags. The client features are identical in every row, so each
+tree only needs to be walked once: splits on client features follow a single
+branch, and only splits on intervention features fan out to partition the
+combinations. Leaf values are accumulated in tree order and averaged the same
+way scikit-learn's RandomForestRegressor does, so results match
+``model.predict`` exactly.
+"""
+
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+TreeArrays = Tuple[List[int], List[int], List[int], List[float], List[float]]
+
+LEAF = -1
+
+
+class InterventionPartialEvaluator:
+    """
+    Score all intervention combinations of one client in a single pass per tree.
+    """
+
+    def __init__(self, trees: Sequence[TreeArrays], num_client_features: int):
+        """
+        Args:
+            trees: Per-tree (children_left, children_right, feature, threshold,
+                value) node lists
+            num_client_features: Number of leading client feature columns; any
+                feature index at or beyond this is an intervention flag
+        """
+        self.trees = list(trees)
+        self.num_client_features = num_client_features
+
+    @classmethod
+    def from_sklearn(cls, model, num_client_features: int):
+        """
+        Build an evaluator from a fitted RandomForestRegressor.
+
+        Args:
+            model: Fitted scikit-learn forest regressor
+            num_client_features (int): Number of leading client feature columns
+
+        Returns:
+            InterventionPartialEvaluator: Evaluator over the forest's trees
+        """
+        trees = []
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            trees.append(
+                (
+                    tree.children_left.tolist(),
+                    tree.children_right.tolist(),
+                    tree.feature.tolist(),
+                    tree.threshold.tolist(),
+                    tree.value[:, 0, 0].tolist(),
+                )
+            )
+        return cls(trees, num_client_features)
+
+    @classmethod
+    def from_forest(cls, forest, num_client_features: int):
+        """
+        Build an evaluator from a CompiledForest.
+
+        Args:
+            forest (CompiledForest): Array-backed forest
+            num_client_features (int): Number of leading client feature columns
+
+        Returns:
+            InterventionPartialEvaluator: Evaluator over the forest's trees
+        """
+        bounds = list(forest.roots) + [len(forest.value)]
+        trees = []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            node_ids = np.arange(start, stop)
+            is_leaf = forest.left[start:stop] == node_ids
+            trees.append(
+                (
+                    np.where(is_leaf, LEAF, forest.left[start:stop] - start).tolist(),
+                    np.where(is_leaf, LEAF, forest.right[start:stop] - start).tolist(),
+                    forest.feature[start:stop].tolist(),
+                    forest.threshold[start:stop].tolist(),
+                    forest.value[start:stop, 0].tolist(),
+                )
+            )
+        return cls(trees, num_client_features)
+
+    def predict_combinations(self, client_row, combinations) -> np.ndarray:
+        """
+        Predict every intervention combination for one client.
+
+        Args:
+            client_row: Client feature values, length num_client_features
+            combinations (np.array): 0/1 matrix with one row per combination
+
+        Returns:
+            np.array: One prediction per combination row
+        """
+        # Trees compare float32 inputs against float64 thresholds.
+        client = np.asarray(client_row, dtype=np.float32).tolist()
+        flags = np.asarray(combinations, dtype=np.float32)
+        all_rows = np.arange(len(flags))
+        total = np.zeros(len(flags), dtype=np.float64)
+        leaf_values = np.empty(len(flags), dtype=np.float64)
+        for tree in self.trees:
+            self._evaluate_tree(tree, client, flags, all_rows, leaf_values)
+            total += leaf_values
+        total /= len(self.trees)
+        return total
+
+    def _evaluate_tree(self, tree, client, flags, all_rows, out):
+        children_left, children_right, feature, threshold, value = tree
+        stack = [(0, all_rows)]
+        while stack:
+            node, rows = stack.pop()
+            while children_left[node] != LEAF:
+                column = feature[node]
+                if column < self.num_client_features:
+                    if client[column] <= threshold[node]:
+                        node = children_left[node]
+                    else:
+                        node = children_right[node]
+                    continue
+                goes_left = flags[rows, column - self.num_client_features] <= (
+                    threshold[node]
+                )
+                left_rows = rows[goes_left]
+                right_rows = rows[~goes_left]
+                if len(left_rows) and len(right_rows):
+                    stack.append((children_right[node], right_rows))
+                    rows = left_rows
+                    node = children_left[node]
+                elif len(left_rows):
+                    node = children_left[node]
+                else:
+                    node = children_right[node]
+            out[rows] = value[node]
@@ -0,0 +1,382 @@
+"""
+Append-only log of served predictions for audits and offline analysis.
+
+Serving a prediction only appends its input record, result, engine and
+model to an in-memory queue; when the bounded queue is full the prediction
+is dropped from the log and counted instead. A daemon thread encodes queued
+predictions into fixed-size PREDICTION_RECORD rows and writes them in bulk:
+every PREDICTION_LOG_FLUSH_SECONDS, or once PREDICTION_LOG_SEGMENT_RECORDS
+rows are buffered, the buffer becomes one new .npy segment of the UTC day
+the predictions were served:
+
+    <PREDICTION_LOG_DIR>/2026-10-18/083015-4211-000007.npy
+
+(time of the first row, process id, segment number). Segments are written
+to a temporary file and renamed, so readers never see a partial one, and are
+never modified afterwards. read_prediction_log() memory-maps a day's
+segments into one array; a day can also be summarized with:
+
+    python -m app.ml.prediction_log [--day 2026-10-18]
+
+PREDICTION_RECORD columns:
+    time        Unix time the prediction was served
+    engine      Index of the engine in logic.PREDICTION_ENGINES
+    model       Model that served it, see logic.serving_model
+    features    The 24 encoded client features
+    baseline    Prediction without interventions
+    top_scores  Scores of the recommended intervention plans, best last
+    top_plans   The plans as bit masks, bit i for COLUMN_INTERVENTIONS[i]
+
+Configuration (environment variables):
+    PREDICTION_LOG: 0 disables the log (default 1)
+    PREDICTION_LOG_DIR: Directory of the day folders
+        (default app/ml/models/predictions)
+    PREDICTION_LOG_SEGMENT_RECORDS: Rows buffered before a segment is
+        written (default 10000)
+    PREDICTION_LOG_FLUSH_SECONDS: Longest time rows stay buffered
+        (default 10)
+    PREDICTION_LOG_MAX_PENDING: Predictions queued before new ones are
+        dropped (default 100000)
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+
+from app.ml.background import QueueWorker
+from app.ml.model_list import MODELS_DIR
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("PREDICTION_LOG", "1") != "0"
+LOG_DIR = os.getenv("PREDICTION_LOG_DIR", os.path.join(MODELS_DIR, "predictions"))
+SEGMENT_RECORDS = int(os.getenv("PREDICTION_LOG_SEGMENT_RECORDS", "10000"))
+FLUSH_SECONDS = float(os.getenv("PREDICTION_LOG_FLUSH_SECONDS", "10"))
+MAX_PENDING = int(os.getenv("PREDICTION_LOG_MAX_PENDING", "100000"))
+TOP_K = 3
+PREDICTION_RECORD = np.dtype(
+    [
+        ("time", "<f8"),
+        ("engine", "u1"),
+        ("model", "S40"),
+        ("features", "<f4", (24,)),
+        ("baseline", "<f4"),
+        ("top_scores", "<f4", (TOP_K,)),
+        ("top_plans", "u1", (TOP_K,)),
+    ]
+)
+
+
+def log_day(timestamp: float) -> str:
+    """UTC day of a Unix time, the name of its log folder"""
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime(
+        "%Y-%m-%d"
+    )
+
+
+def plan_mask(names: List[str]) -> int:
+    """Bit mask of an intervention plan given by names"""
+    from app.clients.service.logic import COLUMN_INTERVENTIONS
+
+    return sum(1 << COLUMN_INTERVENTIONS.index(name) for name in names)
+
+
+def plan_names(mask: int) -> List[str]:
+    """Intervention names of a plan's bit mask"""
+    from app.clients.service.logic import COLUMN_INTERVENTIONS
+
+    return [name for i, name in enumerate(COLUMN_INTERVENTIONS) if mask >> i & 1]
+
+
+def encode_predictions(entries: List[tuple]) -> np.ndarray:
+    """
+    PREDICTION_RECORD rows of queued predictions.
+
+    Args:
+        entries (list): (time, engine, model, input record, result) tuples
+
+    Returns:
+        np.array: One row per entry
+    """
+    from app.clients.service.columnar_preprocessing import encode_records
+    from app.clients.service.logic import PREDICTION_ENGINES
+
+    records = np.zeros(len(entries), dtype=PREDICTION_RECORD)
+    records["features"] = encode_records([entry[3] for entry in entries])
+    for row, (served, engine, model, _, result) in zip(records, entries):
+        row["time"] = served
+        row["engine"] = PREDICTION_ENGINES.index(engine)
+        row["model"] = model.encode()[: PREDICTION_RECORD["model"].itemsize]
+        row["baseline"] = result["baseline"]
+        plans = result["interventions"][-TOP_K:]
+        row["top_scores"][: len(plans)] = [score for score, _ in plans]
+        row["top_plans"][: len(plans)] = [plan_mask(names) for _, names in plans]
+    return records
+
+
+class PredictionLogger(QueueWorker):
+    """
+    Buffers served predictions and writes them as .npy segments on a
+    background thread.
+    """
+
+    thread_name = "prediction-logger"
+    failure_message = "Writing the prediction log failed"
+
+    def __init__(
+        self,
+        log_dir: str = LOG_DIR,
+        enabled: bool = ENABLED,
+        segment_records: int = SEGMENT_RECORDS,
+        flush_seconds: float = FLUSH_SECONDS,
+        max_pending: int = MAX_PENDING,
+    ):
+        """
+        Args:
+            log_dir (str): Directory of the day folders
+            enabled (bool): Whether log() queues predictions at all
+            segment_records (int): Rows buffered before a segment is written
+            flush_seconds (float): Longest time rows stay buffered
+            max_pending (int): Predictions queued before new ones are dropped
+        """
+        super().__init__(segment_records, flush_seconds, max_pending)
+        self.log_dir = log_dir
+        self.enabled = enabled
+        # Serializes encoding and writing between the thread and flush()
+        self._write_lock = threading.Lock()
+        self._buffer: List[np.ndarray] = []
+        self._buffered = 0
+        self._buffered_since = time.monotonic()
+        self._segment = 0
+        self.logged = 0
+        self.failed = 0
+        self.written = 0
+        self.segments = 0
+
+    @property
+    def segment_records(self) -> int:
+        return self.batch_size
+
+    @property
+    def flush_seconds(self) -> float:
+        return self.max_wait_seconds
+
+    def log(
+        self,
+        inputs: List[Dict[str, Any]],
+        results: List[Dict[str, Any]],
+        engine: str,
+        model: str,
+    ) -> bool:
+        """
+        Queue served predictions, without waiting.
+
+        Args:
+            inputs (list): Input records of the predictions
+            results (list): Their results, with "baseline" and "interventions"
+            engine (str): Prediction engine that served them
+            model (str): Model that served them
+
+        Returns:
+            bool: False if the log is disabled or the queue was full and the
+                predictions were dropped
+        """
+        if not self.enabled:
+            return False
+        served = time.time()
+        entries = (
+            (served, engine, model, record, result)
+            for record, result in zip(inputs, results)
+        )
+        if not self._enqueue(entries, len(inputs)):
+            return False
+        self.logged += len(inputs)
+        return True
+
+    def run_once(self, force: bool = False) -> int:
+        """
+        Encode queued predictions into the buffer and write a segment if it
+        is full or old enough.
+
+        Args:
+            force (bool): Write whatever is buffered
+
+        Returns:
+            int: Number of rows written
+        """
+        with self._write_lock:
+            entries = self._take()
+            if entries:
+                try:
+                    records = encode_predictions(entries)
+                except Exception:
+                    self.failed += len(entries)
+                    raise
+                if not self._buffered:
+                    self._buffered_since = time.monotonic()
+                self._buffer.append(records)
+                self._buffered += len(records)
+            age = time.monotonic() - self._buffered_since
+            if self._buffered and (
+                force
+                or self._buffered >= self.segment_records
+                or age >= self.flush_seconds
+            ):
+                return self._write()
+            return 0
+
+    def _write(self) -> int:
+        records = np.concatenate(self._buffer)
+        self._buffer, self._buffered = [], 0
+        days = np.array([log_day(served) for served in records["time"]])
+        for day in np.unique(days):
+            segment = records[days == day]
+            folder = os.path.join(self.log_dir, day)
+            os.makedirs(folder, exist_ok=True)
+            started = time.strftime("%H%M%S", time.gmtime(segment["time"][0]))
+            name = f"{started}-{os.getpid()}-{self._segment:06d}.npy"
+            self._segment += 1
+            temporary = os.path.join(folder, f".{name}")
+            with open(temporary, "wb") as segment_file:
+                np.save(segment_file, segment)
+            os.replace(temporary, os.path.join(folder, name))
+            self.segments += 1
+        self.written += len(records)
+        return len(records)
+
+    def flush(self) -> int:
+        """
+        Write everything queued or buffered now.
+
+        Returns:
+            int: Number of rows written
+        """
+        written = 0
+        while True:
+            written += self.run_once(force=True)
+            if not self.pending:
+                return written
+
+    def start(self) -> None:
+        if self.enabled:
+            super().start()
+
+    def stop(self) -> None:
+        """Stop the thread, then write what is still queued or buffered"""
+        super().stop()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Writing the prediction log failed")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "pending": self.pending,
+            "buffered": self._buffered,
+            "logged": self.logged,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "written": self.written,
+            "segments": self.segments,
+        }
+
+
+def day_segments(day: str, log_dir: str = LOG_DIR) -> List[str]:
+    """Paths of a day's segments, oldest first"""
+    paths = glob.glob(os.path.join(log_dir, day, "*.npy"))
+    return sorted(paths, key=lambda path: os.path.basename(path).split("-")[0])
+
+
+def iter_prediction_log(day: str, log_dir: str = LOG_DIR) -> Iterator[np.ndarray]:
+    """
+    Memory-mapped segments of one day, for scans that need not load it all.
+    """
+    for path in day_segments(day, log_dir):
+        yield np.load(path, mmap_mode="r")
+
+
+def read_prediction_log(day: str, log_dir: str = LOG_DIR) -> np.ndarray:
+    """
+    All predictions logged on one UTC day.
+
+    Args:
+        day (str): Day as YYYY-MM-DD
+        log_dir (str): Directory of the day folders
+
+    Returns:
+        np.array: PREDICTION_RECORD rows ordered by time
+    """
+    segments = list(iter_prediction_log(day, log_dir))
+    if not segments:
+        return np.zeros(0, dtype=PREDICTION_RECORD)
+    records = np.concatenate(segments)
+    return records[np.argsort(records["time"], kind="stable")]
+
+
+def summarize_prediction_log(records: np.ndarray) -> Dict[str, Any]:
+    """
+    Counts per engine and model, baseline percentiles and the most
+    recommended plans.
+
+    Args:
+        records (np.array): PREDICTION_RECORD rows, e.g. from
+            read_prediction_log
+
+    Returns:
+        dict: Summary of the rows
+    """
+    from app.clients.service.logic import PREDICTION_ENGINES
+
+    if len(records) == 0:
+        return {"count": 0}
+    engines, engine_counts = np.unique(records["engine"], return_counts=True)
+    models, model_counts = np.unique(records["model"], return_counts=True)
+    best = records["top_plans"][:, -1]
+    plans, plan_counts = np.unique(best, return_counts=True)
+    order = np.argsort(-plan_counts)[:5]
+    p5, p50, p95 = np.percentile(records["baseline"], [5, 50, 95])
+    return {
+        "count": len(records),
+        "first": float(records["time"].min()),
+        "last": float(records["time"].max()),
+        "engines": {
+            PREDICTION_ENGINES[engine]: int(count)
+            for engine, count in zip(engines, engine_counts)
+        },
+        "models": {
+            model.decode(): int(count) for model, count in zip(models, model_counts)
+        },
+        "baseline": {"p5": float(p5), "p50": float(p50), "p95": float(p95)},
+        "top_plans": [
+            {"interventions": plan_names(int(plans[i])), "count": int(plan_counts[i])}
+            for i in order
+        ],
+    }
+
+
+prediction_logger = PredictionLogger()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a day's predictions.")
+    parser.add_argument("--day", default=log_day(time.time()), help="YYYY-MM-DD")
+    parser.add_argument("--log-dir", default=LOG_DIR)
+    args = parser.parse_args()
+    started = time.perf_counter()
+    records = read_prediction_log(args.day, args.log_dir)
+    summary = summarize_prediction_log(records)
+    summary["scan_seconds"] = time.perf_counter() - started
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
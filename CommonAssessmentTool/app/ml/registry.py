@@ -0,0 +1,297 @@
+"""
+Versioned on-disk model registry with lazy loading.
+
+Every registered model version is an artifact directory (see app.ml.artifacts)
+plus a small ``model.json`` describing it:
+
+    <root>/<name>/<version>/meta.json, *.npy    the artifact
+    <root>/<name>/<version>/model.json          registry metadata
+
+The metadata records the version, model kind, the role it serves, artifact
+checksum, feature schema, a hash of the training data and the creation time.
+A "client" model takes the client features and returns one success
+probability (the /ml endpoints); an "intervention" model is served by a
+prediction engine. Listing models only reads these JSON files, once per
+version since versions never change; a model's arrays are opened on first
+use and the checksum is verified then. Versions are consecutive integers and the
+highest one is the default; registering holds an exclusive lock on
+``<root>/<name>/.register.lock`` so processes never allocate the same one.
+
+Only the REGISTRY_LOADED_VERSIONS (default 2: the serving version and its
+rollback target) most recently used versions of each model stay loaded;
+loading or registering another version drops the least recently used one.
+A dropped model stays usable by whoever holds it and is unmapped once
+nothing references it.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from app.ml.artifacts import artifact_digest, load_model, save_model
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = "model.json"
+LOCK_FILE = ".register.lock"
+LOADED_VERSIONS = int(os.getenv("REGISTRY_LOADED_VERSIONS", "2"))
+CLIENT_ROLE = "client"
+INTERVENTION_ROLE = "intervention"
+
+
+def data_hash(*arrays: np.ndarray) -> str:
+    """
+    Digest of training data, to tell which data a model version was fit on.
+
+    Args:
+        arrays: Training arrays, e.g. features and targets
+
+    Returns:
+        str: 16 hex characters
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype.str}{array.shape}".encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """
+    Registry of model versions under a root directory.
+    """
+
+    def __init__(self, root: str, max_loaded: int = LOADED_VERSIONS):
+        """
+        Args:
+            root (str): Directory holding one subdirectory per model name
+            max_loaded (int): Versions of each model kept loaded, least
+                recently used dropped first
+        """
+        self.root = root
+        self.max_loaded = max(1, max_loaded)
+        # Least recently used first
+        self._loaded: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._metadata: Dict[tuple, Dict[str, Any]] = {}
+        # Guards _loaded and _metadata; _lock serializes slow loads
+        self._cache_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    def _path(self, name: str, version: int) -> str:
+        return os.path.join(self.root, name, str(version))
+
+    def versions(self, name: str) -> List[int]:
+        """Registered versions of a model, oldest first"""
+        directory = os.path.join(self.root, name)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            int(entry)
+            for entry in os.listdir(directory)
+            if entry.isdigit()
+            and os.path.isfile(os.path.join(directory, entry, MODEL_FILE))
+        )
+
+    def names(self) -> List[str]:
+        """Names of models with at least one registered version"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if self.versions(name))
+
+    def resolve(self, name: str, version: Optional[int] = None) -> int:
+        """
+        The given version if registered, else the latest one.
+
+        Raises:
+            ValueError: If the model or version is not registered
+        """
+        versions = self.versions(name)
+        if not versions:
+            raise ValueError(f"Model {name} not found.")
+        if version is None:
+            return versions[-1]
+        if version not in versions:
+            raise ValueError(f"Model {name} has no version {version}.")
+        return version
+
+    def metadata(self, name: str, version: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Registry metadata of a model version, without loading the model.
+
+        Raises:
+            ValueError: If the model or version is not registered
+        """
+        key = (name, self.resolve(name, version))
+        with self._cache_lock:
+            metadata = self._metadata.get(key)
+        if metadata is None:
+            with open(os.path.join(self._path(*key), MODEL_FILE)) as meta_file:
+                metadata = json.load(meta_file)
+            with self._cache_lock:
+                self._metadata[key] = metadata
+        return dict(metadata)
+
+    def list_models(self, all_versions: bool = False) -> List[Dict[str, Any]]:
+        """
+        Metadata of the latest (or every) version of each model.
+        """
+        return [
+            self.metadata(name, version)
+            for name in self.names()
+            for version in (
+                self.versions(name) if all_versions else [self.resolve(name)]
+            )
+        ]
+
+    @contextmanager
+    def _locked(self, name: str):
+        directory = os.path.join(self.root, name)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, LOCK_FILE), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def register(
+        self,
+        name: str,
+        model: Any,
+        feature_schema: Sequence[str],
+        training_data_hash: str,
+        extra: Optional[Dict[str, Any]] = None,
+        role: str = INTERVENTION_ROLE,
+    ) -> Dict[str, Any]:
+        """
+        Store a runtime model as the next version of name.
+
+        Args:
+            name (str): Model name
+            model: CompiledForest, LinearModel or MLPModel
+            feature_schema (list): Names of the model's input features
+            training_data_hash (str): data_hash of the training data
+            extra (dict): Additional JSON-serializable metadata
+            role (str): CLIENT_ROLE or INTERVENTION_ROLE, see the module
+                docstring
+
+        Returns:
+            dict: The new version's metadata
+        """
+        with self._locked(name):
+            versions = self.versions(name)
+            version = versions[-1] + 1 if versions else 1
+            path = self._path(name, version)
+            save_model(model, path)
+            metadata = {
+                **(extra or {}),
+                "name": name,
+                "version": version,
+                "kind": model.kind,
+                "role": role,
+                "checksum": artifact_digest(path),
+                "feature_schema": list(feature_schema),
+                "training_data_hash": training_data_hash,
+                "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            }
+            # Written last and renamed into place: a version becomes visible
+            # only once its artifact is complete.
+            staging_file = os.path.join(path, f"{MODEL_FILE}.tmp")
+            with open(staging_file, "w") as meta_file:
+                json.dump(metadata, meta_file, indent=2, sort_keys=True)
+            os.replace(staging_file, os.path.join(path, MODEL_FILE))
+        # The new version is likely loaded next; make room for it.
+        self._evict(name, self.max_loaded - 1)
+        return metadata
+
+    def load(self, name: str, version: Optional[int] = None, verify: bool = True):
+        """
+        The runtime model of a version, loaded on first use.
+
+        Args:
+            name (str): Model name
+            version (int): Version, the latest when omitted
+            verify (bool): Check the artifact against its recorded checksum
+
+        Returns:
+            CompiledForest, LinearModel or MLPModel
+
+        Raises:
+            ValueError: If the version is not registered or fails its checksum
+        """
+        version = self.resolve(name, version)
+        key = (name, version)
+        model = self._cached(key)
+        if model is not None:
+            return model
+        with self._lock:
+            model = self._cached(key)
+            if model is None:
+                path = self._path(name, version)
+                if verify:
+                    expected = self.metadata(name, version)["checksum"]
+                    if artifact_digest(path) != expected:
+                        raise ValueError(f"Checksum mismatch for {name} v{version}")
+                model = load_model(path)
+                self._evict(name, self.max_loaded - 1)
+                with self._cache_lock:
+                    self._loaded[key] = model
+            return model
+
+    def _cached(self, key: tuple) -> Any:
+        with self._cache_lock:
+            model = self._loaded.get(key)
+            if model is not None:
+                self._loaded.move_to_end(key)
+            return model
+
+    def _evict(self, name: str, keep: int) -> None:
+        """Drop all but the keep most recently used loaded versions of name"""
+        with self._cache_lock:
+            loaded = [key for key in self._loaded if key[0] == name]
+            for key in loaded[: max(0, len(loaded) - keep)]:
+                del self._loaded[key]
+
+    def is_loaded(self, name: str, version: Optional[int] = None) -> bool:
+        try:
+            key = (name, self.resolve(name, version))
+        except ValueError:
+            return False
+        with self._cache_lock:
+            return key in self._loaded
+
+    def warm_up(
+        self, names: Iterable[str], load: Optional[Callable[[str], Any]] = None
+    ) -> threading.Thread:
+        """
+        Load the latest version of each model in a background thread.
+
+        Args:
+            names (list): Model names to load
+            load: Loads one model by name, self.load when omitted
+
+        Returns:
+            threading.Thread: The started daemon thread
+        """
+        load = load or self.load
+
+        def load_all():
+            for name in names:
+                try:
+                    load(name)
+                except Exception:
+                    logger.exception("Warming up model %s failed", name)
+
+        thread = threading.Thread(target=load_all, name="model-warm-up", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,85 @@
+"""
+Full intervention response surface of a client and the effects derived from it.
+
+The model is evaluated on all 2^n intervention combinations anyway, so the
+complete surface costs nothing beyond reordering. It is laid out by bit
+mask: entry m is the prediction with exactly the interventions whose bits
+are set in m (bit i for intervention i, as in intervention_search), so
+entry 0 is the baseline and entry 1 << i is intervention i on its own.
+
+Main and pairwise interaction effects come from one fast Walsh-Hadamard
+transform of the surface. Writing the surface as a sum of parity terms
+c_S * (-1)^(sum of flags in S), the effect of switching intervention i on,
+averaged over every combination of the others, is -2 * c_{i}, and the
+averaged second difference of interventions i and j is 4 * c_{i,j}.
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+
+def mask_order(n_interventions: int) -> np.ndarray:
+    """
+    Positions of the bit-indexed surface in itertools.product order.
+
+    intervention_permutations puts the first intervention in the most
+    significant position, so the product index of mask m is m with its
+    n_interventions bits reversed.
+
+    Args:
+        n_interventions (int): Number of intervention flags
+
+    Returns:
+        np.array: order such that surface[m] == predictions[order[m]]
+    """
+    masks = np.arange(1 << n_interventions)
+    order = np.zeros_like(masks)
+    for bit in range(n_interventions):
+        order |= ((masks >> bit) & 1) << (n_interventions - 1 - bit)
+    return order
+
+
+def walsh_hadamard(values: np.ndarray) -> np.ndarray:
+    """
+    Unnormalized Walsh-Hadamard transform along the last axis.
+
+    Args:
+        values (np.array): Array whose last axis has length 2^n
+
+    Returns:
+        np.array: Transform with entry S equal to the sum over masks m of
+            values[m] * (-1)^popcount(m & S)
+    """
+    result = np.array(values, dtype=np.float64)
+    size = result.shape[-1]
+    half = 1
+    while half < size:
+        blocks = result.reshape(*result.shape[:-1], -1, 2, half)
+        low, high = blocks[..., 0, :].copy(), blocks[..., 1, :]
+        blocks[..., 0, :] += high
+        blocks[..., 1, :] = low - high
+        half *= 2
+    return result
+
+
+def surface_effects(surfaces: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Average main and pairwise interaction effects of every intervention.
+
+    Args:
+        surfaces (np.array): Bit-indexed surfaces of shape (k, 2^n)
+
+    Returns:
+        tuple: Main effects of shape (k, n) and symmetric interaction
+            effects of shape (k, n, n) with a zero diagonal
+    """
+    size = surfaces.shape[-1]
+    n_interventions = size.bit_length() - 1
+    coefficients = walsh_hadamard(surfaces) / size
+    bits = 1 << np.arange(n_interventions)
+    main = -2 * coefficients[:, bits]
+    pairs = bits[:, np.newaxis] | bits[np.newaxis, :]
+    interactions = 4 * coefficients[:, pairs]
+    interactions[:, np.arange(n_interventions), np.arange(n_interventions)] = 0
+    return main, interactions
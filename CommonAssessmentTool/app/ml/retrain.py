@@ -0,0 +1,466 @@
+"""
+Automatic retraining when enough outcomes are recorded or inputs drift.
+
+RetrainScheduler is a daemon thread that checks its triggers every
+RETRAIN_CHECK_SECONDS:
+
+    outcomes  at least RETRAIN_MIN_OUTCOMES outcomes were recorded through
+              ClientCaseService.update_client_services in this worker since
+              the last run; outcomes recorded by other workers count only
+              toward their own scheduler
+    drift     the largest PSI of any client feature between the clients in
+              the database and the training data (see app.ml.drift) reaches
+              RETRAIN_DRIFT_THRESHOLD, and after a run also exceeds the PSI
+              measured before that run by RETRAIN_DRIFT_THRESHOLD
+
+A run that fails or times out backs off: triggers are not acted on for
+RETRAIN_BACKOFF_SECONDS, doubling with each further failure up to a day, and
+a failed run does not count as a run for the drift trigger.
+
+A run trains in a separate, freshly spawned process, so the fit runs outside
+the serving process and all its memory is returned when it exits. The child
+lowers its priority by RETRAIN_NICE and, when configured, pins itself to
+RETRAIN_CPUS and caps its address space at RETRAIN_MAX_MEMORY_MB. It streams
+the outcomes from the database, fits a new model (see app.ml.training),
+evaluates it and the current model on the same holdout, and registers it
+only if it is better. Registration is atomic (see app.ml.registry) and the
+"trained" prediction engine adopts the new version. Only one run at a time
+takes place on a host: runs hold an exclusive lock file in the registry.
+
+Configuration (environment variables):
+    RETRAIN_MODEL: Model trained, "forest" (default) or "logistic"
+    RETRAIN_CHECK_SECONDS: Interval of trigger checks, 0 disables the
+        scheduler (default 600)
+    RETRAIN_MIN_OUTCOMES: Outcomes that trigger a run (default 1000)
+    RETRAIN_DRIFT_THRESHOLD: PSI that triggers a run, 0 disables (default 0.25)
+    RETRAIN_MIN_IMPROVEMENT: Margin by which a new model must beat the
+        current one (default 0)
+    RETRAIN_CPUS: Comma-separated CPUs the training process may use
+        (default all)
+    RETRAIN_MAX_MEMORY_MB: Address space limit of the training process,
+        0 for none (default 0)
+    RETRAIN_NICE: Niceness added to the training process (default 10)
+    RETRAIN_TIMEOUT_SECONDS: Longest run before it is abandoned (default 3600)
+    RETRAIN_BACKOFF_SECONDS: Pause of the triggers after a failed run
+        (default 600)
+"""
+
+import fcntl
+import logging
+import multiprocessing
+import os
+import resource
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+RETRAIN_MODEL = os.getenv("RETRAIN_MODEL", "forest")
+CHECK_SECONDS = float(os.getenv("RETRAIN_CHECK_SECONDS", "600"))
+MIN_OUTCOMES = int(os.getenv("RETRAIN_MIN_OUTCOMES", "1000"))
+DRIFT_THRESHOLD = float(os.getenv("RETRAIN_DRIFT_THRESHOLD", "0.25"))
+MIN_IMPROVEMENT = float(os.getenv("RETRAIN_MIN_IMPROVEMENT", "0"))
+CPUS = [int(cpu) for cpu in os.getenv("RETRAIN_CPUS", "").split(",") if cpu]
+MAX_MEMORY_MB = int(os.getenv("RETRAIN_MAX_MEMORY_MB", "0"))
+NICE = int(os.getenv("RETRAIN_NICE", "10"))
+TIMEOUT_SECONDS = float(os.getenv("RETRAIN_TIMEOUT_SECONDS", "3600"))
+BACKOFF_SECONDS = float(os.getenv("RETRAIN_BACKOFF_SECONDS", "600"))
+MAX_BACKOFF_SECONDS = 86400.0
+HISTORY_SIZE = 20
+
+
+def limit_resources(cpus: Sequence[int], max_memory_mb: int, nice: int) -> None:
+    """
+    Apply the training limits to the current process.
+
+    Args:
+        cpus (list): CPUs to run on, empty for all
+        max_memory_mb (int): Address space limit, 0 for none
+        nice (int): Niceness to add
+    """
+    if nice:
+        os.nice(nice)
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    if max_memory_mb:
+        limit = max_memory_mb * 2**20
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def train_candidate(
+    kind: str,
+    database_url: str,
+    registry_root: str,
+    min_improvement: float,
+    n_jobs: int,
+    params: Dict[str, Any],
+) -> Dict[str, Any]:
+    """
+    Train and conditionally register a model; runs in the training process.
+
+    Returns:
+        dict: Result of train_from_database with compare
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.clients.service.client_repository import SQLAlchemyClientRepository
+    from app.ml.registry import ModelRegistry
+    from app.ml.training import train_from_database
+
+    engine = create_engine(database_url)
+    try:
+        with sessionmaker(bind=engine)() as db:
+            return train_from_database(
+                SQLAlchemyClientRepository(db),
+                kind,
+                n_jobs=n_jobs,
+                registry=ModelRegistry(registry_root),
+                compare=True,
+                min_improvement=min_improvement,
+                **params,
+            )
+    finally:
+        engine.dispose()
+
+
+def _training_process(connection, limits, job) -> None:
+    """Entry point of the training process: reports (ok, result or error)"""
+    try:
+        limit_resources(*limits)
+        connection.send((True, train_candidate(*job)))
+    except BaseException as e:
+        connection.send((False, f"{type(e).__name__}: {e}"))
+    finally:
+        connection.close()
+
+
+def run_training_process(limits, job, timeout: float) -> Dict[str, Any]:
+    """
+    Run train_candidate(*job) in a spawned process with limit_resources(*limits).
+
+    Raises:
+        TimeoutError: If it takes longer than timeout seconds; it is killed
+        RuntimeError: If it fails or exits without a result
+    """
+    # Spawned rather than forked: the serving process runs threads.
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target=_training_process,
+        args=(sender, limits, job),
+        name="retrain",
+        daemon=True,
+    )
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(timeout):
+            raise TimeoutError(f"Training took longer than {timeout:g} s")
+        try:
+            ok, result = receiver.recv()
+        except EOFError:
+            process.join()
+            raise RuntimeError(f"Training process exited with {process.exitcode}")
+        if not ok:
+            raise RuntimeError(result)
+        return result
+    finally:
+        receiver.close()
+        if process.is_alive():
+            process.join(timeout=5)
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+
+def database_drift(reference=None, chunk_size: int = 10_000) -> Optional[float]:
+    """
+    Largest PSI of a client feature between the clients table and the
+    training data.
+
+    Args:
+        reference (FeatureHistograms): Reference histograms, those of the
+            service's data_commontool.csv when omitted
+        chunk_size (int): Clients read per query
+
+    Returns:
+        float: Largest PSI, None if there are no clients
+    """
+    from app.clients.service.client_repository import SQLAlchemyClientRepository
+    from app.clients.service.columnar_preprocessing import (
+        CLIENT_COLUMNS,
+        encode_frame,
+    )
+    from app.database import SessionLocal
+    from app.ml.drift import max_drift
+
+    reference = reference or training_data_histograms()
+    current = reference.empty_like()
+    db = SessionLocal()
+    try:
+        for frame in SQLAlchemyClientRepository(db).iter_feature_chunks(chunk_size):
+            current.add(encode_frame(frame.dropna(subset=CLIENT_COLUMNS)))
+    finally:
+        db.close()
+    return max_drift(reference, current)
+
+
+_training_data_histograms = None
+
+
+def training_data_histograms():
+    """Client feature histograms of data_commontool.csv, built on first use"""
+    global _training_data_histograms
+    if _training_data_histograms is None:
+        from app.ml.drift import FeatureHistograms, training_data
+
+        _training_data_histograms = FeatureHistograms.from_reference(training_data())
+    return _training_data_histograms
+
+
+class RetrainScheduler:
+    """
+    Daemon thread retraining a model when a trigger fires.
+    """
+
+    def __init__(
+        self,
+        kind: str = RETRAIN_MODEL,
+        check_seconds: float = CHECK_SECONDS,
+        min_outcomes: int = MIN_OUTCOMES,
+        drift_threshold: float = DRIFT_THRESHOLD,
+        min_improvement: float = MIN_IMPROVEMENT,
+        cpus: Sequence[int] = CPUS,
+        max_memory_mb: int = MAX_MEMORY_MB,
+        nice: int = NICE,
+        timeout_seconds: float = TIMEOUT_SECONDS,
+        backoff_seconds: float = BACKOFF_SECONDS,
+        drift: Callable[[], Optional[float]] = database_drift,
+        database_url: Optional[str] = None,
+        registry=None,
+        params: Optional[Dict[str, Any]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            kind (str): Model trained, a key of app.ml.training.TRAINED_MODELS
+            check_seconds (float): Interval of trigger checks, 0 disables
+                the thread
+            min_outcomes (int): Recorded outcomes that trigger a run
+            drift_threshold (float): Drift score that triggers a run, 0
+                disables the drift trigger
+            min_improvement (float): Margin by which a new model must beat
+                the current one
+            cpus (list): CPUs the training process may use, empty for all
+            max_memory_mb (int): Address space limit of the training
+                process, 0 for none
+            nice (int): Niceness added to the training process
+            timeout_seconds (float): Longest run before it is abandoned
+            backoff_seconds (float): Pause of the triggers after a failed
+                run, doubled for every further consecutive failure
+            drift: Returns the current drift score, None if unknown
+            database_url (str): Database to train from, the app's when
+                omitted
+            registry (ModelRegistry): Registry to publish to, the shared
+                app.ml.model_list registry when omitted
+            params (dict): Further estimator parameters, see
+                app.ml.training.fit_model
+            clock: Monotonic time source, injectable for tests
+        """
+        self.kind = kind
+        self.check_seconds = check_seconds
+        self.min_outcomes = min_outcomes
+        self.drift_threshold = drift_threshold
+        self.min_improvement = min_improvement
+        self.cpus = list(cpus)
+        self.max_memory_mb = max_memory_mb
+        self.nice = nice
+        self.timeout_seconds = timeout_seconds
+        self.backoff_seconds = backoff_seconds
+        self.drift = drift
+        self.database_url = database_url
+        self._registry = registry
+        self.params = params or {}
+        self.clock = clock
+        self.history: deque = deque(maxlen=HISTORY_SIZE)
+        self.last_drift: Optional[float] = None
+        # Drift when the last completed run started; drift up to it is
+        # trained on.
+        self.run_drift: Optional[float] = None
+        self.failures = 0
+        self.backoff_until = 0.0
+        self._outcomes = 0
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def registry(self):
+        if self._registry is None:
+            from app.ml.model_list import registry
+
+            self._registry = registry
+        return self._registry
+
+    def note_outcome(self) -> None:
+        """Count an outcome recorded in this worker"""
+        with self._lock:
+            self._outcomes += 1
+
+    @property
+    def pending_outcomes(self) -> int:
+        """
+        Outcomes recorded in this worker since its last run; every worker
+        counts its own, so a host-wide count is the sum over workers.
+        """
+        return self._outcomes
+
+    def trigger(self) -> Optional[str]:
+        """
+        The reason to retrain now, if any: "outcomes" or "drift".
+
+        The reference stays the training data, so drift that was already
+        there when the last run started does not trigger another one.
+        """
+        if self.pending_outcomes >= self.min_outcomes:
+            return "outcomes"
+        if self.drift_threshold > 0:
+            self.last_drift = self.drift()
+            if self.last_drift is not None and self.last_drift >= (
+                self.drift_threshold + (self.run_drift or 0.0)
+            ):
+                return "drift"
+        return None
+
+    def run(self, reason: str = "manual") -> Optional[Dict[str, Any]]:
+        """
+        Train a candidate in a separate process and publish it if better.
+
+        Args:
+            reason (str): What triggered the run, kept in the history
+
+        Returns:
+            dict: The run's result, None if another run holds the lock
+        """
+        from app.database import SQLALCHEMY_DATABASE_URL
+
+        if not self._run_lock.acquire(blocking=False):
+            return None
+        try:
+            os.makedirs(self.registry.root, exist_ok=True)
+            lock_path = os.path.join(self.registry.root, "retrain.lock")
+            with open(lock_path, "w") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return None
+                try:
+                    return self._run(reason, SQLALCHEMY_DATABASE_URL)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            self._run_lock.release()
+
+    def _run(self, reason: str, default_database_url: str) -> Dict[str, Any]:
+        outcomes = self.pending_outcomes
+        started = time.perf_counter()
+        result: Dict[str, Any] = {
+            "reason": reason,
+            "started_at": time.time(),
+            "outcomes": outcomes,
+            "drift": self.last_drift,
+        }
+        drift = self.last_drift
+        try:
+            report = run_training_process(
+                (self.cpus, self.max_memory_mb, self.nice),
+                (
+                    self.kind,
+                    self.database_url or default_database_url,
+                    self.registry.root,
+                    self.min_improvement,
+                    len(self.cpus) or -1,
+                    self.params,
+                ),
+                self.timeout_seconds,
+            )
+            result.update(
+                published=report["published"],
+                version=report.get("version"),
+                metrics=report["metrics"],
+                baseline=report["baseline"],
+                training=report["training"],
+            )
+            # Outcomes recorded during the run count toward the next one.
+            with self._lock:
+                self._outcomes -= outcomes
+            self.run_drift = drift
+            self.failures = 0
+            self.backoff_until = 0.0
+        except Exception as e:
+            logger.exception("Retraining failed")
+            result.update(published=False, error=f"{type(e).__name__}: {e}")
+            self.failures += 1
+            backoff = min(
+                self.backoff_seconds * 2 ** (self.failures - 1), MAX_BACKOFF_SECONDS
+            )
+            self.backoff_until = self.clock() + backoff
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        self.history.append(result)
+        logger.info("Retraining finished: %s", result)
+        return result
+
+    def run_once(self) -> Optional[Dict[str, Any]]:
+        """Run if a trigger fires and no failed run is backing off"""
+        if self.clock() < self.backoff_until:
+            return None
+        reason = self.trigger()
+        return self.run(reason) if reason else None
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.check_seconds):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Checking retraining triggers failed")
+
+    def start(self) -> None:
+        if self.check_seconds <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._loop, name="retrain-scheduler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "model": self.kind,
+            "running": self._run_lock.locked(),
+            "pending_outcomes": self.pending_outcomes,
+            "min_outcomes": self.min_outcomes,
+            "drift": self.last_drift,
+            "run_drift": self.run_drift,
+            "drift_threshold": self.drift_threshold,
+            "failures": self.failures,
+            "backoff_seconds": max(0.0, self.backoff_until - self.clock()),
+            "limits": {
+                "cpus": self.cpus,
+                "max_memory_mb": self.max_memory_mb,
+                "nice": self.nice,
+            },
+            "history": list(self.history),
+        }
+
+
+retrain_scheduler = RetrainScheduler()
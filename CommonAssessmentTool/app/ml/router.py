@@ -1,9 +1,31 @@
+import time
+from typing import Optional
+
 import numpy as np
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+
+from app.ml.drift import drift_monitor
+from app.ml.model_list import (
+    get_model,
+    list_available_models,
+    list_model_metadata,
+    registry,
+)
+from app.ml.model_state import (
+    ActiveModel,
+    Deployment,
+    active_model,
+    deployment,
+    rollback,
+    set_current_model,
+    set_traffic,
+)
+from app.ml.retrain import retrain_scheduler
+from app.ml.traffic import route, shadow_scorer
 
-from app.ml.model_list import get_model, list_available_models
-from app.ml.model_state import get_current_model, set_current_model
+MODEL_VERSION_HEADER = "X-Model-Version"
 
 router = APIRouter(prefix="/ml", tags=["machine_learning"])
 
@@ -11,44 +33,188 @@ router = APIRouter(prefix="/ml", tags=["machine_learning"])
 @router.get("/models")
 async def get_models():
     """
-    List all available machine learning models
+    List all available machine learning models with their registry metadata
     """
-    return {"available_models": list_available_models()}
+    return {
+        "available_models": list_available_models(),
+        "models": list_model_metadata(),
+    }
+
+
+def describe_active(active: ActiveModel, response: Response) -> dict:
+    response.headers[MODEL_VERSION_HEADER] = active.label
+    return {
+        "current_model": active.name,
+        "version": active.version,
+        "generation": active.generation,
+    }
 
 
 @router.get("/model/current")
-async def current_model():
+def current_model(response: Response):
     """
     Get the currently selected machine learning model
     """
-    return {"current_model": get_current_model()}
+    return describe_active(active_model(), response)
 
 
 @router.post("/model/switch")
-async def switch_model(model_name: str):
+async def switch_model(
+    model_name: str, response: Response, version: Optional[int] = None
+):
     """
-    Switch the current machine learning model
+    Switch the current machine learning model.
+    The new version is loaded and warmed up off the event loop while the
+    current model keeps serving, then published to every worker at once.
     """
     if model_name not in list_available_models():
         raise HTTPException(status_code=400, detail="Model not available")
     try:
-        set_current_model(model_name)
+        active = await run_in_threadpool(set_current_model, model_name, version)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    return {"message": f"Model switched to {model_name}"}
+    return {
+        "message": f"Model switched to {model_name}",
+        **describe_active(active, response),
+    }
+
+
+@router.post("/model/rollback")
+async def rollback_model(response: Response):
+    """
+    Switch back to the previously selected machine learning model
+    """
+    try:
+        active = await run_in_threadpool(rollback)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "message": f"Model rolled back to {active.name}",
+        **describe_active(active, response),
+    }
+
+
+class CanaryConfig(BaseModel):
+    name: str
+    version: Optional[int] = None
+    percent: float = Field(ge=0, le=100)
+
+
+class ShadowConfig(BaseModel):
+    name: str
+    version: Optional[int] = None
+    sample_rate: float = Field(ge=0, le=1)
+
+
+class TrafficConfig(BaseModel):
+    canary: Optional[CanaryConfig] = None
+    shadow: Optional[ShadowConfig] = None
+
+
+def describe_traffic(current: Deployment) -> dict:
+    canary, shadow = current.canary, current.shadow
+    return {
+        "current_model": current.primary.label,
+        "generation": current.generation,
+        "canary": (
+            {"model": canary.label, "percent": current.canary_percent}
+            if canary
+            else None
+        ),
+        "shadow": (
+            {"model": shadow.label, "sample_rate": current.shadow_rate}
+            if shadow
+            else None
+        ),
+        "shadow_metrics": shadow_scorer.metrics(),
+    }
+
+
+@router.get("/model/traffic")
+def get_traffic():
+    """
+    Get the canary and shadow models and shadow comparison metrics
+    """
+    return describe_traffic(deployment())
+
+
+@router.post("/model/traffic")
+async def update_traffic(config: TrafficConfig):
+    """
+    Route a percentage of requests to a canary model and score a sample of
+    requests with a shadow model in the background. Omitted roles are cleared.
+    """
+    try:
+        current = await run_in_threadpool(
+            set_traffic,
+            config.canary.model_dump() if config.canary else None,
+            config.shadow.model_dump() if config.shadow else None,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return describe_traffic(current)
+
+
+@router.get("/retrain")
+def get_retraining():
+    """
+    Get the retraining triggers, resource limits and recent runs
+    """
+    return retrain_scheduler.status()
+
+
+@router.post("/retrain")
+async def retrain():
+    """
+    Retrain now in a separate process and publish the model if it is better
+    """
+    result = await run_in_threadpool(retrain_scheduler.run)
+    if result is None:
+        raise HTTPException(status_code=409, detail="Retraining already running")
+    return result
+
+
+@router.get("/drift")
+def get_drift():
+    """
+    Get the PSI and KS statistic of every client feature between served
+    prediction inputs and the training data
+    """
+    return drift_monitor.report()
 
 
 class ModelInput(BaseModel):
     features: list[float]  # expecting 24 numbers
 
 
+@router.post("/predict")
+def predict_current(input: ModelInput, response: Response):
+    """
+    Predict with the currently selected model, or the canary model for the
+    configured share of inputs
+    """
+    if len(input.features) != 24:
+        return {"error": "Input must contain exactly 24 features"}
+    current = deployment()
+    X = np.array(input.features).reshape(1, -1)
+    serving = route(current, X)
+    response.headers[MODEL_VERSION_HEADER] = serving.label
+    start = time.perf_counter()
+    prediction = serving.model.predict(X)
+    serving_ms = (time.perf_counter() - start) * 1000
+    shadow_scorer.maybe_submit(current, serving, X, serving_ms)
+    return {"model": serving.name, "prediction": int(prediction[0])}
+
+
 @router.post("/predict/{model_name}")
-def predict(model_name: str, input: ModelInput):
+def predict(model_name: str, input: ModelInput, response: Response):
     model = get_model(model_name)
     if model is None:
         return {"error": "Model not found"}
     if len(input.features) != 24:
         return {"error": "Input must contain exactly 24 features"}
+    label = f"{model_name}:{registry.resolve(model_name)}"
+    response.headers[MODEL_VERSION_HEADER] = label
     X = np.array(input.features).reshape(1, -1)
     prediction = model.predict(X)
     return {"model": model_name, "prediction": int(prediction[0])}
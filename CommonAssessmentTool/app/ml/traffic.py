@@ -0,0 +1,250 @@
+"""
+Canary routing and shadow scoring between selectable models.
+
+A deployment (see app.ml.model_state) may route a percentage of requests to
+a canary model. Routing hashes the request's features into one of 10000
+buckets, so a given input is always served by the same model and the split
+is the same in every worker.
+
+A deployment may also name a shadow model. A sample of requests is handed
+to ShadowScorer, which scores it with the shadow and the serving model on
+a single background thread. The request only pays for a queue put: when the
+bounded queue is full the sample is dropped and counted instead.
+
+Every shadow comparison is appended to a compact binary log, one file per
+pair of model versions, of fixed-size SHADOW_RECORD rows: the time, the
+serving model's latency (measured in the request), the shadow's latency
+and both probabilities. read_shadow_log() and summarize_shadow_log() load
+and summarize one for offline comparison.
+
+Configuration (environment variables):
+    SHADOW_LOG_DIR: Directory of the logs (default app/ml/models/shadow)
+    SHADOW_MAX_PENDING: Samples queued before new ones are dropped (default 256)
+"""
+
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from app.ml.model_list import MODELS_DIR
+from app.ml.model_state import ActiveModel, Deployment
+
+logger = logging.getLogger(__name__)
+
+SHADOW_LOG_DIR = os.getenv("SHADOW_LOG_DIR", os.path.join(MODELS_DIR, "shadow"))
+SHADOW_MAX_PENDING = int(os.getenv("SHADOW_MAX_PENDING", "256"))
+ROUTING_BUCKETS = 10000
+SHADOW_RECORD = np.dtype(
+    [
+        ("time", "<f8"),
+        ("serving_ms", "<f4"),
+        ("shadow_ms", "<f4"),
+        ("serving_score", "<f4"),
+        ("shadow_score", "<f4"),
+    ]
+)
+
+
+def routing_bucket(features: np.ndarray) -> int:
+    """
+    Stable bucket of a feature vector in [0, ROUTING_BUCKETS).
+    """
+    row = np.ascontiguousarray(features, dtype=np.float64)
+    digest = hashlib.blake2b(row.tobytes(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % ROUTING_BUCKETS
+
+
+def route(deployment: Deployment, features: np.ndarray) -> ActiveModel:
+    """
+    The model of a deployment that serves a feature vector.
+
+    Args:
+        deployment (Deployment): Snapshot taken for the request
+        features (np.array): The request's features
+
+    Returns:
+        ActiveModel: The canary for canary_percent of inputs, else the primary
+    """
+    if deployment.canary is None:
+        return deployment.primary
+    threshold = deployment.canary_percent * ROUTING_BUCKETS / 100
+    if routing_bucket(features) < threshold:
+        return deployment.canary
+    return deployment.primary
+
+
+def shadow_log_path(log_dir: str, serving: ActiveModel, shadow: ActiveModel) -> str:
+    return os.path.join(
+        log_dir,
+        f"{serving.name}-{serving.version}__{shadow.name}-{shadow.version}.shadow",
+    )
+
+
+def read_shadow_log(path: str) -> np.ndarray:
+    """
+    Load a shadow log as a structured array of SHADOW_RECORD rows.
+    """
+    return np.fromfile(path, dtype=SHADOW_RECORD)
+
+
+def summarize_shadow_log(records: np.ndarray) -> Dict[str, Any]:
+    """
+    Latency and prediction differences between the serving and shadow models.
+
+    Args:
+        records (np.array): SHADOW_RECORD rows, e.g. from read_shadow_log
+
+    Returns:
+        dict: Count, latency percentiles of both models, the mean and largest
+            absolute probability difference and the share of equal labels
+    """
+    if len(records) == 0:
+        return {"count": 0}
+    delta = np.abs(records["shadow_score"] - records["serving_score"])
+    agreement = (records["shadow_score"] >= 0.5) == (records["serving_score"] >= 0.5)
+    summary: Dict[str, Any] = {"count": len(records)}
+    for role in ("serving", "shadow"):
+        p50, p99 = np.percentile(records[f"{role}_ms"], [50, 99])
+        summary[f"{role}_ms"] = {"p50": float(p50), "p99": float(p99)}
+    summary.update(
+        mean_abs_delta=float(delta.mean()),
+        max_abs_delta=float(delta.max()),
+        label_agreement=float(agreement.mean()),
+    )
+    return summary
+
+
+class ShadowScorer:
+    """
+    Scores sampled requests with a shadow model on a background thread.
+    """
+
+    def __init__(self, log_dir: str = SHADOW_LOG_DIR, max_pending=SHADOW_MAX_PENDING):
+        """
+        Args:
+            log_dir (str): Directory of the shadow logs
+            max_pending (int): Samples queued before new ones are dropped
+        """
+        self.log_dir = log_dir
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="shadow-scorer"
+        )
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self.submitted = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def maybe_submit(
+        self,
+        deployment: Deployment,
+        serving: ActiveModel,
+        X: np.ndarray,
+        serving_ms: float,
+    ) -> bool:
+        """
+        Queue a shadow comparison for a sample of requests without waiting.
+
+        Args:
+            deployment (Deployment): Snapshot taken for the request
+            serving (ActiveModel): The model that served the request
+            X (np.array): The request's model input
+            serving_ms (float): Latency of the serving model in the request
+
+        Returns:
+            bool: Whether the request was queued
+        """
+        shadow = deployment.shadow
+        if shadow is None or random.random() >= deployment.shadow_rate:
+            return False
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.dropped += 1
+            return False
+        try:
+            future = self._executor.submit(self._score, serving, shadow, X, serving_ms)
+        except RuntimeError:
+            # Shut down with the app
+            self._slots.release()
+            return False
+        future.add_done_callback(lambda _: self._slots.release())
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def _score(
+        self,
+        serving: ActiveModel,
+        shadow: ActiveModel,
+        X: np.ndarray,
+        serving_ms: float,
+    ) -> None:
+        try:
+            start = time.perf_counter()
+            shadow.model.predict(X)
+            shadow_ms = (time.perf_counter() - start) * 1000
+            record = np.zeros(1, dtype=SHADOW_RECORD)
+            record[0] = (
+                time.time(),
+                serving_ms,
+                shadow_ms,
+                serving.model.predict_proba(X)[0, 1],
+                shadow.model.predict_proba(X)[0, 1],
+            )
+            os.makedirs(self.log_dir, exist_ok=True)
+            with open(shadow_log_path(self.log_dir, serving, shadow), "ab") as log:
+                log.write(record.tobytes())
+            self._record(f"{serving.label}->{shadow.label}", record[0])
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            logger.exception("Shadow scoring with %s failed", shadow.label)
+
+    def _record(self, pair: str, record) -> None:
+        delta = abs(float(record["shadow_score"]) - float(record["serving_score"]))
+        with self._lock:
+            stats = self._stats.setdefault(
+                pair,
+                {"count": 0, "serving_ms": 0.0, "shadow_ms": 0.0, "abs_delta": 0.0},
+            )
+            stats["count"] += 1
+            stats["serving_ms"] += float(record["serving_ms"])
+            stats["shadow_ms"] += float(record["shadow_ms"])
+            stats["abs_delta"] += delta
+
+    def drain(self, timeout: Optional[float] = None) -> None:
+        """Wait until every queued comparison has been scored"""
+        self._executor.submit(lambda: None).result(timeout)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue counters and mean latency and delta per model pair"""
+        with self._lock:
+            pairs = {
+                pair: {
+                    "count": stats["count"],
+                    "mean_serving_ms": stats["serving_ms"] / stats["count"],
+                    "mean_shadow_ms": stats["shadow_ms"] / stats["count"],
+                    "mean_abs_delta": stats["abs_delta"] / stats["count"],
+                }
+                for pair, stats in self._stats.items()
+            }
+            return {
+                "submitted": self.submitted,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "pairs": pairs,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+shadow_scorer = ShadowScorer()
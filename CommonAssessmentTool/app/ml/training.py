@@ -0,0 +1,354 @@
+"""
+Reproducible training of the intervention models from recorded outcomes.
+
+Training data is the Client x ClientCase join: each client case with a
+recorded success_rate is one row of the 24 client features and the 7
+intervention flags (see IClientRepository.iter_training_chunks). Rows are
+streamed in chunks straight into one preallocated float32 matrix, sized
+from a row count taken first, so memory stays at the matrix plus one chunk
+however large the table. float32 is what scikit-learn's trees train on, so
+the matrix is used without a copy.
+
+The matrix holds the target as its last column. It is shuffled in place
+with a seeded generator and split into training and holdout views, again
+without copying. With the same data and seed a run is reproducible: rows are
+read in primary key order and the forest is seeded, whatever n_jobs is.
+
+Every run is registered as a new model version (see app.ml.registry) whose
+metadata holds the holdout metrics, the duration of each phase and the
+process's peak resident memory:
+
+    python -m app.ml.training --model forest --n-jobs -1
+"""
+
+import argparse
+import json
+import resource
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.clients.service.client_repository import IClientRepository
+from app.clients.service.columnar_preprocessing import (
+    CLIENT_COLUMNS,
+    INTERVENTION_COLUMNS,
+    encode_frame,
+)
+
+TRAINED_MODELS = {"forest": "intervention_forest", "logistic": "intervention_logistic"}
+FEATURE_SCHEMA = CLIENT_COLUMNS + INTERVENTION_COLUMNS
+NUM_CLIENT_FEATURES = len(CLIENT_COLUMNS)
+NUM_FEATURES = len(FEATURE_SCHEMA)
+# Success rates above this count as a success for the logistic model.
+SUCCESS_THRESHOLD = 70
+# Holdout metric deciding whether a retrained model replaces the current one
+# and whether higher values are better.
+SELECTION_METRICS = {"forest": ("mae", False), "logistic": ("accuracy", True)}
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process so far, in MB (Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def encode_training_frame(frame, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Encode training rows whose client features are complete.
+
+    Args:
+        frame (pd.DataFrame): Rows with the TRAINING_COLUMNS columns
+        out (np.array): float32 array of shape (len(frame), NUM_FEATURES + 1)
+            to fill, allocated when omitted
+
+    Returns:
+        np.array: out, features followed by success_rate; interventions left
+            unset count as not received
+    """
+    if out is None:
+        out = np.empty((len(frame), NUM_FEATURES + 1), dtype=np.float32)
+    out[:, :NUM_CLIENT_FEATURES] = encode_frame(frame)
+    out[:, NUM_CLIENT_FEATURES:-1] = (
+        frame[INTERVENTION_COLUMNS].fillna(False).to_numpy(dtype=np.float32)
+    )
+    out[:, -1] = frame["success_rate"].to_numpy(dtype=np.float32)
+    return out
+
+
+def load_training_matrix(
+    repo: IClientRepository, chunk_size: int = 50_000
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    Stream the training join into one preallocated float32 matrix.
+
+    Args:
+        repo: Client repository to read cases from
+        chunk_size (int): Cases read per query
+
+    Returns:
+        tuple: Matrix of shape (n, NUM_FEATURES + 1) whose last column is
+            success_rate, and load statistics. Rows with incomplete client
+            features are skipped and rows added after the count are ignored.
+    """
+    capacity = repo.count_training_rows()
+    matrix = np.empty((capacity, NUM_FEATURES + 1), dtype=np.float32)
+    rows = chunks = skipped = 0
+    for frame in repo.iter_training_chunks(chunk_size):
+        chunks += 1
+        complete = frame.dropna(subset=CLIENT_COLUMNS)
+        skipped += len(frame) - len(complete)
+        complete = complete.iloc[: capacity - rows]
+        stop = rows + len(complete)
+        encode_training_frame(complete, matrix[rows:stop])
+        rows = stop
+        if rows == capacity:
+            break
+    stats = {
+        "rows": rows,
+        "skipped": skipped,
+        "chunks": chunks,
+        "chunk_size": chunk_size,
+        "matrix_mb": round(matrix[:rows].nbytes / 2**20, 1),
+    }
+    return matrix[:rows], stats
+
+
+def split_holdout(matrix: np.ndarray, holdout: float, seed: int):
+    """
+    Shuffle rows in place and split them into training and holdout views.
+
+    Returns:
+        tuple: (X_train, y_train, X_holdout, y_holdout), views of matrix
+    """
+    np.random.RandomState(seed).shuffle(matrix)
+    n_train = len(matrix) - int(round(len(matrix) * holdout))
+    train, test = matrix[:n_train], matrix[n_train:]
+    return train[:, :-1], train[:, -1], test[:, :-1], test[:, -1]
+
+
+def fit_model(kind: str, X, y, n_estimators=100, n_jobs=-1, seed=42, **params):
+    """
+    Fit a scikit-learn estimator of one of the TRAINED_MODELS kinds.
+
+    Args:
+        kind (str): "forest" (success rate regressor) or "logistic"
+            (probability of a success rate above SUCCESS_THRESHOLD)
+        X (np.array): float32 features of shape (n, NUM_FEATURES)
+        y (np.array): Success rates of shape (n,)
+        n_estimators (int): Trees of the forest
+        n_jobs (int): Cores the forest trains on, -1 for all
+        seed (int): Random seed
+        params: Further estimator parameters, e.g. max_depth
+
+    Returns:
+        The fitted estimator
+    """
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.linear_model import LogisticRegression
+
+    if kind == "forest":
+        return RandomForestRegressor(
+            n_estimators=n_estimators, n_jobs=n_jobs, random_state=seed, **params
+        ).fit(X, y)
+    if kind == "logistic":
+        return LogisticRegression(max_iter=500, **params).fit(X, y > SUCCESS_THRESHOLD)
+    raise ValueError(f"Unknown model kind: {kind}")
+
+
+def evaluate(kind: str, estimator, X, y) -> Dict[str, float]:
+    """
+    Holdout metrics: MAE, RMSE and R^2 for the forest, accuracy and ROC AUC
+    for the logistic model.
+    """
+    from sklearn import metrics
+
+    if len(y) == 0:
+        return {}
+    if kind == "forest":
+        predictions = estimator.predict(X)
+        return {
+            "mae": float(metrics.mean_absolute_error(y, predictions)),
+            "rmse": float(np.sqrt(metrics.mean_squared_error(y, predictions))),
+            "r2": float(metrics.r2_score(y, predictions)),
+        }
+    labels = y > SUCCESS_THRESHOLD
+    scores = {"accuracy": float(metrics.accuracy_score(labels, estimator.predict(X)))}
+    if len(np.unique(labels)) == 2:
+        probabilities = estimator.predict_proba(X)[:, 1]
+        scores["roc_auc"] = float(metrics.roc_auc_score(labels, probabilities))
+    return scores
+
+
+def current_model(kind: str, registry):
+    """
+    The model a retrained one of the given kind has to beat.
+
+    Returns:
+        tuple: Label and runtime model: the latest registered version of
+            TRAINED_MODELS[kind], else for the forest the shipped
+            intervention forest; (None, None) if there is neither
+    """
+    name = TRAINED_MODELS[kind]
+    if registry.versions(name):
+        version = registry.resolve(name)
+        return f"{name}:{version}", registry.load(name, version)
+    if kind == "forest":
+        from app.clients.service import logic
+
+        return f"shipped:{logic.MODEL_VERSION}", logic.MODEL
+    return None, None
+
+
+def improves(kind: str, candidate, baseline, min_improvement: float = 0.0) -> bool:
+    """
+    Whether candidate holdout metrics beat baseline ones by min_improvement.
+    """
+    metric, higher_is_better = SELECTION_METRICS[kind]
+    if not baseline or metric not in baseline:
+        return True
+    gain = candidate[metric] - baseline[metric]
+    return (gain if higher_is_better else -gain) > min_improvement
+
+
+def train_from_database(
+    repo: IClientRepository,
+    kind: str = "forest",
+    chunk_size: int = 50_000,
+    n_jobs: int = -1,
+    holdout: float = 0.2,
+    seed: int = 42,
+    register: bool = True,
+    registry=None,
+    compare: bool = False,
+    min_improvement: float = 0.0,
+    **params,
+) -> Dict[str, Any]:
+    """
+    Load, train, evaluate and register a model from recorded outcomes.
+
+    With compare, the current model (see current_model) is evaluated on the
+    same holdout and the new model is only registered if it is better by
+    the SELECTION_METRICS metric. The current model may have been fit on
+    some of the holdout rows, which favors keeping it.
+
+    Args:
+        repo: Client repository to read cases from
+        kind (str): "forest" or "logistic"
+        chunk_size (int): Cases read per query
+        n_jobs (int): Cores to train on, -1 for all
+        holdout (float): Share of rows held out for metrics
+        seed (int): Seed of the shuffle and the estimator
+        register (bool): Register the model as a new version of
+            TRAINED_MODELS[kind]
+        registry (ModelRegistry): Registry to register in, the shared
+            app.ml.model_list registry when omitted
+        compare (bool): Only register a model that beats the current one
+        min_improvement (float): Margin by which it has to beat it
+        params: Further estimator parameters, see fit_model
+
+    Returns:
+        dict: Registered metadata (or the would-be extra metadata) with
+            "metrics" and "training" entries, and with compare "baseline"
+            (the current model and its metrics) and "published"
+
+    Raises:
+        ValueError: If the kind is unknown or there are no outcomes
+    """
+    from app.ml.artifacts import from_sklearn
+    from app.ml import model_list
+    from app.ml.registry import data_hash
+
+    if kind not in TRAINED_MODELS:
+        raise ValueError(f"Unknown model kind: {kind}")
+    registry = registry or model_list.registry
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+    matrix, training = load_training_matrix(repo, chunk_size)
+    if not len(matrix):
+        raise ValueError("No client cases with a recorded success rate")
+    # Hashed in primary key order, before the shuffle.
+    training_data_hash = data_hash(matrix)
+    timings["load_seconds"] = time.perf_counter() - started
+
+    X_train, y_train, X_test, y_test = split_holdout(matrix, holdout, seed)
+    started = time.perf_counter()
+    estimator = fit_model(kind, X_train, y_train, n_jobs=n_jobs, seed=seed, **params)
+    timings["fit_seconds"] = time.perf_counter() - started
+    started = time.perf_counter()
+    scores = evaluate(kind, estimator, X_test, y_test)
+    timings["evaluate_seconds"] = time.perf_counter() - started
+
+    training.update(
+        {
+            "holdout_rows": len(y_test),
+            "seed": seed,
+            "n_jobs": n_jobs,
+            "params": params,
+            **{name: round(value, 3) for name, value in timings.items()},
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+    )
+    extra: Dict[str, Any] = {"metrics": scores, "training": training}
+    if compare:
+        label, baseline = current_model(kind, registry)
+        baseline_scores = None
+        if baseline is not None:
+            baseline_scores = evaluate(kind, baseline, X_test, y_test)
+        extra["baseline"] = {"model": label, "metrics": baseline_scores}
+        extra["published"] = improves(kind, scores, baseline_scores, min_improvement)
+        register = register and extra["published"]
+    if not register:
+        return extra
+    return registry.register(
+        TRAINED_MODELS[kind],
+        from_sklearn(estimator),
+        FEATURE_SCHEMA,
+        training_data_hash,
+        extra,
+    )
+
+
+def main():
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.clients.service.client_repository import SQLAlchemyClientRepository
+    from app.database import SQLALCHEMY_DATABASE_URL
+
+    parser = argparse.ArgumentParser(description="Train from recorded outcomes.")
+    parser.add_argument("--model", choices=sorted(TRAINED_MODELS), default="forest")
+    parser.add_argument("--database-url", default=SQLALCHEMY_DATABASE_URL)
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--max-depth", type=int, default=None)
+    parser.add_argument("--min-samples-leaf", type=int, default=1)
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-register", action="store_true")
+    args = parser.parse_args()
+
+    params = {}
+    if args.model == "forest":
+        params = {
+            "n_estimators": args.n_estimators,
+            "max_depth": args.max_depth,
+            "min_samples_leaf": args.min_samples_leaf,
+        }
+    engine = create_engine(args.database_url)
+    with sessionmaker(bind=engine)() as db:
+        result = train_from_database(
+            SQLAlchemyClientRepository(db),
+            args.model,
+            chunk_size=args.chunk_size,
+            n_jobs=args.n_jobs,
+            holdout=args.holdout,
+            seed=args.seed,
+            register=not args.no_register,
+            **params,
+        )
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,9 +7,12 @@ import enum
 
 from sqlalchemy import (
     Boolean,
+    JSON,
     CheckConstraint,
     Column,
+    DateTime,
     Enum,
+    Float,
     ForeignKey,
     Integer,
     String,
@@ -108,3 +111,22 @@ class ClientCase(Base):
 
     client = relationship("Client", back_populates="cases")
     user = relationship("User", back_populates="cases")
+
+
+class ClientRecommendation(Base):
+    """
+    Precomputed intervention recommendations for one client.
+    """
+
+    __tablename__ = "client_recommendations"
+
+    client_id = Column(Integer, ForeignKey("clients.id"), primary_key=True)
+    baseline = Column(Float, nullable=False)
+    # Top combinations as [[score, [intervention names]], ...], best last.
+    interventions = Column(JSON, nullable=False)
+    model_version = Column(String(64), nullable=False)
+    # When the client's features were read for scoring.
+    scored_at = Column(DateTime, nullable=False)
+    # Last change of a predictive field; the row is stale until it is
+    # re-scored from features read after this time.
+    features_changed_at = Column(DateTime, nullable=True)
@@ -0,0 +1,78 @@
+"""
+Solve time of the capacity-constrained allocator against caseload size.
+
+Predicted gains come from the bundled model: every distinct client of the
+training data is scored once and caseloads are sampled from those surfaces.
+Each intervention gets slots for a fixed share of the caseload. The
+allocator's total gain is compared with "first come", which walks clients in
+order and gives each its best plan that still fits, and with the dual upper
+bound on the optimum.
+
+    python -m benchmarks.allocation [--clients 1000 10000 100000]
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from app.analytics.allocation import allocate, best_plans, plan_masks
+from app.clients.service.logic import (
+    COLUMN_INTERVENTIONS,
+    intervention_permutations,
+    score_batch,
+)
+from benchmarks.common import CLIENT_COLUMNS, DATA_PATH
+
+
+def distinct_surfaces():
+    rows = pd.read_csv(DATA_PATH)[CLIENT_COLUMNS].drop_duplicates().to_numpy()
+    baseline, predictions = score_batch(rows)
+    return (predictions - baseline[:, np.newaxis]).astype(np.float32)
+
+
+def first_come(gains, plans, capacities):
+    masks = plan_masks(plans)
+    remaining = np.asarray(capacities, dtype=np.float64).copy()
+    total = 0.0
+    for row in gains:
+        blocked = int(sum(1 << s for s in np.flatnonzero(remaining < 1).tolist()))
+        plan, value = best_plans(row[np.newaxis], masks, np.array([blocked]))
+        if value[0] > 0:
+            remaining -= plans[plan[0]]
+            total += float(value[0])
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--clients", type=int, nargs="+", default=[1_000, 10_000, 100_000]
+    )
+    parser.add_argument("--share", type=float, default=0.1)
+    args = parser.parse_args()
+    plans = intervention_permutations(len(COLUMN_INTERVENTIONS))
+    surfaces = distinct_surfaces()
+    rng = np.random.default_rng(0)
+
+    print(
+        f"{'clients':>8}  {'greedy s':>8}  {'pricing s':>9}  {'total s':>7}"
+        f"  {'first come':>10}  {'greedy':>7}  {'final':>7}  {'of bound':>8}"
+    )
+    for count in args.clients:
+        gains = surfaces[rng.integers(0, len(surfaces), count)]
+        capacities = np.full(plans.shape[1], np.ceil(count * args.share))
+        baseline_total = first_come(gains, plans, capacities)
+        result = allocate(gains, plans, capacities)
+        assert (result["used"] <= capacities).all()
+        print(
+            f"{count:>8,}  {result['greedy_seconds']:>8.2f}"
+            f"  {result['pricing_seconds']:>9.2f}  {result['solve_seconds']:>7.2f}"
+            f"  {baseline_total:>10.0f}  {result['greedy_gain']:>7.0f}"
+            f"  {result['total_gain']:>7.0f}"
+            f"  {result['total_gain'] / result['upper_bound']:>8.2%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
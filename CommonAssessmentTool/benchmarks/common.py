@@ -0,0 +1,74 @@
+"""
+Shared helpers for the benchmark scripts.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+DATA_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "app",
+    "clients",
+    "service",
+    "data_commontool.csv",
+)
+
+CLIENT_COLUMNS = [
+    "age",
+    "gender",
+    "work_experience",
+    "canada_workex",
+    "dep_num",
+    "canada_born",
+    "citizen_status",
+    "level_of_schooling",
+    "fluent_english",
+    "reading_english_scale",
+    "speaking_english_scale",
+    "writing_english_scale",
+    "numeracy_scale",
+    "computer_scale",
+    "transportation_bool",
+    "caregiver_bool",
+    "housing",
+    "income_source",
+    "felony_bool",
+    "attending_school",
+    "currently_employed",
+    "substance_use",
+    "time_unemployed",
+    "need_mental_health_support_bool",
+]
+
+
+def load_sample_inputs(count, seed=0):
+    """
+    Draw prediction payloads from the training data, as the API receives them.
+
+    Args:
+        count (int): Number of payloads
+        seed (int): Random seed for sampling rows
+
+    Returns:
+        list: Input dicts with string values
+    """
+    data = pd.read_csv(DATA_PATH)[CLIENT_COLUMNS]
+    rows = data.sample(n=count, replace=True, random_state=seed)
+    return [
+        {column: str(int(value)) for column, value in row.items()}
+        for row in rows.to_dict("records")
+    ]
+
+
+def percentile_summary(timings_ms):
+    """
+    Format p50/p99/mean of a timing sample in milliseconds.
+    """
+    timings_ms = np.asarray(timings_ms)
+    return (
+        f"p50={np.percentile(timings_ms, 50):.3f} ms  "
+        f"p99={np.percentile(timings_ms, 99):.3f} ms  "
+        f"mean={timings_ms.mean():.3f} ms  n={len(timings_ms)}"
+    )
@@ -0,0 +1,96 @@
+"""
+Branch-and-bound top-k intervention search versus scoring every combination.
+
+The bundled model has 7 interventions. To show how the search scales as
+COLUMN_INTERVENTIONS grows, forests with more intervention flags are trained
+on synthetic data shaped like the real one (24 client features, 100 trees).
+Exhaustive scoring predicts all 2^n rows with the compiled forest and
+partially selects the top k; the search reduces the forest for the client
+and expands partial plans best-bound-first.
+
+    python -m benchmarks.intervention_search [--interventions 7 10 14 18]
+"""
+
+import argparse
+import time
+from itertools import product
+
+import numpy as np
+
+from app.ml.artifacts import from_sklearn
+from app.ml.intervention_search import ClientSurface, search_top_k
+from app.ml.partial_eval import InterventionPartialEvaluator
+
+NUM_CLIENT_FEATURES = 24
+
+
+def train_forest(n_interventions, rows=2000, seed=0):
+    from sklearn.ensemble import RandomForestRegressor
+
+    rng = np.random.RandomState(seed)
+    clients = rng.randint(0, 10, (rows, NUM_CLIENT_FEATURES))
+    flags = rng.randint(0, 2, (rows, n_interventions))
+    effects = rng.randn(n_interventions) * 5
+    target = clients[:, :6].sum(axis=1) + flags @ effects + rng.randn(rows) * 3
+    # Interactions between client features and interventions, as in real data.
+    target += (clients[:, 0] > 5) * flags[:, 0] * 10
+    X = np.hstack([clients, flags])
+    return X, RandomForestRegressor(n_estimators=100, random_state=seed).fit(X, target)
+
+
+def exhaustive_top_k(forest, client, n_interventions, k, max_services):
+    plans = np.array(list(product([0, 1], repeat=n_interventions)), dtype=np.float32)
+    if max_services is not None:
+        plans = plans[plans.sum(axis=1) <= max_services]
+    scores = forest.predict(np.hstack([np.tile(client, (len(plans), 1)), plans]))
+    top = np.argpartition(scores, -k)[-k:]
+    return np.sort(scores[top])[::-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--interventions", type=int, nargs="+", default=[7, 10, 14, 18])
+    parser.add_argument("--clients", type=int, default=5)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        f"{'n':>3}  {'max svc':>7}  {'exhaustive':>11}  {'search':>9}"
+        f"  {'reduce':>8}  {'expanded':>8}  {'of plans':>8}"
+    )
+    for n in args.interventions:
+        X, model = train_forest(n)
+        forest = from_sklearn(model)
+        evaluator = InterventionPartialEvaluator.from_forest(
+            forest, NUM_CLIENT_FEATURES
+        )
+        for max_services in (None, 3):
+            exhaustive_ms, search_ms, reduce_ms, expanded = [], [], [], []
+            for client in X[: args.clients, :NUM_CLIENT_FEATURES]:
+                start = time.perf_counter()
+                expected = exhaustive_top_k(forest, client, n, args.k, max_services)
+                exhaustive_ms.append((time.perf_counter() - start) * 1000)
+
+                start = time.perf_counter()
+                surface = ClientSurface.from_evaluator(evaluator, client, n)
+                reduced = time.perf_counter()
+                result = search_top_k(surface, k=args.k, max_services=max_services)
+                search_ms.append((time.perf_counter() - start) * 1000)
+                reduce_ms.append((reduced - start) * 1000)
+                expanded.append(result["expanded"])
+                scores = [score for score, _, _ in result["plans"]]
+                assert np.allclose(scores, expected, rtol=0, atol=1e-9)
+            total_plans = sum(
+                1
+                for plan in range(2**n)
+                if bin(plan).count("1") <= (max_services or n)
+            )
+            print(
+                f"{n:>3}  {max_services or '-':>7}  {np.median(exhaustive_ms):>8.1f} ms"
+                f"  {np.median(search_ms):>6.1f} ms  {np.median(reduce_ms):>5.1f} ms"
+                f"  {int(np.median(expanded)):>8}  {total_plans:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Per-worker memory with the model artifacts memory-mapped versus read into
+each worker's private heap.
+
+Spawns N worker processes (as uvicorn --workers does), each loading the
+models of all three prediction stacks and running one prediction so every
+page is touched. While all workers are alive, each reports RSS and PSS from
+/proc/self/smaps_rollup and the PSS of its mapped .npy artifact files.
+PSS splits shared pages evenly between the processes mapping them, so it is
+the honest per-worker cost. Linux only.
+
+    python -m benchmarks.memory_report [--workers 1 4 8]
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+
+import numpy as np
+
+APP_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"
+)
+SERVICE_DIR = os.path.join(APP_DIR, "clients", "service")
+MODEL_LIST_DIR = os.path.join(APP_DIR, "ml", "models")
+
+
+def read_memory():
+    totals = {}
+    with open("/proc/self/smaps_rollup") as rollup:
+        for line in rollup:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                totals[key] = int(rest.split()[0])
+    artifact_pss = 0
+    in_artifact = False
+    with open("/proc/self/smaps") as smaps:
+        for line in smaps:
+            fields = line.split()
+            if "-" in fields[0] and len(fields) >= 5:
+                in_artifact = fields[-1].endswith(".npy")
+            elif in_artifact and fields[0] == "Pss:":
+                artifact_pss += int(fields[1])
+    return {
+        "rss_kb": totals["Rss"],
+        "pss_kb": totals["Pss"],
+        "artifact_pss_kb": artifact_pss,
+    }
+
+
+def worker(paths, mmap, ready, done, results):
+    from app.ml.artifacts import load_model
+
+    models = [load_model(path, mmap=mmap) for path in paths]
+    for model in models:
+        model.predict(np.zeros((129, model.n_features)))
+    ready.wait()
+    results.put(read_memory())
+    done.wait()
+
+
+def measure(paths, workers, mmap):
+    context = multiprocessing.get_context("spawn")
+    ready = context.Barrier(workers)
+    done = context.Barrier(workers + 1)
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(paths, mmap, ready, done, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    samples = [results.get() for _ in range(workers)]
+    done.wait()
+    for process in processes:
+        process.join()
+    return {
+        key: np.mean([sample[key] for sample in samples]) / 1024 for key in samples[0]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    # Imported here so spawned workers only load what worker() loads.
+    from app.clients.ml.models.train_logistic import train_logistic_model
+
+    with tempfile.TemporaryDirectory() as scratch:
+        logistic_path = os.path.join(scratch, "model_logreg")
+        train_logistic_model(
+            os.path.join(SERVICE_DIR, "data_commontool.csv"), logistic_path
+        )
+        paths = [os.path.join(SERVICE_DIR, "model_forest"), logistic_path] + [
+            os.path.join(MODEL_LIST_DIR, name)
+            for name in sorted(os.listdir(MODEL_LIST_DIR))
+        ]
+        print("workers  mode     RSS/worker  PSS/worker  artifact PSS/worker")
+        for workers in args.workers:
+            for mmap in (False, True):
+                result = measure(paths, workers, mmap)
+                print(
+                    f"{workers:>7}  {'mmap' if mmap else 'heap':<7}"
+                    f"{result['rss_kb']:>9.1f} MB{result['pss_kb']:>9.1f} MB"
+                    f"{result['artifact_pss_kb']:>18.2f} MB"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Per-request latency of the intervention sweep for every prediction engine:
+the compiled array forest, the intervention-aware partial evaluator, the
+original scikit-learn model and the registered forest + logistic ensemble.
+
+Run from the CommonAssessmentTool directory:
+
+    python -m benchmarks.prediction_engines [--requests 200]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.common import load_sample_inputs, percentile_summary
+from app.clients.service.logic import interpret_and_calculate
+
+# Engines serving the shipped forest, which must agree, then the ensemble.
+EXACT_ENGINES = ("compiled", "partial", "sklearn")
+ENGINES = EXACT_ENGINES + ("ensemble",)
+
+
+def time_engine(inputs, engine):
+    timings = []
+    for input_data in inputs:
+        start = time.perf_counter()
+        interpret_and_calculate(input_data, engine=engine)
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.array(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    inputs = load_sample_inputs(args.requests)
+    for input_data in inputs:
+        expected = interpret_and_calculate(input_data, engine="sklearn")
+        # The ensemble blends in another model, so only it may differ.
+        for engine in EXACT_ENGINES:
+            assert interpret_and_calculate(input_data, engine=engine) == expected
+
+    for engine in ENGINES:
+        # Warm up before timing.
+        time_engine(inputs[:10], engine)
+        print(f"{engine:>8}: {percentile_summary(time_engine(inputs, engine))}")
+
+
+if __name__ == "__main__":
+    main()
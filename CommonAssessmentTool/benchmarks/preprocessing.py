@@ -0,0 +1,95 @@
+"""
+Throughput of turning client records into the (n, 24) model input matrix:
+per-record clean_input_data/convert_text versus the columnar encoder, for
+records given as dicts (API payloads) and as a DataFrame (bulk paths).
+
+Records are drawn from the training data with the categorical columns
+written as their front-end labels, so every lookup table is exercised.
+
+    python -m benchmarks.preprocessing [--rows 1000 100000 1000000]
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import load_sample_inputs
+from app.clients.service.columnar_preprocessing import (
+    HOUSING_LABELS,
+    INCOME_LABELS,
+    SCHOOLING_LABELS,
+    encode_frame,
+    encode_records,
+)
+from app.clients.service.logic import clean_input_data
+
+LABELLED_COLUMNS = {
+    "level_of_schooling": SCHOOLING_LABELS,
+    "housing": HOUSING_LABELS,
+    "income_source": INCOME_LABELS,
+}
+
+
+def labelled_pool(size=1000):
+    """
+    Distinct payloads with categorical codes replaced by their labels.
+    """
+    pool = load_sample_inputs(size)
+    for column, labels in LABELLED_COLUMNS.items():
+        names = {str(code): name for name, code in labels.items()}
+        for record in pool:
+            record[column] = names.get(record[column], record[column])
+    return pool
+
+
+def legacy_matrix(records):
+    return np.array([clean_input_data(record) for record in records], dtype=np.float32)
+
+
+def best_of(function, argument, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(argument)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[1_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    pool = labelled_pool()
+    pool_frame = pd.DataFrame(pool)
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>9}  {'method':<22}{'seconds':>9}  {'rows/s':>12}  speedup")
+    for rows in args.rows:
+        index = rng.integers(0, len(pool), size=rows)
+        records = [pool[i] for i in index]
+        frame = pool_frame.iloc[index].reset_index(drop=True)
+        repeats = 1 if rows >= 1_000_000 else args.repeats
+
+        legacy_seconds, expected = best_of(legacy_matrix, records, repeats)
+        results = [("clean_input_data loop", legacy_seconds)]
+        for name, function, argument in [
+            ("encode_records", encode_records, records),
+            ("encode_frame", encode_frame, frame),
+        ]:
+            seconds, matrix = best_of(function, argument, repeats)
+            assert np.array_equal(matrix, expected)
+            results.append((name, seconds))
+        for name, seconds in results:
+            print(
+                f"{rows:>9}  {name:<22}{seconds:>9.4f}  {rows / seconds:>12,.0f}"
+                f"  {legacy_seconds / seconds:>6.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
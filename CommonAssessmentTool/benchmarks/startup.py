@@ -0,0 +1,71 @@
+"""
+Model load cost in a fresh interpreter: unpickling the scikit-learn forest
+versus loading the compiled array artifact, and the cold start of the whole
+application (importing app.main).
+
+Each variant runs in its own subprocess so import costs are included.
+
+    python -m benchmarks.startup [--runs 10]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+import numpy as np
+
+LOADERS = {
+    "pickle": (
+        "import pickle\n"
+        "with open('app/clients/service/model.pkl', 'rb') as f:\n"
+        "    pickle.load(f)\n"
+    ),
+    "compiled": (
+        "from app.ml.artifacts import load_model\n"
+        "load_model('app/clients/service/model_forest')\n"
+    ),
+    "app.main": "import app.main\n",
+}
+
+PROBE = """
+import json, resource, sys, time, warnings
+warnings.simplefilter("ignore")
+start = time.perf_counter()
+{loader}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "load_ms": elapsed * 1000,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "sklearn_imported": "sklearn" in sys.modules,
+}}))
+"""
+
+
+def run_loader(loader):
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(loader=loader)],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    for name, loader in LOADERS.items():
+        results = [run_loader(loader) for _ in range(args.runs)]
+        load_ms = np.median([result["load_ms"] for result in results])
+        rss = np.median([result["max_rss_mb"] for result in results])
+        print(
+            f"{name:>8}: load+import p50={load_ms:.1f} ms  max_rss={rss:.1f} MB  "
+            f"sklearn_imported={results[0]['sklearn_imported']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
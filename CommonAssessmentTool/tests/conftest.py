@@ -1,11 +1,19 @@
-import pytest
-from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from app.database import Base, get_db
-from app.main import app
-from app.auth.router import get_password_hash
-from app.models import User, UserRole, Client, ClientCase
+import os
+import tempfile
+
+# Keep the shared model state and shadow logs of the test run out of the source tree
+_state_dir = tempfile.mkdtemp()
+os.environ.setdefault("MODEL_STATE_PATH", os.path.join(_state_dir, "active.json"))
+os.environ.setdefault("SHADOW_LOG_DIR", os.path.join(_state_dir, "shadow"))
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from app.database import Base, get_db  # noqa: E402
+from app.main import app  # noqa: E402
+from app.auth.router import get_password_hash  # noqa: E402
+from app.models import User, UserRole, Client, ClientCase  # noqa: E402
 
 # Create test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
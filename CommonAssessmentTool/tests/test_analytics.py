@@ -0,0 +1,131 @@
+import json
+from itertools import product
+
+import numpy as np
+from fastapi import status
+
+from app.analytics.allocation import allocate, allocate_caseload
+from app.clients.service.columnar_preprocessing import CLIENT_COLUMNS, encode_records
+from app.clients.service.logic import (
+    COLUMN_INTERVENTIONS,
+    intervention_permutations,
+    score_batch,
+)
+from app.models import Client
+
+
+def read_events(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_simulate_policy(client, test_db, admin_headers):
+    """Test that the simulation streams progress and the expected uplift"""
+    policy = {
+        "rules": [
+            {
+                "filters": [{"field": "housing", "op": ">=", "value": 5}],
+                "interventions": ["Life Stabilization"],
+            }
+        ],
+        "chunk_size": 100,
+    }
+    response = client.post("/analytics/simulate", json=policy, headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+    events = read_events(response)
+    assert [event["event"] for event in events] == ["progress", "result"]
+    result = events[-1]
+    assert (result["clients"], result["treated"]) == (2, 1)
+
+    # Only client 1 has housing >= 5; Life Stabilization alone is the
+    # combination with just the first intervention flag set.
+    treated = test_db.get(Client, 1)
+    features = encode_records([{c: getattr(treated, c) for c in CLIENT_COLUMNS}])
+    baseline, predictions = score_batch(features)
+    assert result["uplift"]["mean"] == predictions[0, 64] - baseline[0]
+    assert result["rules"][0]["uplift"]["count"] == 1
+
+
+def test_simulate_rejects_unknown_field(client, admin_headers):
+    policy = {
+        "rules": [
+            {
+                "filters": [{"field": "shoe_size", "op": ">", "value": 9}],
+                "interventions": ["Life Stabilization"],
+            }
+        ]
+    }
+    response = client.post("/analytics/simulate", json=policy, headers=admin_headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_allocate_respects_capacities(client, admin_headers):
+    """Test that the allocation fits capacities and reports each plan"""
+    capacities = {name: 0 for name in COLUMN_INTERVENTIONS}
+    capacities["Life Stabilization"] = 1
+    response = client.post(
+        "/analytics/allocate", json={"capacities": capacities}, headers=admin_headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    result = response.json()
+    assert result["clients"] == 2
+    assert result["used"]["Life Stabilization"] <= 1
+    assert sum(result["used"].values()) == result["used"]["Life Stabilization"]
+    assert result["total_gain"] <= result["upper_bound"] + 1e-6
+    for assignment in result["assignments"]:
+        assert assignment["interventions"] == ["Life Stabilization"]
+        assert assignment["uplift"] > 0
+
+
+def test_allocation_reports_the_engine_that_scored_it(test_db, tmp_path, monkeypatch):
+    """Test that model_version names the model of the configured engine"""
+    from app.clients.service import logic
+    from app.clients.service.client_repository import SQLAlchemyClientRepository
+    from app.ml import model_list
+    from app.ml.online import OnlineRidge
+    from app.ml.registry import ModelRegistry
+
+    repo = SQLAlchemyClientRepository(test_db)
+    result = allocate_caseload(repo, None, 100)
+    assert (
+        result["model_version"]
+        == logic.serving_model()
+        == (f"shipped:{logic.MODEL_VERSION}")
+    )
+
+    registry = ModelRegistry(str(tmp_path))
+    model = OnlineRidge.empty(len(logic.FEATURE_SCHEMA))
+    registry.register(logic.TRAINED_MODEL, model, logic.FEATURE_SCHEMA, "")
+    monkeypatch.setattr(model_list, "registry", registry)
+    monkeypatch.setattr(logic, "_trained_model", None)
+    monkeypatch.setattr(logic, "DEFAULT_PREDICTION_ENGINE", "trained")
+    result = allocate_caseload(repo, None, 100)
+    assert result["model_version"] == f"{logic.TRAINED_MODEL}:1"
+    assert result["clients"] == 2 and result["total_gain"] == 0
+
+
+def test_allocate_rejects_unknown_intervention(client, admin_headers):
+    response = client.post(
+        "/analytics/allocate",
+        json={"capacities": {"Free Lunch": 3}},
+        headers=admin_headers,
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_allocator_close_to_optimum():
+    """Compare the allocator with brute force on small random caseloads"""
+    plans = intervention_permutations(3)
+    capacities = [1, 2, 1]
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        gains = rng.normal(2, 3, (4, len(plans)))
+        gains[:, 0] = 0
+        result = allocate(gains, plans, capacities)
+        assert (result["used"] <= capacities).all()
+        optimum = max(
+            gains[np.arange(4), combination].sum()
+            for combination in product(range(len(plans)), repeat=4)
+            if (plans[list(combination)].sum(axis=0) <= capacities).all()
+        )
+        assert result["total_gain"] >= 0.9 * optimum
+        assert result["upper_bound"] >= optimum - 1e-9
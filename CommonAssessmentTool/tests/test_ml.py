@@ -0,0 +1,656 @@
+import numpy as np
+import pytest
+
+from app.ml.artifacts import from_sklearn, load_artifact, load_model, save_model
+from app.ml.intervention_search import ClientSurface, search_top_k
+from app.ml import model_state
+from app.ml.model_list import MODEL_NAMES, get_model
+from app.ml.model_state import ModelStateFile
+from app.ml.partial_eval import InterventionPartialEvaluator
+from app.ml.registry import ModelRegistry, data_hash
+
+
+@pytest.mark.parametrize("model_name", MODEL_NAMES)
+def test_artifact_round_trip(tmp_path, model_name):
+    """Test that saved artifacts load memory-mapped and predict identically"""
+    model = get_model(model_name)
+    path = str(tmp_path / model_name)
+    save_model(model, path)
+    loaded = load_model(path)
+    X = np.random.RandomState(0).rand(20, 24)
+    assert np.array_equal(loaded.predict(X), model.predict(X))
+    assert np.array_equal(loaded.predict_proba(X), model.predict_proba(X))
+    _, arrays = load_artifact(path)
+    assert not any(array.flags.writeable for array in arrays.values())
+    if loaded.kind == "forest":
+        # Children are used in place, not copied out of the mapping.
+        assert not loaded.children.flags.writeable
+
+
+def test_artifacts_are_not_overwritten_by_default(tmp_path):
+    """Test that saving over an existing artifact needs overwrite"""
+    model = get_model("logistic_regression")
+    path = str(tmp_path / "model")
+    save_model(model, path)
+    with pytest.raises(FileExistsError):
+        save_model(model, path)
+    save_model(model, path, {"note": "replaced"}, overwrite=True)
+    assert load_artifact(path)[0]["note"] == "replaced"
+
+
+def test_search_top_k_scales_past_seven_interventions():
+    """Test constrained search against brute force with 10 interventions"""
+    from itertools import product
+
+    from sklearn.ensemble import RandomForestRegressor
+
+    rng = np.random.RandomState(0)
+    X = np.hstack([rng.randint(0, 5, (400, 4)), rng.randint(0, 2, (400, 10))])
+    y = X[:, :4].sum(axis=1) + X[:, 4:] @ rng.randn(10) + rng.randn(400)
+    model = RandomForestRegressor(n_estimators=20, random_state=0).fit(X, y)
+    evaluator = InterventionPartialEvaluator.from_forest(from_sklearn(model), 4)
+    client = X[0, :4]
+    surface = ClientSurface.from_evaluator(evaluator, client, 10)
+
+    plans = np.array(list(product([0, 1], repeat=10)))
+    scores = model.predict(np.hstack([np.tile(client, (len(plans), 1)), plans]))
+    costs = np.arange(1, 11, dtype=float)
+    feasible = (plans.sum(axis=1) <= 3) & (plans @ costs <= 12) & (plans[:, 2] == 1)
+    feasible &= plans[:, 5] == 0
+    expected = np.sort(scores[feasible])[::-1][:5]
+
+    result = search_top_k(
+        surface, k=5, max_services=3, costs=costs, budget=12, required=[2], excluded=[5]
+    )
+    assert [score for score, _, _ in result["plans"]] == expected.tolist()
+    for score, indices, cost in result["plans"]:
+        assert 2 in indices and 5 not in indices and len(indices) <= 3
+        assert cost == costs[indices].sum() <= 12
+    assert result["expanded"] < len(plans) // 4
+
+
+def test_registry_versions_and_lazy_load(tmp_path):
+    """Test that listing reads metadata only and loads verify checksums"""
+    registry = ModelRegistry(str(tmp_path))
+    model = get_model("logistic_regression")
+    first = registry.register("logreg", model, ["a", "b"], data_hash(np.ones(3)))
+    second = registry.register("logreg", model, ["a", "b"], data_hash(np.zeros(3)))
+    assert (first["version"], second["version"]) == (1, 2)
+    assert first["training_data_hash"] != second["training_data_hash"]
+
+    assert [meta["version"] for meta in registry.list_models()] == [2]
+    assert len(registry.list_models(all_versions=True)) == 2
+    assert not registry.is_loaded("logreg")
+    assert registry.load("logreg") is registry.load("logreg", 2)
+    assert registry.is_loaded("logreg") and not registry.is_loaded("logreg", 1)
+
+    np.save(tmp_path / "logreg" / "1" / "coef.npy", np.zeros((1, 24)))
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        registry.load("logreg", 1)
+    with pytest.raises(ValueError):
+        registry.load("logreg", 3)
+
+
+def test_registry_keeps_recent_versions_loaded(tmp_path):
+    """Test that superseded versions are dropped from the loaded models"""
+    registry = ModelRegistry(str(tmp_path), max_loaded=2)
+    model = get_model("logistic_regression")
+    for _ in range(3):
+        registry.register("logreg", model, ["a"], "")
+    first = registry.load("logreg", 1)
+    registry.load("logreg", 2)
+    registry.load("logreg", 1)
+    registry.load("logreg", 3)
+    loaded = [registry.is_loaded("logreg", version) for version in (1, 2, 3)]
+    assert loaded == [True, False, True]
+    assert registry.load("logreg", 1) is first
+
+    registry.register("logreg", model, ["a"], "")
+    loaded = [registry.is_loaded("logreg", version) for version in (1, 2, 3, 4)]
+    assert loaded == [True, False, False, False]
+
+
+def test_registry_allocates_versions_under_a_lock(tmp_path, monkeypatch):
+    """Test that concurrent registrations get distinct versions"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app.ml import model_list
+
+    registry = ModelRegistry(str(tmp_path))
+    model = get_model("logistic_regression")
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        versions = list(
+            pool.map(
+                lambda _: ModelRegistry(str(tmp_path)).register(
+                    "logreg", model, ["a"], ""
+                )["version"],
+                range(8),
+            )
+        )
+    assert sorted(versions) == list(range(1, 9))
+    assert registry.versions("logreg") == list(range(1, 9))
+
+    monkeypatch.setattr(model_list, "registry", registry)
+    assert get_model("random_forest") is None
+    assert registry.versions("random_forest") == []
+
+
+def test_ml_endpoints_only_serve_client_role_models(tmp_path, monkeypatch):
+    """Test that intervention models with client features are not listed"""
+    from app.clients.service.columnar_preprocessing import CLIENT_COLUMNS
+    from app.ml import model_list
+    from app.ml.registry import CLIENT_ROLE
+
+    registry = ModelRegistry(str(tmp_path))
+    model = get_model("logistic_regression")
+    registry.register("logreg", model, CLIENT_COLUMNS, "", role=CLIENT_ROLE)
+    registry.register("surface", model, CLIENT_COLUMNS, "")
+    monkeypatch.setattr(model_list, "registry", registry)
+    assert model_list.list_available_models() == ["logreg"]
+    assert get_model("logreg") is registry.load("logreg")
+    assert get_model("surface") is None
+    assert registry.metadata("surface")["role"] == "intervention"
+
+
+def test_model_switch_publishes_generation_and_rolls_back(client):
+    """Test switching, the version header, rollback and cross-worker sync"""
+    before = model_state.active_model()
+    response = client.post("/ml/model/switch?model_name=random_forest")
+    assert response.status_code == 200
+    switched = response.json()
+    assert switched["current_model"] == "random_forest"
+    assert switched["generation"] > before.generation
+    assert response.headers["X-Model-Version"] == f"random_forest:{switched['version']}"
+    # A snapshot taken before the switch keeps serving its own model.
+    assert before.model is not model_state.active_model().model
+
+    response = client.post("/ml/predict", json={"features": [1.0] * 24})
+    assert response.json()["model"] == "random_forest"
+    assert response.headers["X-Model-Version"].startswith("random_forest:")
+
+    response = client.post("/ml/model/rollback")
+    assert response.status_code == 200
+    assert response.json()["current_model"] == before.name
+    assert response.json()["generation"] == switched["generation"] + 1
+
+    # Another worker publishes; this process adopts it on its next sync.
+    ModelStateFile(model_state.STATE_PATH).update(
+        lambda current: {"name": "neural_net", "version": None, "previous": current}
+    )
+    assert model_state.sync().primary.name == "neural_net"
+    assert client.get("/ml/model/current").json()["current_model"] == "neural_net"
+
+
+def test_model_switch_rejects_unknown_version(client):
+    response = client.post("/ml/model/switch?model_name=random_forest&version=99")
+    assert response.status_code == 400
+
+
+def test_canary_routing_and_shadow_scoring(client):
+    """Test canary percentages, shadow logging and keeping traffic on switch"""
+    from app.ml.traffic import (
+        read_shadow_log,
+        shadow_log_path,
+        shadow_scorer,
+        summarize_shadow_log,
+    )
+
+    primary = model_state.active_model()
+    features = {"features": [2.0] * 24}
+    try:
+        response = client.post(
+            "/ml/model/traffic",
+            json={"canary": {"name": "random_forest", "percent": 100}},
+        )
+        assert response.status_code == 200
+        assert response.json()["canary"]["percent"] == 100
+        served = client.post("/ml/predict", json=features)
+        assert served.headers["X-Model-Version"].startswith("random_forest:")
+
+        response = client.post(
+            "/ml/model/traffic",
+            json={
+                "canary": {"name": "random_forest", "percent": 0},
+                "shadow": {"name": "neural_net", "sample_rate": 1},
+            },
+        )
+        assert response.status_code == 200
+        served = client.post("/ml/predict", json=features)
+        assert served.headers["X-Model-Version"] == primary.label
+        shadow_scorer.drain(timeout=10)
+
+        current = model_state.deployment()
+        path = shadow_log_path(shadow_scorer.log_dir, primary, current.shadow)
+        records = read_shadow_log(path)
+        X = np.array([features["features"]])
+        assert records[-1]["shadow_score"] == np.float32(
+            current.shadow.model.predict_proba(X)[0, 1]
+        )
+        summary = summarize_shadow_log(records)
+        assert summary["count"] == len(records) >= 1
+        metrics = client.get("/ml/model/traffic").json()["shadow_metrics"]
+        assert metrics["pairs"][f"{primary.label}->{current.shadow.label}"]["count"]
+
+        # Switching the primary model keeps the canary and shadow
+        model_state.set_current_model(primary.name, primary.version)
+        assert model_state.deployment().shadow.name == "neural_net"
+    finally:
+        model_state.set_traffic()
+    assert model_state.deployment().canary is None
+
+
+def test_traffic_rejects_invalid_config(client):
+    response = client.post(
+        "/ml/model/traffic", json={"canary": {"name": "random_forest", "percent": 150}}
+    )
+    assert response.status_code == 422
+    response = client.post(
+        "/ml/model/traffic", json={"shadow": {"name": "missing", "sample_rate": 0.5}}
+    )
+    assert response.status_code == 400
+
+
+def test_ensemble_shares_matrix_and_reports_member_timings(tmp_path, monkeypatch):
+    """Test weighted blending, the artifact round trip and the ensemble engine"""
+    from app.clients.service import logic
+    from app.ml.ensemble import EnsembleMember, EnsembleModel
+    from app.ml.linear import LinearModel
+
+    rng = np.random.RandomState(0)
+    logistic = LinearModel(rng.randn(1, 31) * 0.1, np.zeros(1), np.array([0, 1]))
+    ensemble = EnsembleModel(
+        [
+            EnsembleMember("forest", logic.MODEL, 3),
+            EnsembleMember("logistic", logistic, 1, "proba", 100.0),
+        ]
+    )
+    save_model(ensemble, str(tmp_path / "ensemble"))
+    loaded = load_model(str(tmp_path / "ensemble"))
+
+    rows = rng.randint(0, 5, (10, 24))
+    matrix = logic.build_prediction_matrix(rows)
+    expected = 0.75 * logic.MODEL.predict(matrix)
+    expected += 0.25 * 100 * logistic.predict_proba(matrix)[:, 1]
+    for concurrent in (False, True):
+        loaded.concurrent = concurrent
+        combined, timings = loaded.evaluate(matrix)
+        assert np.allclose(combined, expected)
+        assert set(timings) == {"forest", "logistic"}
+
+    monkeypatch.setattr(logic, "_ensemble_model", loaded)
+    baselines, predictions = logic.score_batch(rows, "ensemble")
+    assert np.allclose(baselines, expected.reshape(10, 129)[:, 0])
+    assert logic.ensemble_timings()["logistic"]["weight"] == 0.25
+
+    with pytest.raises(ValueError):
+        EnsembleModel(
+            [EnsembleMember("client", get_model("logistic_regression"), 1)]
+            + [EnsembleMember("forest", logic.MODEL, 1)]
+        )
+
+
+def test_model_switch_rejects_intervention_models(client):
+    response = client.post("/ml/model/switch?model_name=intervention_ensemble")
+    assert response.status_code == 400
+    available = client.get("/ml/models").json()["available_models"]
+    assert "intervention_ensemble" not in available
+    assert "random_forest" in available
+    response = client.post(
+        "/ml/predict/intervention_ensemble", json={"features": [0.0] * 24}
+    )
+    assert response.json() == {"error": "Model not found"}
+
+
+def add_outcomes(test_db):
+    """Add 30 clients like client 1 of ages 20 to 49, with a success rate of 2 x age"""
+    from app.models import Client, ClientCase
+
+    template = test_db.get(Client, 1)
+    columns = [c.name for c in Client.__table__.columns if c.name != "id"]
+    for age in range(20, 50):
+        record = Client(**{name: getattr(template, name) for name in columns})
+        record.age = age
+        test_db.add(record)
+        test_db.flush()
+        test_db.add(
+            ClientCase(
+                client_id=record.id,
+                user_id=1,
+                employment_assistance=age % 2 == 0,
+                success_rate=age * 2,
+            )
+        )
+    test_db.commit()
+
+
+def test_training_streams_outcomes_into_registered_version(test_db, tmp_path):
+    """Test chunked loading of the Client x ClientCase join and registration"""
+    from app.clients.service.client_repository import SQLAlchemyClientRepository
+    from app.ml.training import load_training_matrix, train_from_database
+
+    add_outcomes(test_db)
+    repo = SQLAlchemyClientRepository(test_db)
+
+    matrix, stats = load_training_matrix(repo, chunk_size=7)
+    assert matrix.shape == (32, 32) and matrix.dtype == np.float32
+    assert stats["chunks"] == 5 and stats["rows"] == 32
+    assert matrix[0, 0] == 25 and matrix[0, -1] == 75 and matrix[-1, -1] == 98
+
+    registry = ModelRegistry(str(tmp_path))
+    first = train_from_database(
+        repo, "forest", chunk_size=7, n_jobs=1, registry=registry, n_estimators=5
+    )
+    second = train_from_database(
+        repo, "forest", chunk_size=32, n_jobs=2, registry=registry, n_estimators=5
+    )
+    assert (first["version"], second["version"]) == (1, 2)
+    assert first["training_data_hash"] == second["training_data_hash"]
+    assert first["metrics"] == second["metrics"]
+    assert first["training"]["holdout_rows"] == 6
+    assert first["training"]["peak_rss_mb"] > 0
+    assert registry.load("intervention_forest").n_features == 31
+
+    logistic = train_from_database(repo, "logistic", registry=registry)
+    assert "accuracy" in logistic["metrics"]
+    with pytest.raises(ValueError):
+        train_from_database(repo, "boosting", registry=registry)
+
+
+def test_online_ridge_updates_match_a_full_fit(tmp_path):
+    from sklearn.linear_model import Ridge
+
+    from app.ml.online import OnlineRidge
+
+    rng = np.random.RandomState(0)
+    X = rng.randint(0, 10, (200, 31)).astype(np.float64)
+    y = X @ rng.rand(31) + rng.randn(200)
+    model = OnlineRidge.empty(31, alpha=2.0)
+    for start in range(0, 200, 64):
+        previous = model
+        batch = slice(start, start + 64)
+        model = model.partial_fit(X[batch], y[batch])
+    assert previous.count == 192 and model.count == 200
+    reference = Ridge(alpha=2.0).fit(X, y)
+    assert np.allclose(model.coef, reference.coef_)
+    assert np.allclose(model.predict(X), reference.predict(X))
+
+    save_model(model, str(tmp_path / "online"))
+    assert np.allclose(
+        load_model(str(tmp_path / "online")).predict(X), model.predict(X)
+    )
+
+
+def test_recorded_outcomes_update_and_checkpoint_online_model(
+    client, test_db, admin_headers, tmp_path, monkeypatch
+):
+    """Test outcome recording, mini-batch updates and merged checkpoints"""
+    from functools import partial
+
+    from sqlalchemy.orm import sessionmaker
+
+    from app.clients.service import logic
+    from app.ml import online
+    from app.ml.online import OutcomeUpdater, load_outcomes
+
+    recorded = online.online_updater.stats()["recorded"]
+    response = client.put(
+        "/clients/1/services/1", json={"success_rate": 60}, headers=admin_headers
+    )
+    assert response.status_code == 200
+    assert online.online_updater.stats()["recorded"] == recorded + 1
+
+    registry = ModelRegistry(str(tmp_path))
+    load = partial(load_outcomes, session_factory=sessionmaker(test_db.get_bind()))
+    worker = OutcomeUpdater(
+        registry=registry, load=load, batch_size=1, checkpoint_outcomes=2
+    )
+    assert worker.model is None
+    monkeypatch.setattr(online, "online_updater", worker)
+    with pytest.raises(logic.ModelUnavailableError):
+        logic.score_batch([[1] * 24], "online")
+
+    worker.record(1, 1)
+    worker.record(2, 2)
+    assert worker.run_once() == 1 and worker.model.count == 1
+    assert not registry.versions(online.ONLINE_MODEL)
+    assert worker.run_once() == 1
+    assert registry.versions(online.ONLINE_MODEL) == [1]
+
+    # A second worker checkpoints its own outcomes on top of the first's.
+    other = OutcomeUpdater(registry=registry, load=load, batch_size=8)
+    assert other.model.count == 2
+    other.record(1, 1)
+    other.run_once()
+    worker.record(2, 2)
+    worker.run_once()
+    assert worker.checkpoint()["version"] == 2
+    assert other.checkpoint()["version"] == 3
+    assert registry.load(online.ONLINE_MODEL).count == other.model.count == 4
+    assert other.checkpoint() is None
+
+    baselines, predictions = logic.score_batch([[1] * 24], "online")
+    assert predictions.shape == (1, 128)
+
+
+def test_feature_histograms_measure_drift():
+    from app.ml.drift import FeatureHistograms, max_drift, population_stability_index
+
+    rng = np.random.RandomState(0)
+    reference = np.column_stack([rng.randint(0, 2, 5000), rng.normal(50, 10, 5000)])
+    histograms = FeatureHistograms.from_reference(reference)
+    assert [len(counts) for counts in histograms.counts] == [2, 10]
+
+    same, shifted = histograms.empty_like(), histograms.empty_like()
+    assert max_drift(histograms, same) is None
+    for start in range(0, 5000, 1000):
+        batch = np.column_stack([rng.randint(0, 2, 1000), rng.normal(50, 10, 1000)])
+        same.add(batch)
+        shifted.add(batch + [0, 10])
+    assert same.total == shifted.total == 5000
+    assert max_drift(histograms, same) < 0.01
+    scores = population_stability_index(histograms, shifted)
+    assert scores[0] < 0.01 and scores[1] > 0.25
+
+
+def test_histogram_edges_follow_a_skewed_feature():
+    """Test that edges are quantiles of the data, not of its distinct values"""
+    from app.ml.drift import FeatureHistograms, reference_edges
+
+    rng = np.random.RandomState(0)
+    column = rng.geometric(0.3, 10000).astype(np.float64)
+    column[:100] = np.nan
+    assert len(np.unique(column[~np.isnan(column)])) > 10
+    edges = reference_edges(column)
+    assert np.all(np.diff(edges) > 0)
+    assert edges[0] == 1 and edges[-1] < 10
+    histograms = FeatureHistograms.from_reference(column[100:, None])
+    assert max(histograms.proportions()[0]) < 0.35
+
+
+def test_retraining_runs_in_a_limited_process_and_publishes_if_better(
+    client, test_db, tmp_path
+):
+    from app.database import SQLALCHEMY_DATABASE_URL
+    from app.ml.retrain import RetrainScheduler
+    from tests.conftest import SQLALCHEMY_DATABASE_URL as TEST_DATABASE_URL
+
+    assert TEST_DATABASE_URL != SQLALCHEMY_DATABASE_URL
+    add_outcomes(test_db)
+    registry = ModelRegistry(str(tmp_path))
+    scheduler = RetrainScheduler(
+        min_outcomes=2,
+        drift_threshold=0,
+        cpus=[0],
+        database_url=TEST_DATABASE_URL,
+        registry=registry,
+        params={"n_estimators": 5},
+    )
+    scheduler.note_outcome()
+    assert scheduler.run_once() is None
+    scheduler.note_outcome()
+    assert scheduler.trigger() == "outcomes"
+
+    result = scheduler.run_once()
+    assert result["published"] and result["version"] == 1
+    assert result["baseline"]["model"].startswith("shipped:")
+    assert result["metrics"]["mae"] < result["baseline"]["metrics"]["mae"]
+    assert result["training"]["n_jobs"] == 1
+    assert scheduler.pending_outcomes == 0
+    assert registry.versions("intervention_forest") == [1]
+
+    # Not better by the required margin: nothing is published.
+    scheduler.min_improvement = 1000
+    result = scheduler.run("manual")
+    assert not result["published"] and result["version"] is None
+    assert result["baseline"]["model"] == "intervention_forest:1"
+    assert registry.versions("intervention_forest") == [1]
+
+    scheduler.max_memory_mb = 64
+    result = scheduler.run("manual")
+    assert not result["published"] and "error" in result
+    assert [run["reason"] for run in scheduler.status()["history"]] == [
+        "outcomes",
+        "manual",
+        "manual",
+    ]
+    assert client.get("/ml/retrain").json()["running"] is False
+
+
+def test_drift_trigger_needs_new_drift_after_a_run(tmp_path, monkeypatch):
+    """Test that drift already present at the last run does not re-trigger"""
+    from app.ml import retrain
+    from app.ml.retrain import RetrainScheduler
+
+    drift = [0.3]
+    scheduler = RetrainScheduler(
+        min_outcomes=1000,
+        drift_threshold=0.25,
+        drift=lambda: drift[0],
+        registry=ModelRegistry(str(tmp_path)),
+    )
+    report = {"published": False, "metrics": {}, "baseline": {}, "training": {}}
+    monkeypatch.setattr(retrain, "run_training_process", lambda *args: report)
+    assert scheduler.run_once()["reason"] == "drift"
+    assert scheduler.status()["run_drift"] == 0.3
+    assert scheduler.run_once() is None
+    drift[0] = 0.5
+    assert scheduler.trigger() is None
+    drift[0] = 0.6
+    assert scheduler.trigger() == "drift"
+
+
+def test_failed_runs_back_off_and_keep_the_drift_bar(tmp_path, monkeypatch):
+    """Test that failed runs pause the triggers and leave run_drift alone"""
+    from app.ml import retrain
+    from app.ml.retrain import RetrainScheduler
+
+    now = [0.0]
+    runs = []
+
+    def failing_run(*args):
+        runs.append(now[0])
+        raise TimeoutError("Training took longer than 1 s")
+
+    scheduler = RetrainScheduler(
+        min_outcomes=1,
+        drift_threshold=0.25,
+        backoff_seconds=100,
+        drift=lambda: 0.3,
+        registry=ModelRegistry(str(tmp_path)),
+        clock=lambda: now[0],
+    )
+    monkeypatch.setattr(retrain, "run_training_process", failing_run)
+    scheduler.note_outcome()
+    assert "error" in scheduler.run_once()
+    assert scheduler.pending_outcomes == 1 and scheduler.run_drift is None
+    now[0] = 99
+    assert scheduler.run_once() is None
+    now[0] = 100
+    assert scheduler.run_once()["reason"] == "outcomes"
+    # The second consecutive failure doubles the pause.
+    now[0] = 299
+    assert scheduler.run_once() is None and runs == [0, 100]
+    assert scheduler.status()["failures"] == 2
+
+    # A failed drift-triggered run does not raise the drift bar.
+    scheduler.min_outcomes = 1000
+    now[0] = 300
+    assert scheduler.run_once()["reason"] == "drift"
+    assert scheduler.run_drift is None
+    now[0] = 1000
+    assert scheduler.trigger() == "drift"
+
+
+def test_cross_validation_caches_folds_and_marks_frontier(tmp_path):
+    from app.ml.evaluation import (
+        build_folds,
+        cross_validate,
+        expand_grid,
+        load_csv_matrix,
+        load_folds,
+    )
+
+    matrix = load_csv_matrix()
+    path = build_folds(matrix, k=3, cache_dir=str(tmp_path))
+    X, y, folds = load_folds(path)
+    assert X.shape == (len(matrix), 31) and np.bincount(folds).min() >= 49
+    assert build_folds(matrix, k=3, cache_dir=str(tmp_path)) == path
+    assert build_folds(matrix, k=4, cache_dir=str(tmp_path)) != path
+
+    configs = expand_grid(["random_forest", "logistic_regression"], [5, 10], [2])
+    assert len(configs) == 3
+    results = cross_validate(path, configs, workers=2)
+    assert {r["label"] for r in results} == {
+        "random_forest(n_estimators=5,max_depth=2)",
+        "random_forest(n_estimators=10,max_depth=2)",
+        "logistic_regression()",
+    }
+    for result in results:
+        assert 0 <= result["accuracy"] <= 1
+        assert result["row_ms"] > 0 and result["artifact_kb"] > 0
+    assert any(result["frontier"] for result in results)
+    with pytest.raises(ValueError):
+        expand_grid(["boosting"])
+
+
+def test_drift_monitor_streams_inputs_in_fixed_memory():
+    from app.ml.drift import DriftMonitor, ReservoirSample, ks_statistic
+
+    rng = np.random.RandomState(0)
+    sample = ReservoirSample(1, size=500, seed=0)
+    for start in range(0, 20000, 1000):
+        sample.add(np.arange(start, start + 1000))
+    assert sample.seen == 20000 and sample.sample.shape == (500, 1)
+    assert abs(sample.quantiles([0.5])[0, 0] - 10000) < 1500
+    assert ks_statistic(np.arange(100.0), np.arange(100.0)) == 0
+    assert ks_statistic(np.arange(100.0), np.arange(50.0, 150.0)) == 0.5
+
+    reference = np.column_stack([rng.randint(0, 2, 2000), rng.normal(50, 10, 2000)])
+    monitor = DriftMonitor(
+        reference=lambda: reference,
+        encode=lambda records: np.array([r["x"] for r in records]),
+        columns=["flag", "score"],
+        batch_size=100,
+        max_pending=300,
+        sample_size=200,
+    )
+    report = monitor.report()
+    assert report["observed"] == 0 and report["features"]["score"]["psi"] is None
+
+    for _ in range(3):
+        shifted = np.column_stack([rng.randint(0, 2, 100), rng.normal(65, 10, 100)])
+        assert monitor.observe([{"x": row} for row in shifted])
+    assert not monitor.observe([{"x": [0, 0]}])
+    while monitor.run_once():
+        pass
+    report = monitor.report()
+    assert (report["observed"], report["sample_rows"], report["dropped"]) == (
+        300,
+        200,
+        1,
+    )
+    flag, score = report["features"]["flag"], report["features"]["score"]
+    assert flag["psi"] < 0.05 and flag["ks"] < 0.15
+    assert score["psi"] > 0.25 and score["ks"] > 0.4
+    assert score["current_quantiles"]["p50"] > score["reference_quantiles"]["p50"]
+    assert report["max_psi"] == score["psi"]
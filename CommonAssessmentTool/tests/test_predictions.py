@@ -0,0 +1,486 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+from fastapi import status
+
+from app.clients.service import logic
+from app.clients.service.columnar_preprocessing import encode_records
+from app.clients.service.logic import (
+    COLUMN_INTERVENTIONS,
+    clean_input_data,
+    create_matrix,
+    get_baseline_row,
+    interpret_and_calculate,
+    interpret_and_calculate_batch,
+    intervention_permutations,
+    process_results,
+    score_batch,
+)
+from app.clients.service.prediction_batcher import PredictionBatcher
+from app.clients.service.prediction_cache import PredictionCache, prediction_cache
+from app.clients.service.prediction_executor import (
+    PredictionExecutor,
+    PredictionQueueFull,
+)
+from app.clients.service.prediction_service import prediction_service
+from app.ml.model_state import get_current_model, set_current_model
+
+
+@pytest.fixture
+def prediction_input():
+    return {
+        "age": 23,
+        "gender": "1",
+        "work_experience": 1,
+        "canada_workex": 1,
+        "dep_num": 0,
+        "canada_born": "1",
+        "citizen_status": "2",
+        "level_of_schooling": "2",
+        "fluent_english": "3",
+        "reading_english_scale": 2,
+        "speaking_english_scale": 2,
+        "writing_english_scale": 3,
+        "numeracy_scale": 2,
+        "computer_scale": 3,
+        "transportation_bool": "2",
+        "caregiver_bool": "1",
+        "housing": "1",
+        "income_source": "5",
+        "felony_bool": "1",
+        "attending_school": "0",
+        "currently_employed": "1",
+        "substance_use": "1",
+        "time_unemployed": 1,
+        "need_mental_health_support_bool": "1",
+    }
+
+
+def test_predict(client, prediction_input):
+    """Test predicting a single client"""
+    response = client.post("/clients/predictions", json=prediction_input)
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert "baseline" in data
+    assert len(data["interventions"]) == 3
+
+
+def legacy_interpret_and_calculate(input_data):
+    """The original one-client path: per-row matrices and scikit-learn"""
+    model = logic.get_sklearn_model()
+    raw_data = clean_input_data(input_data)
+    intervention_rows = create_matrix(raw_data)
+    baseline_prediction = model.predict(get_baseline_row(raw_data).reshape(1, -1))
+    predictions = model.predict(intervention_rows).reshape(-1, 1)
+    result_matrix = np.concatenate((intervention_rows, predictions), axis=1)
+    result_matrix = result_matrix[result_matrix[:, -1].argsort()]
+    return process_results(baseline_prediction, result_matrix[-3:, -8:])
+
+
+def test_predict_batch_matches_single(client, prediction_input):
+    """Test that batch predictions match the original per-client path"""
+    other_input = dict(prediction_input, age=45, housing="9", time_unemployed=12)
+    response = client.post(
+        "/clients/predictions/batch", json=[prediction_input, other_input]
+    )
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert len(data) == 2
+    for result, payload in zip(data, [prediction_input, other_input]):
+        expected = legacy_interpret_and_calculate(payload)
+        assert result["baseline"] == pytest.approx(expected["baseline"])
+        assert [names for _, names in result["interventions"]] == [
+            names for _, names in expected["interventions"]
+        ]
+
+
+def test_predict_batch_empty(client):
+    """Test that an empty batch returns an empty list"""
+    response = client.post("/clients/predictions/batch", json=[])
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == []
+
+
+@pytest.mark.parametrize("engine", ["compiled", "partial"])
+def test_engine_matches_sklearn(prediction_input, engine):
+    """Test that each engine reproduces the scikit-learn model exactly"""
+    other_input = dict(prediction_input, age=45, housing="9", time_unemployed=12)
+    for payload in [prediction_input, other_input]:
+        expected = interpret_and_calculate(payload, engine="sklearn")
+        assert interpret_and_calculate(payload, engine=engine) == expected
+
+
+def test_unknown_engine(prediction_input):
+    """Test that an unknown prediction engine is rejected"""
+    with pytest.raises(ValueError):
+        interpret_and_calculate(prediction_input, engine="missing")
+
+
+def test_batcher_groups_concurrent_requests(prediction_input):
+    """Test that concurrent submissions share one batch and get their own result"""
+    inputs = [dict(prediction_input, age=20 + i) for i in range(5)]
+    batcher = PredictionBatcher(
+        interpret_and_calculate_batch, max_wait_ms=50, max_batch_size=10
+    )
+
+    async def submit_all():
+        return await asyncio.gather(*(batcher.submit(item) for item in inputs))
+
+    results = asyncio.run(submit_all())
+    assert results == [interpret_and_calculate(item) for item in inputs]
+    stats = batcher.stats()
+    assert stats["batches"] == 1
+    assert stats["batch_sizes"] == {5: 1}
+
+
+def test_batcher_isolates_failing_input(prediction_input):
+    """Test that one invalid input only fails its own caller"""
+    batcher = PredictionBatcher(
+        interpret_and_calculate_batch, max_wait_ms=50, max_batch_size=10
+    )
+    bad_input = dict(prediction_input, housing="not a number")
+
+    async def submit_all():
+        return await asyncio.gather(
+            batcher.submit(prediction_input),
+            batcher.submit(bad_input),
+            return_exceptions=True,
+        )
+
+    good, bad = asyncio.run(submit_all())
+    assert good == interpret_and_calculate(prediction_input)
+    assert isinstance(bad, Exception)
+
+
+def test_prediction_metrics(client, prediction_input):
+    """Test that prediction metrics report batcher activity"""
+    client.post("/clients/predictions", json=prediction_input)
+    response = client.get("/clients/predictions/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["batcher"]["requests"] >= 1
+
+
+def test_executor_rejects_when_full():
+    """Test that the executor sheds work once workers and queue are full"""
+    executor = PredictionExecutor(max_workers=1, max_queue=1, retry_after=3)
+    gate = threading.Event()
+
+    async def submit_all():
+        return await asyncio.gather(
+            executor.run(gate.wait, 5),
+            executor.run(gate.wait, 5),
+            executor.run(gate.wait, 5),
+            opener(),
+            return_exceptions=True,
+        )
+
+    async def opener():
+        await asyncio.sleep(0.05)
+        gate.set()
+
+    first, second, third, _ = asyncio.run(submit_all())
+    executor.shutdown()
+    assert first is True and second is True
+    assert isinstance(third, PredictionQueueFull)
+    assert third.retry_after == 3
+    stats = executor.stats()
+    assert stats["rejected"] == 1
+    assert stats["execution_ms"]["count"] == 2
+
+
+def test_predict_returns_503_when_saturated(client, prediction_input, monkeypatch):
+    """Test that a saturated executor answers 503 with Retry-After"""
+    monkeypatch.setattr(prediction_service.executor, "is_saturated", lambda: True)
+    for path, payload in [
+        ("/clients/predictions", prediction_input),
+        ("/clients/predictions/batch", [prediction_input]),
+    ]:
+        response = client.post(path, json=payload)
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response.headers["Retry-After"] == str(
+            prediction_service.executor.retry_after
+        )
+
+
+def test_cache_lru_and_ttl():
+    """Test that the cache evicts least recently used and expired entries"""
+    now = [0.0]
+    cache = PredictionCache(max_size=2, ttl_seconds=10, clock=lambda: now[0])
+    cache.put("a", {"value": 1})
+    cache.put("b", {"value": 2})
+    assert cache.get("a") == {"value": 1}
+    cache.put("c", {"value": 3})
+    assert cache.get("b") is None
+    now[0] = 11
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["evictions"], stats["expirations"]) == (1, 1, 1)
+
+
+def test_cache_serves_repeated_predictions(prediction_input):
+    """Test that repeated inputs hit the cache until the model is switched"""
+    prediction_cache.clear()
+    first = interpret_and_calculate(prediction_input)
+    hits = prediction_cache.stats()["hits"]
+    assert interpret_and_calculate(dict(prediction_input)) == first
+    assert prediction_cache.stats()["hits"] == hits + 1
+
+    set_current_model(get_current_model())
+    assert interpret_and_calculate(prediction_input) == first
+    stats = prediction_cache.stats()
+    assert stats["hits"] == hits + 1
+    assert stats["invalidations"] >= 1
+
+
+def test_engine_version_only_invalidates_that_engine():
+    """Test that online model updates keep other engines' entries cached"""
+    from app.ml.model_version import bump_model_version
+
+    cache = PredictionCache(max_size=8)
+    features = [1.0] * 24
+    cache.put(cache.make_key(features, "compiled", "shipped"), {"value": 1})
+    online_key = cache.make_key(features, "online", "intervention_online:1")
+    cache.put(online_key, {"value": 2})
+    assert cache.make_key(features, "online", "", True) != cache.make_key(
+        features, "online"
+    )
+
+    bump_model_version("online")
+    assert cache.make_key(features, "online", "intervention_online:1") != online_key
+    assert cache.get(cache.make_key(features, "compiled", "shipped")) == {"value": 1}
+    assert cache.stats()["invalidations"] == 0
+
+
+def test_cache_key_follows_published_trained_version(
+    prediction_input, tmp_path, monkeypatch
+):
+    """Test that a newly published trained version is served before the TTL"""
+    from app.ml import model_list
+    from app.ml.online import OnlineRidge
+    from app.ml.registry import ModelRegistry
+
+    registry = ModelRegistry(str(tmp_path))
+    monkeypatch.setattr(model_list, "registry", registry)
+    monkeypatch.setattr(logic, "_trained_model", None)
+    monkeypatch.setattr(logic, "TRAINED_MODEL_SYNC_SECONDS", 0)
+    model = OnlineRidge.empty(len(logic.FEATURE_SCHEMA))
+    registry.register(logic.TRAINED_MODEL, model, logic.FEATURE_SCHEMA, "")
+    prediction_cache.clear()
+    first = interpret_and_calculate_batch([prediction_input], "trained")[0]
+    assert first["baseline"] == 0
+
+    X = np.random.RandomState(0).rand(10, len(logic.FEATURE_SCHEMA))
+    model = model.partial_fit(X, np.full(10, 50.0))
+    registry.register(logic.TRAINED_MODEL, model, logic.FEATURE_SCHEMA, "")
+    second = interpret_and_calculate_batch([prediction_input], "trained")[0]
+    assert second["baseline"] > 10
+    assert logic.serving_model("trained") == f"{logic.TRAINED_MODEL}:2"
+
+
+def test_predict_rejects_unknown_label(client, prediction_input):
+    """Test that values which are neither labels nor numbers are rejected"""
+    payload = dict(prediction_input, housing="Grade 9")
+    response = client.post("/clients/predictions", json=payload)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert "housing" in response.json()["detail"]
+
+
+def test_encode_records_matches_clean_input_data(prediction_input):
+    """Test that columnar encoding matches the per-record cleaning"""
+    records = [
+        prediction_input,
+        dict(prediction_input, housing="Homeowner", level_of_schooling="Grade 9"),
+        dict(prediction_input, income_source="Employment", gender="yes"),
+    ]
+    matrix = encode_records(records)
+    assert matrix.dtype == np.float32 and matrix.flags.c_contiguous
+    assert matrix.tolist() == [clean_input_data(record) for record in records]
+
+
+def test_search_matches_exhaustive_sweep(client, prediction_input):
+    """Test that constrained search returns the best feasible combinations"""
+    payload = {
+        "client": prediction_input,
+        "k": 4,
+        "max_services": 2,
+        "costs": {COLUMN_INTERVENTIONS[0]: 5, COLUMN_INTERVENTIONS[1]: 1},
+        "budget": 4,
+        "excluded": [COLUMN_INTERVENTIONS[3]],
+    }
+    response = client.post("/clients/predictions/search", json=payload)
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+
+    baseline, predictions = score_batch(encode_records([prediction_input]))
+    perms = intervention_permutations(len(COLUMN_INTERVENTIONS))
+    feasible = (perms.sum(axis=1) <= 2) & (perms[:, 0] == 0) & (perms[:, 3] == 0)
+    expected = np.sort(predictions[0][feasible])[::-1][:4]
+    assert data["baseline"] == baseline[0]
+    assert [plan["score"] for plan in data["plans"]] == expected.tolist()
+
+
+def test_search_rejects_unknown_intervention(client, prediction_input):
+    payload = {"client": prediction_input, "required": ["Not a service"]}
+    response = client.post("/clients/predictions/search", json=payload)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_search_rejects_negative_costs(client, prediction_input):
+    """Test that negative costs, which break budget pruning, are rejected"""
+    from app.ml.intervention_search import ClientSurface, search_top_k
+
+    payload = {
+        "client": prediction_input,
+        "costs": {COLUMN_INTERVENTIONS[0]: -5},
+        "budget": 1,
+    }
+    response = client.post("/clients/predictions/search", json=payload)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    surface = ClientSurface.from_evaluator(
+        logic.get_partial_evaluator(),
+        encode_records([prediction_input])[0],
+        len(COLUMN_INTERVENTIONS),
+    )
+    with pytest.raises(ValueError):
+        search_top_k(surface, costs=[-5] + [0] * 6, budget=1)
+
+
+def test_prediction_surface(client, prediction_input):
+    """Test the opt-in surface against the sweep and brute-force effects"""
+    response = client.post("/clients/predictions?surface=true", json=prediction_input)
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    surface = np.array(data["surface"]["values"])
+    _, predictions = score_batch(encode_records([prediction_input]))
+    perms = intervention_permutations(len(COLUMN_INTERVENTIONS))
+    masks = perms @ (1 << np.arange(len(COLUMN_INTERVENTIONS)))
+    assert surface[masks].tolist() == predictions[0].tolist()
+    assert surface[0] == data["baseline"]
+
+    masks = np.arange(len(surface))
+    for i in range(len(COLUMN_INTERVENTIONS)):
+        off = masks[(masks >> i) & 1 == 0]
+        effect = (surface[off | 1 << i] - surface[off]).mean()
+        assert data["surface"]["marginal_effects"][i] == pytest.approx(effect)
+        for j in range(i + 1, len(COLUMN_INTERVENTIONS)):
+            off = masks[((masks >> i) & 1 == 0) & ((masks >> j) & 1 == 0)]
+            both = surface[off | 1 << i | 1 << j] - surface[off | 1 << i]
+            interaction = (both - surface[off | 1 << j] + surface[off]).mean()
+            expected = pytest.approx(interaction, abs=1e-9)
+            assert data["surface"]["interaction_effects"][i][j] == expected
+            assert data["surface"]["interaction_effects"][j][i] == expected
+
+    # The default response stays compact.
+    response = client.post("/clients/predictions", json=prediction_input)
+    assert "surface" not in response.json()
+
+
+def test_predictions_name_the_serving_model(client, prediction_input):
+    """Test that standard tier responses carry the X-Model-Version header"""
+    shipped = f"shipped:{logic.MODEL_VERSION}"
+    response = client.post("/clients/predictions", json=prediction_input)
+    assert response.headers["X-Model-Version"] == logic.serving_model() == shipped
+    response = client.post("/clients/predictions/batch", json=[prediction_input])
+    assert response.headers["X-Model-Version"] == shipped
+    response = client.post(
+        "/clients/predictions/search", json={"client": prediction_input}
+    )
+    assert response.headers["X-Model-Version"] == shipped
+
+
+def test_fast_tier_serves_distilled_student(client, prediction_input, monkeypatch):
+    """Test that tier=fast scores with the student and reports its fidelity"""
+    from app.clients.service import logic
+    from app.ml.distill import fidelity, sample_clients, train_student
+
+    rng = np.random.RandomState(0)
+    data = encode_records([prediction_input, dict(prediction_input, age=45)])
+    clients = sample_clients(np.vstack([data, rng.randint(0, 5, (50, 24))]), 200, rng)
+    surfaces = score_batch(clients, "compiled")[1]
+    student = train_student(clients, surfaces, n_trees=2, max_leaves=64)
+    report = fidelity(student.predict(clients), surfaces)
+    assert report["mae"] < np.abs(surfaces - surfaces.mean()).mean()
+    assert 0 <= report["top3_agreement"] <= 1
+
+    monkeypatch.setattr(logic, "_fast_model", student)
+    monkeypatch.setattr(logic, "_fast_version", 7)
+    response = client.post("/clients/predictions?tier=fast", json=prediction_input)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["X-Model-Version"] == f"{logic.FAST_MODEL}:7"
+    expected = student.predict(data[:1])[0]
+    assert response.json()["baseline"] == pytest.approx(expected[0])
+    response = client.post(
+        "/clients/predictions/batch?tier=fast&surface=true", json=[prediction_input]
+    )
+    assert sorted(response.json()[0]["surface"]["values"]) == pytest.approx(
+        sorted(expected)
+    )
+    assert response.headers["X-Model-Version"] == f"{logic.FAST_MODEL}:7"
+
+    monkeypatch.setattr(logic, "_fast_model", None)
+    monkeypatch.setattr(logic, "FAST_MODEL", "missing_fast_model")
+    response = client.post(
+        "/clients/predictions?tier=fast", json=dict(prediction_input, age=61)
+    )
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+def test_drift_endpoint_reports_served_inputs(client, prediction_input):
+    from app.ml.drift import drift_monitor
+
+    # Inputs served by earlier tests are still queued
+    while drift_monitor.run_once():
+        pass
+    before = drift_monitor.report()["observed"]
+    client.post("/clients/predictions", json=prediction_input)
+    client.post("/clients/predictions/batch", json=[prediction_input] * 2)
+    while drift_monitor.run_once():
+        pass
+
+    response = client.get("/ml/drift")
+    assert response.status_code == status.HTTP_200_OK
+    report = response.json()
+    assert report["observed"] == before + 3
+    assert len(report["features"]) == 24
+    age = report["features"]["age"]
+    assert age["psi"] >= 0 and 0 <= age["ks"] <= 1
+    assert age["current_quantiles"]["p50"] == 23
+
+
+def test_served_predictions_are_logged_in_segments(
+    client, prediction_input, tmp_path, monkeypatch
+):
+    from app.clients.service import prediction_service as service_module
+    from app.ml.prediction_log import (
+        PredictionLogger,
+        plan_names,
+        read_prediction_log,
+        summarize_prediction_log,
+    )
+
+    logger = PredictionLogger(str(tmp_path), segment_records=2, max_pending=3)
+    monkeypatch.setattr(service_module, "prediction_logger", logger)
+    single = client.post("/clients/predictions", json=prediction_input).json()
+    client.post("/clients/predictions/batch", json=[prediction_input] * 2)
+    client.post("/clients/predictions", json=prediction_input)
+    assert logger.stats()["dropped"] == 1 and not list(tmp_path.iterdir())
+
+    assert logger.flush() == 3
+    (day,) = [path.name for path in tmp_path.iterdir()]
+    assert len(list((tmp_path / day).glob("*.npy"))) == 2
+    records = read_prediction_log(day, str(tmp_path))
+    assert len(records) == 3 and np.all(np.diff(records["time"]) >= 0)
+    np.testing.assert_array_equal(
+        records["features"][0], encode_records([prediction_input])[0]
+    )
+    assert records["baseline"][0] == pytest.approx(single["baseline"])
+    best_score, best_plan = single["interventions"][-1]
+    assert records["top_scores"][0, -1] == pytest.approx(best_score)
+    assert plan_names(int(records["top_plans"][0, -1])) == best_plan
+
+    summary = summarize_prediction_log(records)
+    assert summary["count"] == 3 and summary["engines"] == {"compiled": 3}
+    assert list(summary["models"]) == [f"shipped:{logic.MODEL_VERSION}"]
+    assert summary["top_plans"][0] == {"interventions": best_plan, "count": 3}
@@ -0,0 +1,153 @@
+from datetime import timedelta
+
+import pytest
+from fastapi import status
+
+from app.clients.service.client_repository import SQLAlchemyClientRepository
+from app.clients.service.columnar_preprocessing import CLIENT_COLUMNS
+from app.clients.service.logic import interpret_and_calculate, serving_model
+from app.clients.service.recommendation_service import (
+    RecommendationRefreshJob,
+    RecommendationService,
+)
+from app.clients.service.rescore_queue import (
+    DirtyClientQueue,
+    RescoreWorker,
+    dirty_clients,
+)
+from app.models import Client, ClientRecommendation
+
+
+@pytest.fixture(autouse=True)
+def clean_dirty_clients():
+    dirty_clients.clear()
+    yield
+    dirty_clients.clear()
+
+
+def client_features(test_db, client_id):
+    client = test_db.get(Client, client_id)
+    return {column: getattr(client, column) for column in CLIENT_COLUMNS}
+
+
+def test_score_clients_upserts_all(test_db):
+    """Test that the batch job stores one row per client and can re-run"""
+    first = RecommendationService.score_clients(test_db, chunk_size=1)
+    second = RecommendationService.score_clients(test_db, chunk_size=1)
+    assert first["scored"] == second["scored"] == 2
+    rows = test_db.query(ClientRecommendation).order_by("client_id").all()
+    assert [row.client_id for row in rows] == [1, 2]
+    expected = interpret_and_calculate(client_features(test_db, 1))
+    assert rows[0].baseline == expected["baseline"]
+    assert rows[0].model_version == serving_model()
+    assert len(rows[0].interventions) == 3
+
+
+def test_get_recommendations_precomputed(client, test_db, admin_headers):
+    """Test that a fresh stored row is served as is"""
+    RecommendationService.score_clients(test_db)
+    response = client.get("/clients/1/recommendations", headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert data["source"] == "precomputed"
+    assert data["model_version"] == serving_model()
+
+
+def test_get_recommendations_stale_falls_back(client, test_db, admin_headers):
+    """Test that missing or stale rows are scored live and stored"""
+    response = client.get("/clients/2/recommendations", headers=admin_headers)
+    assert response.json()["source"] == "live"
+
+    row = test_db.get(ClientRecommendation, 2)
+    row.scored_at -= timedelta(days=30)
+    test_db.commit()
+    response = client.get("/clients/2/recommendations", headers=admin_headers)
+    data = response.json()
+    assert data["source"] == "live"
+    assert (
+        data["baseline"]
+        == interpret_and_calculate(client_features(test_db, 2))["baseline"]
+    )
+    response = client.get("/clients/2/recommendations", headers=admin_headers)
+    assert response.json()["source"] == "precomputed"
+
+
+def test_rows_of_another_engine_are_stale(test_db, monkeypatch):
+    """Test that rows are tagged with, and checked against, the serving model"""
+    from app.clients.service import logic
+
+    RecommendationService.score_clients(test_db)
+    row = test_db.get(ClientRecommendation, 1)
+    assert row.model_version.startswith("shipped:")
+    assert not RecommendationService.is_stale(row)
+    monkeypatch.setattr(logic, "DEFAULT_PREDICTION_ENGINE", "online")
+    assert RecommendationService.is_stale(row)
+
+
+def test_refresh_job_runs_in_one_process(test_db, tmp_path):
+    """Test that only the holder of the lock file refreshes"""
+    lock_path = str(tmp_path / "refresh.lock")
+    first = RecommendationRefreshJob(lambda: test_db, lock_path=lock_path)
+    second = RecommendationRefreshJob(lambda: test_db, lock_path=lock_path)
+    assert first.acquire() and first.acquire()
+    assert not second.acquire()
+    first.release()
+    assert second.acquire() and second.is_leader
+    second.release()
+
+
+def test_get_recommendations_not_found(client, admin_headers):
+    response = client.get("/clients/999/recommendations", headers=admin_headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_update_marks_client_dirty_only_on_feature_change(client, admin_headers):
+    """Test that only updates which change a model input enqueue the client"""
+    client.put("/clients/1", json={"age": 25}, headers=admin_headers)
+    assert not dirty_clients.is_dirty(1)
+    client.put("/clients/1", json={"age": 40}, headers=admin_headers)
+    assert dirty_clients.is_dirty(1)
+
+
+def test_feature_change_is_stale_for_every_worker(client, test_db, admin_headers):
+    """Test that the stale flag is persisted, not kept in one process"""
+    RecommendationService.score_clients(test_db)
+    client.put("/clients/1", json={"age": 40}, headers=admin_headers)
+    # Another worker, or this one after a restart, has an empty queue.
+    dirty_clients.clear()
+    test_db.expire_all()
+    assert RecommendationService.is_stale(test_db.get(ClientRecommendation, 1))
+    assert not RecommendationService.is_stale(test_db.get(ClientRecommendation, 2))
+    response = client.get("/clients/1/recommendations", headers=admin_headers)
+    assert response.json()["source"] == "live"
+
+    RecommendationService.score_clients(test_db)
+    client.put("/clients/2", json={"age": 45}, headers=admin_headers)
+    queue = DirtyClientQueue()
+    worker = RescoreWorker(
+        queue,
+        lambda ids: RecommendationService.score_clients(test_db, client_ids=ids),
+        lambda: SQLAlchemyClientRepository(test_db).get_stale_recommendation_ids(),
+    )
+    assert worker.queue_pending() == 1
+    assert queue.is_dirty(2) and not queue.is_dirty(1)
+    assert worker.run_once() == 1
+    test_db.expire_all()
+    assert not RecommendationService.is_stale(test_db.get(ClientRecommendation, 2))
+
+
+def test_rescore_worker_drains_dirty_clients(test_db):
+    """Test that the worker re-scores just the dirty clients in batches"""
+    queue = DirtyClientQueue()
+    worker = RescoreWorker(
+        queue,
+        lambda ids: RecommendationService.score_clients(test_db, client_ids=ids),
+        batch_size=1,
+    )
+    queue.mark_dirty(2)
+    queue.mark_dirty(2)
+    assert worker.run_once() == 1
+    assert worker.run_once() == 0
+    assert not queue.is_dirty(2)
+    stored = test_db.query(ClientRecommendation.client_id).all()
+    assert [client_id for (client_id,) in stored] == [2]